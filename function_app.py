@@ -1,13 +1,19 @@
-import azure.functions as func
-
-from vigia.routes.hazards import bp as hazards_bp
-from vigia.routes.auditor import bp as auditor_bp
-from vigia.routes.ledger_routes import bp as ledger_bp
-from vigia.routes.audit_api import bp as audit_bp
-
-app = func.FunctionApp(http_auth_level=func.AuthLevel.ANONYMOUS)
-
-app.register_functions(hazards_bp)
-app.register_functions(auditor_bp)
-app.register_functions(ledger_bp)
-app.register_functions(audit_bp)
\ No newline at end of file
+import azure.functions as func
+
+from vigia.routes.hazards import bp as hazards_bp
+from vigia.routes.auditor import bp as auditor_bp
+from vigia.routes.ledger_routes import bp as ledger_bp
+from vigia.routes.audit_api import bp as audit_bp
+from vigia.routes.metrics import bp as metrics_bp
+from vigia.routes.note_queue import bp as note_queue_bp
+from vigia.routes.reverify import bp as reverify_bp
+
+app = func.FunctionApp(http_auth_level=func.AuthLevel.ANONYMOUS)
+
+app.register_functions(hazards_bp)
+app.register_functions(auditor_bp)
+app.register_functions(ledger_bp)
+app.register_functions(audit_bp)
+app.register_functions(metrics_bp)
+app.register_functions(note_queue_bp)
+app.register_functions(reverify_bp)
\ No newline at end of file
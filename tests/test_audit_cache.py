@@ -0,0 +1,42 @@
+import io
+import json
+import time
+
+import pytest
+
+from vigia.infra.audit_cache import BlobAuditCacheTier
+
+
+class _Blob:
+    def __init__(self, blobs, name):
+        self.blobs, self.name = blobs, name
+
+    def download_blob(self):
+        from azure.core.exceptions import ResourceNotFoundError
+
+        if self.name not in self.blobs:
+            raise ResourceNotFoundError("missing")
+        return io.BytesIO(self.blobs[self.name])
+
+    def delete_blob(self):
+        from azure.core.exceptions import ResourceNotFoundError
+
+        if self.blobs.pop(self.name, None) is None:
+            raise ResourceNotFoundError("missing")
+
+
+class _Container:
+    def __init__(self):
+        self.blobs = {}
+
+    def get_blob_client(self, name):
+        return _Blob(self.blobs, name)
+
+
+def test_expired_blob_is_deleted_on_read():
+    pytest.importorskip("azure.core")
+    container = _Container()
+    container.blobs["E-1.json"] = json.dumps({"event_id": "E-1", "expires_at": time.time() - 1, "rows": [{}]}).encode()
+
+    assert BlobAuditCacheTier(container).get("E-1") is None
+    assert container.blobs == {}
\ No newline at end of file
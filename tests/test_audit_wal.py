@@ -0,0 +1,64 @@
+import sqlite3
+
+from vigia.infra.audit_wal import AuditWAL
+
+
+def _row(i):
+    return {"EventId": f"e{i}", "Status": "RECEIVED", "UpdatedAt": f"2026-01-01T00:00:{i:02d}.000000Z"}
+
+
+def test_rejected_row_is_isolated_and_dead_lettered(tmp_path, monkeypatch):
+    committed = []
+
+    def flush(rows):
+        if any(r["EventId"] == "e5" for r in rows):
+            raise ValueError("Kusto rejected the row")
+        committed.extend(r["EventId"] for r in rows)
+
+    wal = AuditWAL(str(tmp_path / "wal.db"), flush, 8, 1 << 20, 60, 60, max_attempts=2)
+    monkeypatch.setattr(wal, "start", lambda: None)
+    wal._owner = "test"
+    for i in range(8):
+        wal.append(_row(i))
+
+    for _ in range(20):
+        wal.flush_once()
+        if wal.backlog()[0] == 0:
+            break
+
+    assert sorted(committed) == [f"e{i}" for i in range(8) if i != 5]
+    dead = sqlite3.connect(wal.path).execute("SELECT event_id, attempts, error FROM audit_wal_dead").fetchall()
+    assert dead == [("e5", dead[0][1], "Kusto rejected the row")]
+    assert wal.pending("e5") == []
+
+
+def test_connection_errors_do_not_count_attempts(tmp_path, monkeypatch):
+    def flush(rows):
+        raise ConnectionError("kusto unreachable")
+
+    wal = AuditWAL(str(tmp_path / "wal.db"), flush, 8, 1 << 20, 60, 60, max_attempts=1)
+    monkeypatch.setattr(wal, "start", lambda: None)
+    wal._owner = "test"
+    wal.append(_row(1))
+    for _ in range(3):
+        wal.flush_once()
+
+    assert wal.backlog()[0] == 1
+    assert sqlite3.connect(wal.path).execute("SELECT attempts FROM audit_wal").fetchone()[0] == 0
+
+
+def test_log_without_attempts_column_is_migrated(tmp_path):
+    path = str(tmp_path / "wal.db")
+    c = sqlite3.connect(path)
+    c.execute(
+        "CREATE TABLE audit_wal (seq INTEGER PRIMARY KEY AUTOINCREMENT, event_id TEXT NOT NULL, status TEXT NOT NULL, "
+        "updated_at TEXT NOT NULL, row_json TEXT NOT NULL, bytes INTEGER NOT NULL, written_at REAL NOT NULL, "
+        "claimed_by TEXT, claimed_at REAL)"
+    )
+    c.commit()
+    c.close()
+
+    AuditWAL(path, lambda rows: None, 8, 1 << 20, 60, 60)
+
+    cols = {r[1] for r in sqlite3.connect(path).execute("PRAGMA table_info(audit_wal)")}
+    assert "attempts" in cols
\ No newline at end of file
@@ -0,0 +1,39 @@
+import json
+import random
+import threading
+
+import pytest
+
+from vigia.infra import admission
+from vigia.routes.auditor import autonomous_auditor
+from vigia.testing.bench import make_request, route_function
+from vigia.testing.fakes import FakeAgentsClient, install_fakes, synthetic_report, uninstall_fakes
+
+
+@pytest.fixture
+def env(monkeypatch):
+    monkeypatch.setenv("AUDITOR_ADMISSION", "enforce")
+    monkeypatch.setenv("AUDITOR_SINGLE_FLIGHT", "process")
+    admission._STATE.clear()
+    fakes = install_fakes(agents=FakeAgentsClient(run_latency="fixed:200"))
+    yield fakes
+    uninstall_fakes()
+    admission._STATE.clear()
+
+
+def test_concurrent_duplicates_share_the_leaders_response(env):
+    report = dict(synthetic_report(1, random.Random(1)), ConfidenceScore=0.95)
+    auditor = route_function(autonomous_auditor)
+    responses = [None, None]
+
+    def post(i):
+        responses[i] = auditor(make_request("POST", "autonomous-auditor", body=report))
+
+    threads = [threading.Thread(target=post, args=(i,)) for i in range(2)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert [r.status_code for r in responses] == [200, 200]
+    assert json.loads(responses[0].get_body()) == json.loads(responses[1].get_body())
\ No newline at end of file
@@ -0,0 +1,83 @@
+import json
+import time
+import threading
+
+from vigia.agents import batch
+
+
+def _run_concurrently(batcher, n):
+    results = {}
+
+    def run(i):
+        results[i] = batcher.submit({"event_id": f"e{i}"})
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(n)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results
+
+
+def test_one_batch_per_window_and_no_empty_flush(monkeypatch):
+    sizes = []
+
+    def agent(name, agent_id, content, parse, batch_size=None):
+        events = json.loads(content)["events"]
+        sizes.append(len(events))
+        time.sleep(0.1)
+        return {e["event_id"]: {"event_id": e["event_id"], "approve": True} for e in events}, "ok"
+
+    monkeypatch.setattr(batch, "_guarded_agent_request", agent)
+    monkeypatch.setattr(batch, "_verification_agent_gate", lambda a, p: (None, {"error": "unexpected_fallback"}))
+
+    results = _run_concurrently(batch._VerificationBatcher("agent", 8, 0.1), 4)
+
+    assert sizes == [4]
+    assert all(status == "ok" for _, status in results.values())
+
+
+def test_waiter_past_its_deadline_keeps_waiting_for_its_batch(monkeypatch):
+    fallbacks = []
+
+    def agent(name, agent_id, content, parse, batch_size=None):
+        events = json.loads(content)["events"]
+        time.sleep(0.3)
+        return {e["event_id"]: {"event_id": e["event_id"], "approve": True} for e in events}, "ok"
+
+    monkeypatch.setattr(batch, "_guarded_agent_request", agent)
+    monkeypatch.setattr(batch, "_verification_agent_gate", lambda a, p: fallbacks.append(p) or (None, "fallback"))
+    # deadlines (window + timeout + 5) pass while the 0.3 s flush is in flight
+    monkeypatch.setattr(batch, "_parse_int", lambda *a, **k: -4.9)
+
+    results = _run_concurrently(batch._VerificationBatcher("agent", 8, 0.05), 8)
+
+    assert fallbacks == []
+    assert all(status == "ok" for _, status in results.values())
+
+def test_batch_timeout_is_returned_without_per_event_runs(monkeypatch):
+    fallbacks = []
+    timeout = {"error": "agent_run_not_completed", "run_status": "timeout"}
+
+    monkeypatch.setattr(batch, "_guarded_agent_request", lambda *a, **k: (None, timeout))
+    monkeypatch.setattr(batch, "_verification_agent_gate", lambda a, p: fallbacks.append(p) or (None, "fallback"))
+
+    results = _run_concurrently(batch._VerificationBatcher("agent", 8, 0.05), 4)
+
+    assert fallbacks == []
+    assert all(r == (None, timeout) for r in results.values())
+
+
+def test_missing_verdict_falls_back_per_event(monkeypatch):
+    fallbacks = []
+
+    def agent(name, agent_id, content, parse, batch_size=None):
+        events = json.loads(content)["events"]
+        return {e["event_id"]: {"event_id": e["event_id"], "approve": True} for e in events[1:]}, "ok"
+
+    monkeypatch.setattr(batch, "_guarded_agent_request", agent)
+    monkeypatch.setattr(batch, "_verification_agent_gate", lambda a, p: fallbacks.append(p) or (None, "fallback"))
+
+    _run_concurrently(batch._VerificationBatcher("agent", 8, 0.05), 3)
+
+    assert len(fallbacks) == 1
\ No newline at end of file
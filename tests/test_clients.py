@@ -0,0 +1,52 @@
+import sys
+import types
+
+from vigia.infra import clients
+
+
+def _install_certificate_sdk(monkeypatch, pem):
+    calls = []
+
+    class ConfidentialLedgerCertificateClient:
+        def __init__(self, identity_url):
+            calls.append(("init", identity_url))
+
+        def get_ledger_identity(self, ledger_id):
+            calls.append(("identity", ledger_id))
+            return {"ledgerTlsCertificate": pem}
+
+    package = types.ModuleType("azure.confidentialledger")
+    certificate = types.ModuleType("azure.confidentialledger.certificate")
+    certificate.ConfidentialLedgerCertificateClient = ConfidentialLedgerCertificateClient
+    package.certificate = certificate
+    monkeypatch.setitem(sys.modules, "azure.confidentialledger", package)
+    monkeypatch.setitem(sys.modules, "azure.confidentialledger.certificate", certificate)
+    return calls
+
+
+def test_ledger_cert_fetch_runs_the_identity_call(monkeypatch):
+    monkeypatch.setenv("CONFIDENTIAL_LEDGER_ID", "test-ledger")
+    monkeypatch.delenv("CONFIDENTIAL_LEDGER_IDENTITY_URL", raising=False)
+    calls = _install_certificate_sdk(monkeypatch, "-----BEGIN CERTIFICATE-----\nabc\n-----END CERTIFICATE-----\n")
+    clients._REGISTRY.pop("ledger_tls_pem")
+    try:
+        pem = clients.get_ledger_service_cert_pem()
+    finally:
+        clients._REGISTRY.pop("ledger_tls_pem")
+
+    assert pem.startswith("-----BEGIN CERTIFICATE-----")
+    assert calls == [
+        ("init", "https://identity.confidential-ledger.core.azure.com"),
+        ("identity", "test-ledger"),
+    ]
+
+
+def test_ledger_cert_fetch_without_certificate_fails(monkeypatch):
+    monkeypatch.setenv("CONFIDENTIAL_LEDGER_ID", "test-ledger")
+    _install_certificate_sdk(monkeypatch, None)
+    try:
+        clients._fetch_ledger_service_cert_pem()
+    except RuntimeError as e:
+        assert "ledgerTlsCertificate" in str(e)
+    else:
+        raise AssertionError("expected RuntimeError")
\ No newline at end of file
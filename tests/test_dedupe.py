@@ -0,0 +1,23 @@
+from datetime import datetime, timedelta, timezone
+
+from vigia.infra import dedupe
+from vigia.testing.fakes import install_fakes, uninstall_fakes
+
+
+def test_precomputed_keys_fall_back_for_rows_without_them(monkeypatch):
+    ts = (datetime.now(timezone.utc) - timedelta(hours=1)).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+    report = {"ReportId": "R-1", "Timestamp": ts, "Latitude": 25.2041, "Longitude": 55.2712, "HazardType": "pothole"}
+    queries = []
+    env = install_fakes()
+    monkeypatch.setattr(dedupe, "_precomputed_keys", lambda *a: True)
+    real = dedupe._kusto_query
+    monkeypatch.setattr(dedupe, "_kusto_query", lambda q, *a, **k: queries.append(q) or real(q, *a, **k))
+    try:
+        # appended straight to RoadTelemetry: no LatB/LonB/TimeB
+        env.kusto.add_telemetry([dict(report, ReportId="R-0")])
+        out = dedupe._kql_dedupe_summary(report)
+    finally:
+        uninstall_fakes()
+
+    assert "iff(isnull(LatB), round(Latitude, 3), LatB)" in queries[0]
+    assert out["duplicate_count"] == 1
\ No newline at end of file
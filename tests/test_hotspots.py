@@ -0,0 +1,24 @@
+from vigia.infra.hotspots import HotspotAggregator, _DAY, _HOUR
+
+
+def test_local_window_counts_partial_first_day_from_daily_bucket():
+    now = 10 * _DAY + 12 * _HOUR
+    agg = HotspotAggregator(5)
+    # inside a 168h window, in its partial first day (older than the 48h of hourly buckets)
+    old = now - 168 * _HOUR + 6 * _HOUR
+    agg.record("pothole", 25.2, 55.27, old, 0.9, old)
+    agg.record("pothole", 25.2, 55.27, now - _HOUR, 0.9, now)
+    agg._prune(now)
+
+    top = agg.top("pothole", 168, 5, now)
+
+    assert [r["Count"] for r in top] == [2]
+
+
+def test_short_window_uses_hourly_buckets_only():
+    now = 10 * _DAY + 12 * _HOUR
+    agg = HotspotAggregator(5)
+    agg.record("pothole", 25.2, 55.27, now - 30 * _HOUR, 0.9, now)
+    agg.record("pothole", 25.2, 55.27, now - _HOUR, 0.9, now)
+
+    assert [r["Count"] for r in agg.top("pothole", 24, 5, now)] == [1]
\ No newline at end of file
@@ -0,0 +1,111 @@
+import io
+import json
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from vigia.infra import reverify
+from vigia.infra.clients import _REGISTRY
+from vigia.testing.fakes import FAKE_LEDGER_CERT_PEM, _fake_signature, install_fakes, uninstall_fakes
+
+
+def _ledger_row(event_id, tx_id, at, signature=None):
+    return {
+        "EventId": event_id,
+        "ReportId": f"R-{event_id}",
+        "Status": "LEDGER_WRITTEN",
+        "UpdatedAt": at,
+        "LedgerTxId": tx_id,
+        "Details": {},
+        "Receipt": {"receipt": {"txId": tx_id, "leaf": "leaf", "signature": signature or _fake_signature(tx_id, "leaf", FAKE_LEDGER_CERT_PEM)}},
+    }
+
+
+@pytest.fixture
+def env(monkeypatch, tmp_path):
+    monkeypatch.setenv("RECEIPT_REVERIFY_CHECKPOINT_STORE", "local")
+    monkeypatch.setenv("RECEIPT_REVERIFY_CHECKPOINT_DIR", str(tmp_path))
+    fakes = install_fakes()
+    yield fakes
+    uninstall_fakes()
+
+
+def test_event_anchored_twice_gets_an_outcome_per_receipt(env):
+    at = datetime.now(timezone.utc) - timedelta(minutes=5)
+    env.kusto.tables["AuditEvents"] = [
+        _ledger_row("E-1", "tx-1", at),
+        _ledger_row("E-1", "tx-2", at + timedelta(seconds=1), signature="bad"),
+        _ledger_row("E-2", "tx-3", at + timedelta(seconds=2)),
+    ]
+
+    out = reverify._reverify_receipts(job="dup", reset=True, executor="thread", workers=2)
+
+    assert (out["verified"], out["failed"]) == (2, 1)
+    results = {(r["Details"]["transactionId"], r["Status"]) for r in env.kusto.rows("AuditEvents") if r["Status"].startswith("RECEIPT")}
+    assert results == {("tx-1", "RECEIPT_REVERIFIED"), ("tx-2", "RECEIPT_REVERIFY_FAILED"), ("tx-3", "RECEIPT_REVERIFIED")}
+
+
+class _Blob:
+    def __init__(self, store, name):
+        self.store, self.name = store, name
+
+    def download_blob(self):
+        from azure.core.exceptions import ResourceNotFoundError
+
+        if self.name not in self.store:
+            raise ResourceNotFoundError("missing")
+        return io.BytesIO(self.store[self.name])
+
+    def upload_blob(self, data, overwrite=False):
+        self.store[self.name] = data
+
+
+class _Container:
+    def __init__(self):
+        self.blobs = {}
+
+    def get_blob_client(self, name):
+        return _Blob(self.blobs, name)
+
+
+def test_blob_checkpoint_is_shared_between_instances(env, monkeypatch):
+    pytest.importorskip("azure.core")
+    container = _Container()
+    key = f"reverify_checkpoint_container:{reverify.REVERIFY_CHECKPOINT_CONTAINER}"
+    _REGISTRY.put(key, container)
+    monkeypatch.setenv("RECEIPT_REVERIFY_CHECKPOINT_STORE", "blob")
+    at = datetime.now(timezone.utc) - timedelta(minutes=5)
+    env.kusto.tables["AuditEvents"] = [_ledger_row(f"E-{i}", f"tx-{i}", at + timedelta(seconds=i)) for i in range(4)]
+    try:
+        first = reverify._reverify_receipts(job="shared", reset=True, max_rows=2, executor="thread", workers=2)
+        saved = json.loads(container.blobs["shared.json"])
+        second = reverify._reverify_receipts(job="shared", executor="thread", workers=2)
+    finally:
+        _REGISTRY.pop(key)
+
+    assert first["verified"] == 2 and saved["cursor"][1] == "E-1"
+    assert second["verified"] == 2 and second["done"]
+
+def test_archived_receipts_are_reverified(env, monkeypatch):
+    monkeypatch.setenv("AUDIT_ARCHIVE_MODE", "on")
+    at = datetime.now(timezone.utc) - timedelta(days=60)
+    raw = _ledger_row("E-raw", "tx-raw", at + timedelta(seconds=5))
+    archived = _ledger_row("E-old", "tx-old", at)
+    kept = _ledger_row("E-both", "tx-both", at + timedelta(seconds=1))
+    env.kusto.tables["AuditEvents"] = [raw, kept]
+    env.kusto.tables["AuditEventsArchive"] = [
+        {
+            "EventId": r["EventId"],
+            "ReportId": r["ReportId"],
+            "LastAt": r["UpdatedAt"],
+            "Receipt": r["Receipt"],
+            "Timeline": [{"Status": "LEDGER_WRITTEN", "UpdatedAt": r["UpdatedAt"], "LedgerTxId": r["LedgerTxId"], "Details": {}}],
+        }
+        for r in (archived, kept)
+    ]
+
+    out = reverify._reverify_receipts(job="archived", reset=True, executor="thread", workers=2)
+
+    assert (out["verified"], out["failed"]) == (3, 0)
+    checked = sorted(r["Details"]["transactionId"] for r in env.kusto.rows("AuditEvents") if r["Status"] == "RECEIPT_REVERIFIED")
+    assert checked == ["tx-both", "tx-old", "tx-raw"]
\ No newline at end of file
@@ -0,0 +1,23 @@
+import pytest
+
+from vigia.infra import risk
+
+
+@pytest.mark.parametrize("raw", ["0.5,0.5", "a,b,c", "0.5,-1,0.5", "nan,0.2,0.2"])
+def test_malformed_risk_weights_fall_back_to_defaults(monkeypatch, raw):
+    monkeypatch.setenv("RISK_WEIGHTS", raw)
+    assert risk._risk_weights() == risk._DEFAULT_RISK_WEIGHTS
+
+
+def test_risk_weights_are_parsed(monkeypatch):
+    monkeypatch.setenv("RISK_WEIGHTS", "0.2, 0.3 ,0.5")
+    assert risk._risk_weights() == (0.2, 0.3, 0.5)
+
+
+def test_assess_survives_malformed_weights(monkeypatch):
+    monkeypatch.setenv("RISK_WEIGHTS", "1,2")
+    monkeypatch.setattr(risk, "_device_history", lambda device_id: {"accepted": 0, "rejected": 0, "loaded_at": 0})
+
+    out = risk._risk_assess({"DeviceId": "D-1"}, 0.8, {"duplicate_count": 0})
+
+    assert out["route"] in (risk.ROUTE_FAST_APPROVE, risk.ROUTE_AGENT_REVIEW, risk.ROUTE_FAST_REJECT)
\ No newline at end of file
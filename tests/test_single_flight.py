@@ -0,0 +1,58 @@
+import pytest
+
+from vigia.infra.single_flight import BlobLeaseStore
+
+
+class _Lease:
+    def __init__(self, lease_id):
+        self.id = lease_id
+
+    def renew(self):
+        pass
+
+
+class _Blob:
+    def __init__(self, blobs, name):
+        self.blobs, self.name = blobs, name
+
+    def upload_blob(self, data, overwrite=False):
+        from azure.core.exceptions import ResourceExistsError
+
+        if self.name in self.blobs and not overwrite:
+            raise ResourceExistsError("exists")
+        self.blobs[self.name] = None
+
+    def acquire_lease(self, lease_duration=-1, lease_id=None):
+        from azure.core.exceptions import HttpResponseError
+
+        if self.blobs.get(self.name) is not None:
+            e = HttpResponseError("LeaseAlreadyPresent")
+            e.status_code = 409
+            raise e
+        self.blobs[self.name] = lease_id
+        return _Lease(lease_id)
+
+    def delete_blob(self, lease=None):
+        assert lease is not None and self.blobs.get(self.name) == lease.id
+        del self.blobs[self.name]
+
+
+class _Container:
+    def __init__(self):
+        self.blobs = {}
+
+    def get_blob_client(self, name):
+        return _Blob(self.blobs, name)
+
+
+def test_release_deletes_the_lock_blob():
+    pytest.importorskip("azure.core")
+    container = _Container()
+    store = BlobLeaseStore(container)
+
+    assert store.acquire("E-1", "a", 30)
+    assert not store.acquire("E-1", "b", 30)
+    store.release("E-1", "a")
+
+    assert container.blobs == {}
+    assert store.acquire("E-1", "b", 30)
\ No newline at end of file
@@ -0,0 +1,185 @@
+import os
+import json
+import time
+import threading
+
+from ..core.config import _parse_int
+from ..core.telemetry import counter_add, histogram_record
+from .gate import _guarded_agent_request, _is_backend_failure, _verification_agent_gate
+
+
+# ---------- Batched verification gate ----------
+#
+# VERIFICATION_AGENT_BATCH_MODE=on collects concurrent gate requests for up to
+# VERIFICATION_AGENT_BATCH_WINDOW_MS (or VERIFICATION_AGENT_BATCH_MAX_SIZE requests)
+# and sends them as ONE verification_gate_request carrying an "events" array.
+# Entries missing from the reply, or malformed, fall back to a per-event run; a
+# backend failure (timeout, run error) is returned to every waiter as is.
+
+_BATCH_INSTRUCTION = (
+    "Return ONLY a valid JSON array with exactly one object per event, each with keys: "
+    "event_id(str, copied from the event), approve(bool), reasoning(str), quality_score(number 0..1). No extra text."
+)
+
+_FALLBACK = object()
+
+
+class _Slot:
+    __slots__ = ("payload", "taken", "done", "result")
+
+    def __init__(self, payload: dict):
+        self.payload = payload
+        self.taken = False  # in a leader's batch; its result comes from that flush
+        self.done = False
+        self.result = None
+
+
+def _parse_batch_verdicts(text: str, ctx: dict):
+    data = json.loads(text)
+    if isinstance(data, dict):
+        data = data.get("verdicts") or data.get("events") or data.get("results")
+    if not isinstance(data, list):
+        return None, {"error": "batch_reply_not_array", **ctx, "assistant_text": text[:5000]}
+
+    by_event = {}
+    for v in data:
+        if isinstance(v, dict) and v.get("event_id") and "approve" in v:
+            by_event[str(v["event_id"])] = v
+    return by_event, "ok"
+
+
+class _VerificationBatcher:
+    """
+    Leader/follower collector: the first pending waiter without an active leader
+    collects a batch (until full or the window closes), sends it, and resumes every
+    waiter with its own verdict. A waiter still pending after window + agent timeout
+    falls back to a per-event run; one whose batch is in flight waits for that flush
+    (bounded by the agent timeout).
+    """
+
+    def __init__(self, agent_id: str, max_size: int, window_s: float):
+        self.agent_id = agent_id
+        self.max_size = max(1, max_size)
+        self.window_s = max(0.0, window_s)
+        self._cond = threading.Condition()
+        self._pending = []
+        self._leader = False
+
+    def submit(self, request_payload: dict):
+        slot = _Slot(request_payload)
+        timeout_s = _parse_int(os.environ.get("VERIFICATION_AGENT_TIMEOUT_SECONDS", "25"), 25, 5, 180)
+        deadline = time.monotonic() + self.window_s + timeout_s + 5
+
+        with self._cond:
+            self._pending.append(slot)
+            self._cond.notify_all()  # may fill the current leader's batch
+            while not slot.done:
+                if slot.taken:
+                    self._cond.wait()
+                    continue
+                if not self._leader:
+                    self._leader = True
+                    self._cond.release()
+                    try:
+                        self._lead()
+                    finally:
+                        self._cond.acquire()
+                    continue
+                left = deadline - time.monotonic()
+                if left <= 0:
+                    if slot in self._pending:
+                        self._pending.remove(slot)
+                    slot.result = _FALLBACK
+                    break
+                self._cond.wait(left)
+
+        if slot.result is _FALLBACK or slot.result is None:
+            counter_add("vigia_agent_batch_fallback_total")
+            return _verification_agent_gate(self.agent_id, request_payload)
+        return slot.result
+
+    def _lead(self):
+        deadline = time.monotonic() + self.window_s
+        with self._cond:
+            while len(self._pending) < self.max_size:
+                left = deadline - time.monotonic()
+                if left <= 0:
+                    break
+                self._cond.wait(left)
+            batch = self._pending[: self.max_size]
+            del self._pending[: self.max_size]
+            for s in batch:
+                s.taken = True
+            self._leader = False
+            self._cond.notify_all()  # leftover waiters elect the next leader
+
+        if not batch:
+            return
+        try:
+            self._flush(batch)
+        finally:
+            with self._cond:
+                for s in batch:
+                    if s.result is None:
+                        s.result = _FALLBACK
+                    s.done = True
+                self._cond.notify_all()
+
+    def _flush(self, batch):
+        histogram_record("vigia_agent_batch_size", len(batch))
+        if len(batch) == 1:
+            batch[0].result = _FALLBACK  # nothing to amortize: plain per-event run
+            return
+
+        content = json.dumps(
+            {
+                "type": "verification_gate_request",
+                "instruction": _BATCH_INSTRUCTION,
+                "events": [s.payload for s in batch],
+            },
+            ensure_ascii=False,
+        )
+        verdicts, status = _guarded_agent_request(
+            "agents.verification_gate_batch", self.agent_id, content, _parse_batch_verdicts, batch_size=len(batch)
+        )
+
+        if verdicts is None:
+            shed = isinstance(status, dict) and status.get("error") in ("agent_circuit_open", "agent_bulkhead_full")
+            if shed or _is_backend_failure(status):
+                # the backend is down or shedding: N per-event runs would only pile on
+                for s in batch:
+                    s.result = (None, status)
+            return  # an unusable reply falls back per event
+
+        for s in batch:
+            v = verdicts.get(str((s.payload or {}).get("event_id") or ""))
+            if v is not None:
+                s.result = (v, "ok")
+        counter_add("vigia_agent_batch_verdicts_total", sum(1 for s in batch if s.result is not None))
+
+
+_BATCHERS = {}
+_BATCHERS_LOCK = threading.Lock()
+
+
+def _verification_agent_gate_batched(agent_id: str, request_payload: dict):
+    """
+    Same contract as _verification_agent_gate(); routes through the per-process
+    batcher when VERIFICATION_AGENT_BATCH_MODE=on.
+    """
+    mode = (os.environ.get("VERIFICATION_AGENT_BATCH_MODE") or "off").strip().lower()
+    if not agent_id or mode not in ("on", "true", "1"):
+        return _verification_agent_gate(agent_id, request_payload)
+
+    b = _BATCHERS.get(agent_id)
+    if b is None:
+        with _BATCHERS_LOCK:
+            b = _BATCHERS.get(agent_id)
+            if b is None:
+                b = _VerificationBatcher(
+                    agent_id,
+                    _parse_int(os.environ.get("VERIFICATION_AGENT_BATCH_MAX_SIZE", "8"), 8, 1, 64),
+                    _parse_int(os.environ.get("VERIFICATION_AGENT_BATCH_WINDOW_MS", "200"), 200, 0, 5000) / 1000.0,
+                )
+                _BATCHERS[agent_id] = b
+    return b.submit(request_payload)
\ No newline at end of file
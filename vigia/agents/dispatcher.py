@@ -0,0 +1,202 @@
+import os
+import json
+import time
+import logging
+import itertools
+import threading
+from collections import OrderedDict
+
+from ..core.config import _parse_int
+from ..core.jsonx import _json_fallback
+from ..core.telemetry import counter_add, gauge_set, histogram_record
+from ..infra.audit_store import _audit_append
+from ..infra.clients import get_note_spill_queue_client
+from .notes import _agent_note
+
+
+# ---------- Background dispatcher for non-gating agent notes ----------
+#
+# AGENT_NOTE_DISPATCH:
+#   background - enqueue and return; a worker runs the note and appends the
+#                *_AGENT_TRIGGERED audit row when dispatch finishes (default)
+#   sync       - run the note on the request path, as before
+#
+# AGENT_NOTE_OVERFLOW (what happens when the in-process queue is full):
+#   drop     - discard the new job
+#   coalesce - a new job replaces the queued job for the same event + note type
+#              (even below capacity); otherwise it is discarded
+#   spill    - send the job to the NOTE_SPILL_QUEUE storage queue, drained by
+#              the queue-triggered function in vigia/routes/note_queue.py
+
+NOTE_SPILL_QUEUE = "vigia-agent-notes"
+
+
+def _note_job(agent_id: str, payload: dict, note_type: str, event_id: str, report_id: str,
+              status: str, details: dict) -> dict:
+    """Plain-dict job so it can be queued in memory or spilled as JSON unchanged."""
+    return {
+        "agent_id": agent_id,
+        "payload": payload,
+        "note_type": note_type,
+        "audit": {"event_id": event_id, "report_id": report_id, "status": status, "details": details},
+    }
+
+
+def _run_note_job(job: dict):
+    """Trigger the note run and append the *_AGENT_TRIGGERED row. Returns the run reference or None."""
+    run = _agent_note(job["agent_id"], job["payload"], note_type=job["note_type"])
+    counter_add("vigia_agent_note_jobs_total", note_type=job["note_type"], outcome="triggered" if run else "failed")
+    if run:
+        audit = job["audit"]
+        details = dict(audit.get("details") or {})
+        _audit_append(
+            audit["event_id"],
+            audit.get("report_id") or "",
+            audit["status"],
+            {"payload": details.pop("payload", {}), **run, **details},
+        )
+    return run
+
+
+class NoteDispatcher:
+    """
+    Bounded queue + daemon worker threads. Workers start lazily on first submit
+    and are restarted in a forked child (threads do not survive fork).
+    """
+
+    def __init__(self, workers: int, max_queue: int, overflow: str):
+        self.workers = max(1, workers)
+        self.max_queue = max(1, max_queue)
+        self.overflow = overflow if overflow in ("drop", "coalesce", "spill") else "drop"
+        self._cond = threading.Condition()
+        self._queue = OrderedDict()  # key -> (job, enqueued_at)
+        self._seq = itertools.count(1)
+        self._busy = 0
+        self._threads = []
+        self._pid = None
+
+    def submit(self, job: dict) -> str:
+        """Returns queued | coalesced | spilled | dropped."""
+        note_type = job["note_type"]
+        key = (job["audit"]["event_id"], note_type) if self.overflow == "coalesce" else next(self._seq)
+
+        with self._cond:
+            self._ensure_workers()
+            if key in self._queue:
+                self._queue[key] = (job, self._queue[key][1])  # keep its place in line
+                counter_add("vigia_agent_note_coalesced_total", note_type=note_type)
+                return "coalesced"
+            if len(self._queue) < self.max_queue:
+                self._queue[key] = (job, time.monotonic())
+                self._publish()
+                self._cond.notify()
+                return "queued"
+
+        if self.overflow == "spill":
+            return "spilled" if self._spill(job) else "dropped"
+        counter_add("vigia_agent_note_dropped_total", note_type=note_type, reason="queue_full")
+        return "dropped"
+
+    def drain(self, timeout_s: float = 30.0) -> bool:
+        """Wait until the queue is empty and no worker is busy (tests, benchmarks, shutdown)."""
+        deadline = time.monotonic() + timeout_s
+        with self._cond:
+            while self._queue or self._busy:
+                left = deadline - time.monotonic()
+                if left <= 0:
+                    return False
+                self._cond.wait(min(left, 0.1))
+        return True
+
+    def depth(self) -> int:
+        with self._cond:
+            return len(self._queue)
+
+    def _ensure_workers(self):
+        # caller holds self._cond
+        pid = os.getpid()
+        if self._pid != pid:
+            self._pid = pid
+            self._threads = []
+            self._busy = 0
+        self._threads = [t for t in self._threads if t.is_alive()]
+        while len(self._threads) < self.workers:
+            t = threading.Thread(target=self._work, name=f"vigia-note-{len(self._threads)}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def _work(self):
+        while True:
+            with self._cond:
+                while not self._queue:
+                    self._cond.wait()
+                _, (job, enqueued_at) = self._queue.popitem(last=False)
+                self._busy += 1
+                self._publish()
+
+            histogram_record("vigia_agent_note_queue_wait_ms", (time.monotonic() - enqueued_at) * 1000.0)
+            try:
+                _run_note_job(job)
+            except Exception:
+                logging.warning("Background agent note failed", exc_info=True)
+                counter_add("vigia_agent_note_jobs_total", note_type=job["note_type"], outcome="failed")
+            finally:
+                with self._cond:
+                    self._busy -= 1
+                    self._publish()
+                    self._cond.notify_all()
+
+    def _spill(self, job: dict) -> bool:
+        try:
+            body = json.dumps(job, ensure_ascii=False, default=_json_fallback)
+            get_note_spill_queue_client(NOTE_SPILL_QUEUE).send_message(body)
+            counter_add("vigia_agent_note_spilled_total", note_type=job["note_type"])
+            return True
+        except Exception:
+            logging.warning("Agent note spill failed", exc_info=True)
+            counter_add("vigia_agent_note_dropped_total", note_type=job["note_type"], reason="spill_failed")
+            return False
+
+    def _publish(self):
+        gauge_set("vigia_agent_note_queue_depth", len(self._queue))
+        gauge_set("vigia_agent_note_workers_busy", self._busy)
+
+
+_DISPATCHER = None
+_DISPATCHER_LOCK = threading.Lock()
+
+
+def _note_dispatcher() -> NoteDispatcher:
+    global _DISPATCHER
+    if _DISPATCHER is None:
+        with _DISPATCHER_LOCK:
+            if _DISPATCHER is None:
+                _DISPATCHER = NoteDispatcher(
+                    _parse_int(os.environ.get("AGENT_NOTE_WORKERS", "4"), 4, 1, 64),
+                    _parse_int(os.environ.get("AGENT_NOTE_MAX_QUEUE", "256"), 256, 1, 100000),
+                    (os.environ.get("AGENT_NOTE_OVERFLOW") or "drop").strip().lower(),
+                )
+    return _DISPATCHER
+
+
+def _dispatch_agent_note(agent_id: str, payload: dict, note_type: str, event_id: str, report_id: str,
+                         status: str, details: dict):
+    """
+    Non-gating agent note. With AGENT_NOTE_DISPATCH=background (default) the
+    note is queued and the call returns immediately; the audit row `status`
+    (e.g. FORENSIC_AGENT_TRIGGERED) is appended by the worker once the run
+    has been created.
+    """
+    if not agent_id:
+        return None
+
+    job = _note_job(agent_id, payload, note_type, event_id, report_id, status, details)
+    mode = (os.environ.get("AGENT_NOTE_DISPATCH") or "background").strip().lower()
+    if mode == "sync":
+        return _run_note_job(job)
+    return _note_dispatcher().submit(job)
+
+
+def _drain_agent_notes(timeout_s: float = 30.0) -> bool:
+    """Block until queued notes are dispatched; no-op when nothing was ever queued."""
+    return _DISPATCHER.drain(timeout_s) if _DISPATCHER is not None else True
\ No newline at end of file
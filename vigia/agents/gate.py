@@ -4,21 +4,28 @@ import time
 import logging
 import traceback
 
-from ..infra.clients import _CLIENTS, _LOCK, get_auth_credential
+from ..infra.clients import _REGISTRY, _client_max_idle_s, _pooled_transport, get_auth_credential
 from ..core.config import _parse_int
+from ..core.telemetry import span
 
 from .message_extract import _as_list, _extract_assistant_text, _is_model_reply_role, _norm_role, _safe_repr
+from .resilience import _verification_guard
 from .runsteps import _run_steps_debug_dump
 
 
+# Gate outcomes that say the agent backend is unhealthy (vs. a bad/unparseable reply).
+_BACKEND_FAILURES = ("agent_run_not_completed", "agent_gate_exception")
+
+
 def get_agents_client():
     """
     Returns azure.ai.agents.AgentsClient bound to your AI Project endpoint.
     Uses the same endpoint envs you already use for get_project_client().
     """
-    if "agents_client" in _CLIENTS:
-        return _CLIENTS["agents_client"]
+    return _REGISTRY.get("agents_client", _build_agents_client, max_idle_s=_client_max_idle_s())
 
+
+def _build_agents_client():
     from azure.ai.agents import AgentsClient
 
     endpoint = (
@@ -29,11 +36,7 @@ def get_agents_client():
     if not endpoint:
         raise RuntimeError("Missing AI project endpoint. Set AI_PROJECT_ENDPOINT (recommended).")
 
-    client = AgentsClient(endpoint=endpoint, credential=get_auth_credential())
-
-    with _LOCK:
-        _CLIENTS["agents_client"] = client
-    return client
+    return AgentsClient(endpoint=endpoint, credential=get_auth_credential(), transport=_pooled_transport("agents"))
 
 
 # ---------------------------
@@ -49,6 +52,63 @@ def _verification_agent_gate(agent_id: str, request_payload: dict):
     if not agent_id:
         return None, "missing_agent_id"
 
+    content = json.dumps(
+        {
+            "type": "verification_gate_request",
+            "instruction": "Return ONLY valid JSON with keys: approve(bool), reasoning(str), quality_score(number 0..1). No extra text.",
+            "payload": request_payload,
+        },
+        ensure_ascii=False,
+    )
+    return _guarded_agent_request("agents.verification_gate", agent_id, content, _parse_single_verdict)
+
+
+def _parse_single_verdict(text: str, ctx: dict):
+    verdict = json.loads(text)
+    if "approve" not in verdict:
+        return None, {"error": "missing_approve_field", **ctx, "assistant_text": text[:5000]}
+    return verdict, "ok"
+
+
+def _guarded_agent_request(span_name: str, agent_id: str, content: str, parse, **attrs):
+    """
+    One blocking agent run through the verification bulkhead + circuit breaker.
+    `parse(text, ctx)` turns the assistant reply into (result, status).
+    """
+    bulkhead, breaker = _verification_guard()
+    if not breaker.allow():
+        return None, {"error": "agent_circuit_open", "retry_after_s": breaker.retry_after_s()}
+    if not bulkhead.acquire():
+        breaker.cancel()
+        return None, {"error": "agent_bulkhead_full", "retry_after_s": 1}
+
+    try:
+        with span(span_name, agent_id=agent_id, round_trips=0, **attrs) as sp:
+            result, status = _run_agent_request(agent_id, content, sp, parse)
+            sp.set_attribute("outcome", "ok" if result is not None else (status.get("error") if isinstance(status, dict) else status))
+    finally:
+        bulkhead.release()
+
+    if _is_backend_failure(status):
+        breaker.record_failure()
+    else:
+        breaker.record_success()
+    return result, status
+
+
+def _is_backend_failure(status) -> bool:
+    if not isinstance(status, dict) or status.get("error") not in _BACKEND_FAILURES:
+        return False
+    # an unparseable reply means the backend answered
+    return status.get("exc_type") != "JSONDecodeError"
+
+
+def _run_agent_request(agent_id: str, content: str, sp, parse):
+    """
+    thread -> user message -> run -> poll -> latest model reply -> parse(text, ctx).
+    Returns (result_or_None, status_string_or_error_dict).
+    """
+
     timeout_s = _parse_int(os.environ.get("VERIFICATION_AGENT_TIMEOUT_SECONDS", "25"), 25, 5, 180)
     poll_s = _parse_int(os.environ.get("VERIFICATION_AGENT_POLL_SECONDS", "1"), 1, 1, 10)
 
@@ -61,26 +121,19 @@ def _verification_agent_gate(agent_id: str, request_payload: dict):
 
         # Create thread
         thread = client.threads.create()
+        sp.incr("round_trips")
         thread_id = getattr(thread, "id", None) or (thread.get("id") if isinstance(thread, dict) else None)
         if not thread_id:
             raise RuntimeError("Thread creation returned no thread_id")
 
         # Send the request to the agent
-        client.messages.create(
-            thread_id=thread_id,
-            role="user",
-            content=json.dumps(
-                {
-                    "type": "verification_gate_request",
-                    "instruction": "Return ONLY valid JSON with keys: approve(bool), reasoning(str), quality_score(number 0..1). No extra text.",
-                    "payload": request_payload,
-                },
-                ensure_ascii=False,
-            ),
-        )
+        sp.set_attribute("request_bytes", len(content.encode("utf-8")))
+        client.messages.create(thread_id=thread_id, role="user", content=content)
+        sp.incr("round_trips")
 
         # Start run (manual polling is most compatible across SDK versions)
         run = client.runs.create(thread_id=thread_id, agent_id=agent_id)
+        sp.incr("round_trips")
         run_id = getattr(run, "id", None) or (run.get("id") if isinstance(run, dict) else None)
         if not run_id:
             raise RuntimeError("Run creation returned no run_id")
@@ -90,6 +143,8 @@ def _verification_agent_gate(agent_id: str, request_payload: dict):
 
         while time.time() < deadline:
             r = client.runs.get(thread_id=thread_id, run_id=run_id)
+            sp.incr("round_trips")
+            sp.incr("polls")
             run_status = getattr(r, "status", None) or (r.get("status") if isinstance(r, dict) else None)
 
             # capture last_error if present
@@ -120,6 +175,7 @@ def _verification_agent_gate(agent_id: str, request_payload: dict):
             msgs_obj = client.messages.list(thread_id=thread_id, limit=50)
 
         items = _as_list(msgs_obj)
+        sp.incr("round_trips")
 
         # Find first agent/assistant message in the returned order (usually newest-first)
 # Read messages, find latest model reply (assistant OR agent)
@@ -131,6 +187,7 @@ def _verification_agent_gate(agent_id: str, request_payload: dict):
             msgs = client.messages.list(thread_id=thread_id, limit=20, order="desc")
 
         items = _as_list(msgs, limit=50)
+        sp.incr("round_trips")
 
         assistant_msg = None
         roles_seen = []
@@ -155,6 +212,7 @@ def _verification_agent_gate(agent_id: str, request_payload: dict):
             }
 
         text = _extract_assistant_text(assistant_msg).strip()
+        sp.set_attribute("response_bytes", len(text.encode("utf-8")))
         if not text:
             steps_dump = _run_steps_debug_dump(client, thread_id, run_id)
             return None, {
@@ -165,17 +223,7 @@ def _verification_agent_gate(agent_id: str, request_payload: dict):
                 "run_steps": steps_dump,
             }
 
-        verdict = json.loads(text)
-        if "approve" not in verdict:
-            return None, {
-                "error": "missing_approve_field",
-                "thread_id": thread_id,
-                "run_id": run_id,
-                "status": run_status,
-                "assistant_text": text[:5000],
-            }
-
-        return verdict, "ok"
+        return parse(text, {"thread_id": thread_id, "run_id": run_id, "status": run_status})
 
     except Exception as e:
         return None, {
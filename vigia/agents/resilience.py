@@ -0,0 +1,171 @@
+import os
+import time
+import threading
+
+from ..core.config import _parse_int
+from ..core.telemetry import counter_add, gauge_set
+
+
+# ---------- Bulkhead + circuit breaker for blocking agent runs ----------
+
+class Bulkhead:
+    """
+    Bounded concurrency with a bounded wait queue.
+    acquire() returns False when the queue is full or the wait times out.
+    """
+
+    def __init__(self, name: str, max_concurrent: int, max_queue: int, wait_s: float):
+        self.name = name
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_queue = max(0, max_queue)
+        self.wait_s = max(0.0, wait_s)
+        self._cond = threading.Condition()
+        self._active = 0
+        self._waiting = 0
+
+    def acquire(self) -> bool:
+        with self._cond:
+            if self._active < self.max_concurrent:
+                self._active += 1
+                self._publish()
+                return True
+            if self._waiting >= self.max_queue:
+                counter_add("vigia_bulkhead_rejected_total", bulkhead=self.name, reason="queue_full")
+                return False
+
+            self._waiting += 1
+            self._publish()
+            deadline = time.monotonic() + self.wait_s
+            try:
+                while self._active >= self.max_concurrent:
+                    left = deadline - time.monotonic()
+                    if left <= 0:
+                        counter_add("vigia_bulkhead_rejected_total", bulkhead=self.name, reason="wait_timeout")
+                        return False
+                    self._cond.wait(left)
+                self._active += 1
+                return True
+            finally:
+                self._waiting -= 1
+                self._publish()
+
+    def release(self):
+        with self._cond:
+            self._active = max(0, self._active - 1)
+            self._publish()
+            self._cond.notify()
+
+    def _publish(self):
+        gauge_set("vigia_bulkhead_active", self._active, bulkhead=self.name)
+        gauge_set("vigia_bulkhead_waiting", self._waiting, bulkhead=self.name)
+
+
+class CircuitBreaker:
+    """
+    closed    -> calls flow; `failure_threshold` consecutive failures open the breaker
+    open      -> calls fail fast for `open_s` seconds
+    half_open -> up to `probes` concurrent probe calls; that many successes close it,
+                 any failure re-opens it
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, failure_threshold: int, open_s: float, probes: int):
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.open_s = max(0.0, open_s)
+        self.probes = max(1, probes)
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probes_in_flight = 0
+        self._probe_successes = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state
+
+    def retry_after_s(self) -> int:
+        with self._lock:
+            if self._state != self.OPEN:
+                return 1
+            return max(1, int(self._opened_at + self.open_s - time.monotonic() + 0.999))
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._state == self.OPEN:
+                if time.monotonic() - self._opened_at < self.open_s:
+                    return False
+                self._transition(self.HALF_OPEN)
+            if self._state == self.HALF_OPEN:
+                if self._probes_in_flight >= self.probes:
+                    return False
+                self._probes_in_flight += 1
+            return True
+
+    def cancel(self):
+        """Give back a probe slot taken by allow() when the call never ran."""
+        with self._lock:
+            if self._state == self.HALF_OPEN:
+                self._probes_in_flight = max(0, self._probes_in_flight - 1)
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            if self._state == self.HALF_OPEN:
+                self._probes_in_flight = max(0, self._probes_in_flight - 1)
+                self._probe_successes += 1
+                if self._probe_successes >= self.probes:
+                    self._transition(self.CLOSED)
+
+    def record_failure(self):
+        with self._lock:
+            if self._state == self.HALF_OPEN:
+                self._transition(self.OPEN)
+                return
+            self._failures += 1
+            if self._state == self.CLOSED and self._failures >= self.failure_threshold:
+                self._transition(self.OPEN)
+
+    def _transition(self, state: str):
+        # caller holds self._lock
+        self._state = state
+        self._probes_in_flight = 0
+        self._probe_successes = 0
+        if state == self.OPEN:
+            self._opened_at = time.monotonic()
+        if state == self.CLOSED:
+            self._failures = 0
+        counter_add("vigia_breaker_transitions_total", breaker=self.name, to=state)
+        gauge_set("vigia_breaker_open", 1 if state == self.OPEN else 0, breaker=self.name)
+
+
+_GUARDS = {}
+_GUARDS_LOCK = threading.Lock()
+
+
+def _verification_guard():
+    """Per-process (bulkhead, breaker) pair for the blocking verification agent."""
+    if "verification" in _GUARDS:
+        return _GUARDS["verification"]
+
+    with _GUARDS_LOCK:
+        if "verification" not in _GUARDS:
+            bulkhead = Bulkhead(
+                "verification_agent",
+                _parse_int(os.environ.get("VERIFICATION_AGENT_MAX_CONCURRENCY", "8"), 8, 1, 256),
+                _parse_int(os.environ.get("VERIFICATION_AGENT_MAX_QUEUE", "16"), 16, 0, 4096),
+                _parse_int(os.environ.get("VERIFICATION_AGENT_QUEUE_WAIT_SECONDS", "5"), 5, 0, 180),
+            )
+            breaker = CircuitBreaker(
+                "verification_agent",
+                _parse_int(os.environ.get("VERIFICATION_AGENT_BREAKER_FAILURES", "5"), 5, 1, 1000),
+                _parse_int(os.environ.get("VERIFICATION_AGENT_BREAKER_OPEN_SECONDS", "30"), 30, 1, 3600),
+                _parse_int(os.environ.get("VERIFICATION_AGENT_BREAKER_PROBES", "1"), 1, 1, 64),
+            )
+            _GUARDS["verification"] = (bulkhead, breaker)
+        return _GUARDS["verification"]
\ No newline at end of file
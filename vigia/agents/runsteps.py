@@ -1,3 +1,4 @@
+from ..core.telemetry import span
 from .message_extract import _as_list
 
 
@@ -42,7 +43,8 @@ def _run_steps_debug_dump(client, thread_id: str, run_id: str):
         if not hasattr(client.run_steps, "list"):
             return None
 
-        steps = _as_list(client.run_steps.list(thread_id=thread_id, run_id=run_id))
+        with span("agents.run_steps", round_trips=1):
+            steps = _as_list(client.run_steps.list(thread_id=thread_id, run_id=run_id))
         out = []
         for s in steps:
             # step may be dict-like
@@ -32,4 +32,7 @@ def get_kusto_db_name() -> str:
 
 
 def get_audit_table_name() -> str:
-    return os.environ.get("AUDIT_TABLE_NAME") or "AuditEvents"
\ No newline at end of file
+    return os.environ.get("AUDIT_TABLE_NAME") or "AuditEvents"
+
+def get_audit_archive_table_name() -> str:
+    return os.environ.get("AUDIT_ARCHIVE_TABLE_NAME") or "AuditEventsArchive"
\ No newline at end of file
@@ -31,9 +31,10 @@ def _json_default(o):
     return str(o)  # safe fallback (e.g., Decimal, etc.)
 
 
-def json_response(payload, status_code=200):
+def json_response(payload, status_code=200, headers=None):
     return func.HttpResponse(
         json.dumps(payload, ensure_ascii=False, default=_json_default),
         status_code=status_code,
+        headers=headers,
         mimetype="application/json",
     )
\ No newline at end of file
@@ -0,0 +1,108 @@
+import math
+import hashlib
+from datetime import timezone
+
+from .timeutil import _to_utc_datetime
+
+
+# ---------- Parse-once report ----------
+#
+# The auditor normalizes an incoming report once, at ingress: Timestamp (ISO or epoch ms)
+# becomes one UTC datetime, the camelCase ReportId/DeviceId fallbacks are resolved, and
+# coordinates / confidence are parsed. Everything derived from those values (dedupe keys,
+# evidence hash, audit columns, payload hash) is computed on first use and cached on the
+# report. Report is a read-only dict, so code that only reads payload.get(...) and
+# json.dumps(payload) keeps working unchanged.
+
+
+def _float_or_none(v):
+    try:
+        return float(v)
+    except (TypeError, ValueError):
+        return None
+
+
+def _read_only(self, *args, **kwargs):
+    raise TypeError("Report is read-only; copy it with dict(report)")
+
+
+class Report(dict):
+    """Normalized report payload with cached derived values."""
+
+    __slots__ = ("timestamp", "report_id", "device_id", "hazard_type", "hazard_key", "confidence", "_lat", "_lon", "_derived")
+
+    def __init__(self, raw: dict):
+        raw = raw or {}
+        confidence = raw.get("ConfidenceScore")
+        try:
+            self.confidence = float(confidence or 0.0)
+        except (TypeError, ValueError):
+            raise ValueError(f"ConfidenceScore must be a number, got {confidence!r}")
+
+        self.timestamp = _to_utc_datetime(raw.get("Timestamp"))
+        self.report_id = str(raw.get("ReportId") or raw.get("reportId") or "")
+        self.device_id = str(raw.get("DeviceId") or raw.get("deviceId") or "")
+        self.hazard_type = str(raw.get("HazardType") or "none")
+        self.hazard_key = self.hazard_type.strip().lower()
+        self._lat = _float_or_none(raw.get("Latitude"))
+        self._lon = _float_or_none(raw.get("Longitude"))
+        self._derived = {}
+        dict.__init__(
+            self, raw, Timestamp=self.timestamp.isoformat(), ReportId=self.report_id, DeviceId=self.device_id
+        )
+
+    __setitem__ = __delitem__ = __ior__ = update = pop = popitem = setdefault = clear = _read_only
+
+    def __reduce__(self):
+        return Report, (dict(self),)
+
+    @property
+    def latitude(self):
+        """Latitude as a float; None when missing, unparseable or NaN."""
+        return None if self._lat is None or math.isnan(self._lat) else self._lat
+
+    @property
+    def longitude(self):
+        return None if self._lon is None or math.isnan(self._lon) else self._lon
+
+    def cached(self, key, compute):
+        """compute() once per report; later calls return the stored value."""
+        try:
+            return self._derived[key]
+        except KeyError:
+            value = self._derived[key] = compute()
+            return value
+
+    def rounded(self, decimals: int):
+        """(lat, lon) rounded to `decimals`; None for a missing coordinate."""
+
+        def _round():
+            return (
+                None if self._lat is None else round(self._lat, decimals),
+                None if self._lon is None else round(self._lon, decimals),
+            )
+
+        return self.cached(("rounded", decimals), _round)
+
+    def time_bucket(self, bucket_min: int) -> str:
+        """ISO start of the report's DEDUP_TIME_BUCKET_MINUTES bucket."""
+
+        def _bucket():
+            dt = self.timestamp
+            minute = (dt.minute // bucket_min) * bucket_min
+            return dt.replace(minute=minute, second=0, microsecond=0).astimezone(timezone.utc).isoformat()
+
+        return self.cached(("time_bucket", bucket_min), _bucket)
+
+    @property
+    def evidence_hash(self) -> str:
+        def _hash():
+            evidence = (self.get("GaussianSplatURL") or "") + "|" + self.report_id
+            return hashlib.sha256(evidence.encode("utf-8")).hexdigest()
+
+        return self.cached("evidence_hash", _hash)
+
+
+def as_report(payload) -> Report:
+    """`payload` itself when it is already a Report, else a Report parsed from it."""
+    return payload if isinstance(payload, Report) else Report(payload)
\ No newline at end of file
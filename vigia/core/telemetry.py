@@ -0,0 +1,297 @@
+import os
+import json
+import time
+import uuid
+import logging
+import threading
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+
+
+# ---------- Spans / metrics (OpenTelemetry-style, offline first) ----------
+#
+# Exporters are selected with VIGIA_TELEMETRY_EXPORTER (comma separated):
+#   memory  - keep recent finished spans in a ring buffer (default, served by /metrics)
+#   console - log every finished span as one compact JSON line
+#   otel    - also emit real OpenTelemetry spans if the SDK is installed
+#   none    - only aggregate metrics
+
+_HIST_BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+
+_METRICS_LOCK = threading.Lock()
+_COUNTERS = {}    # (name, labels) -> float
+_GAUGES = {}      # (name, labels) -> float
+_HISTOGRAMS = {}  # (name, labels) -> {"buckets": [...], "count": n, "sum": x, "min": x, "max": x}
+
+_CURRENT_SPAN = contextvars.ContextVar("vigia_current_span", default=None)
+_REQUEST_TIMINGS = contextvars.ContextVar("vigia_request_timings", default=None)
+
+_EXPORT = {}  # resolved exporter config, lazily built
+
+
+def _exporter_config():
+    if _EXPORT:
+        return _EXPORT
+
+    raw = (os.environ.get("VIGIA_TELEMETRY_EXPORTER") or "memory").lower()
+    names = {x.strip() for x in raw.split(",") if x.strip()}
+    try:
+        size = int(os.environ.get("VIGIA_TELEMETRY_SPAN_BUFFER", "512"))
+    except Exception:
+        size = 512
+
+    tracer = None
+    if "otel" in names:
+        try:
+            from opentelemetry import trace
+            tracer = trace.get_tracer("vigia")
+        except Exception:
+            logging.warning("VIGIA_TELEMETRY_EXPORTER=otel but opentelemetry is not installed")
+
+    with _METRICS_LOCK:
+        if not _EXPORT:
+            _EXPORT.update({
+                "memory": "memory" in names,
+                "console": "console" in names,
+                "tracer": tracer,
+                "spans": deque(maxlen=max(16, size)),
+            })
+    return _EXPORT
+
+
+def _label_key(labels: dict):
+    return tuple(sorted((str(k), str(v)) for k, v in (labels or {}).items()))
+
+
+def counter_add(name: str, value: float = 1, **labels):
+    key = (name, _label_key(labels))
+    with _METRICS_LOCK:
+        _COUNTERS[key] = _COUNTERS.get(key, 0) + value
+
+
+def gauge_set(name: str, value: float, **labels):
+    key = (name, _label_key(labels))
+    with _METRICS_LOCK:
+        _GAUGES[key] = value
+
+
+def histogram_record(name: str, value: float, **labels):
+    key = (name, _label_key(labels))
+    with _METRICS_LOCK:
+        h = _HISTOGRAMS.get(key)
+        if h is None:
+            h = {"buckets": [0] * (len(_HIST_BUCKETS_MS) + 1), "count": 0, "sum": 0.0, "min": value, "max": value}
+            _HISTOGRAMS[key] = h
+        idx = len(_HIST_BUCKETS_MS)
+        for i, b in enumerate(_HIST_BUCKETS_MS):
+            if value <= b:
+                idx = i
+                break
+        h["buckets"][idx] += 1
+        h["count"] += 1
+        h["sum"] += value
+        h["min"] = min(h["min"], value)
+        h["max"] = max(h["max"], value)
+
+
+class Span:
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "attributes", "start", "end", "error", "_otel")
+
+    def __init__(self, name: str, parent, attributes: dict):
+        self.name = name
+        self.trace_id = parent.trace_id if parent else uuid.uuid4().hex
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent.span_id if parent else None
+        self.attributes = dict(attributes or {})
+        self.start = time.perf_counter()
+        self.end = None
+        self.error = None
+        self._otel = None
+
+    def set_attribute(self, key: str, value):
+        self.attributes[key] = value
+
+    def incr(self, key: str, n: int = 1):
+        self.attributes[key] = (self.attributes.get(key) or 0) + n
+
+    @property
+    def duration_ms(self) -> float:
+        end = self.end if self.end is not None else time.perf_counter()
+        return (end - self.start) * 1000.0
+
+    def as_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "duration_ms": round(self.duration_ms, 3),
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+
+def _finish_span(sp: Span):
+    ms = sp.duration_ms
+    labels = {"span": sp.name}
+    if sp.error:
+        labels["error"] = sp.error
+    histogram_record("vigia_span_duration_ms", ms, **labels)
+
+    rt = sp.attributes.get("round_trips")
+    if rt:
+        counter_add("vigia_round_trips_total", rt, span=sp.name)
+    for k in ("request_bytes", "response_bytes"):
+        if sp.attributes.get(k):
+            counter_add(f"vigia_{k}_total", sp.attributes[k], span=sp.name)
+
+    timings = _REQUEST_TIMINGS.get()
+    if timings is not None:
+        timings.record(sp.name, ms)
+
+    cfg = _exporter_config()
+    if cfg["memory"]:
+        cfg["spans"].append(sp.as_dict())
+    if cfg["console"]:
+        logging.info("span %s", json.dumps(sp.as_dict(), default=str))
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """
+    Time a block as a span. Nested spans share the trace id of the enclosing one.
+    Exceptions are recorded on the span and re-raised.
+    """
+    parent = _CURRENT_SPAN.get()
+    sp = Span(name, parent, attributes)
+    token = _CURRENT_SPAN.set(sp)
+
+    cfg = _exporter_config()
+    otel_cm = None
+    if cfg["tracer"] is not None:
+        try:
+            otel_cm = cfg["tracer"].start_as_current_span(name)
+            sp._otel = otel_cm.__enter__()
+        except Exception:
+            otel_cm = None
+
+    try:
+        yield sp
+    except BaseException as e:
+        sp.error = type(e).__name__
+        raise
+    finally:
+        sp.end = time.perf_counter()
+        _CURRENT_SPAN.reset(token)
+        if otel_cm is not None:
+            try:
+                for k, v in sp.attributes.items():
+                    sp._otel.set_attribute(k, v if isinstance(v, (str, int, float, bool)) else str(v))
+                otel_cm.__exit__(None, None, None)
+            except Exception:
+                pass
+        _finish_span(sp)
+
+
+# ---------- Per-request timing summary ----------
+
+class RequestTimings:
+    """
+    Collects span durations for one request/event.
+    summary() is small enough to embed in an audit row's Details.
+    """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.stages = {}
+        self._lock = threading.Lock()
+
+    def record(self, name: str, ms: float):
+        with self._lock:
+            n, total = self.stages.get(name, (0, 0.0))
+            self.stages[name] = (n + 1, total + ms)
+
+    def summary(self) -> dict:
+        with self._lock:
+            stages = {
+                k: (round(total, 1) if n == 1 else {"n": n, "ms": round(total, 1)})
+                for k, (n, total) in self.stages.items()
+            }
+        return {"total_ms": round((time.perf_counter() - self.start) * 1000.0, 1), "stages": stages}
+
+
+@contextmanager
+def request_timings():
+    t = RequestTimings()
+    token = _REQUEST_TIMINGS.set(t)
+    try:
+        yield t
+    finally:
+        _REQUEST_TIMINGS.reset(token)
+
+
+def current_timings_summary():
+    t = _REQUEST_TIMINGS.get()
+    return t.summary() if t is not None else None
+
+
+# ---------- Export ----------
+
+def recent_spans(limit: int = 100) -> list:
+    cfg = _exporter_config()
+    spans = list(cfg["spans"])
+    return spans[-limit:] if limit else spans
+
+
+def metrics_snapshot() -> dict:
+    with _METRICS_LOCK:
+        counters = [{"name": n, "labels": dict(lk), "value": v} for (n, lk), v in _COUNTERS.items()]
+        gauges = [{"name": n, "labels": dict(lk), "value": v} for (n, lk), v in _GAUGES.items()]
+        hists = [
+            {
+                "name": n,
+                "labels": dict(lk),
+                "count": h["count"],
+                "sum": round(h["sum"], 3),
+                "min": round(h["min"], 3),
+                "max": round(h["max"], 3),
+                "buckets": dict(zip([str(b) for b in _HIST_BUCKETS_MS] + ["+Inf"], h["buckets"])),
+            }
+            for (n, lk), h in _HISTOGRAMS.items()
+        ]
+    return {"counters": counters, "gauges": gauges, "histograms": hists}
+
+
+def _prom_labels(labels, extra=None) -> str:
+    items = list(labels) + list(extra or [])
+    if not items:
+        return ""
+    body = ",".join('{}="{}"'.format(k, str(v).replace("\\", "\\\\").replace('"', '\\"')) for k, v in items)
+    return "{" + body + "}"
+
+
+def render_prometheus() -> str:
+    lines = []
+    with _METRICS_LOCK:
+        for (n, lk), v in sorted(_COUNTERS.items()):
+            lines.append(f"{n}{_prom_labels(lk)} {v}")
+        for (n, lk), v in sorted(_GAUGES.items()):
+            lines.append(f"{n}{_prom_labels(lk)} {v}")
+        for (n, lk), h in sorted(_HISTOGRAMS.items()):
+            cum = 0
+            for b, c in zip(list(_HIST_BUCKETS_MS) + ["+Inf"], h["buckets"]):
+                cum += c
+                lines.append(f"{n}_bucket{_prom_labels(lk, [('le', b)])} {cum}")
+            lines.append(f"{n}_sum{_prom_labels(lk)} {round(h['sum'], 3)}")
+            lines.append(f"{n}_count{_prom_labels(lk)} {h['count']}")
+    return "\n".join(lines) + "\n"
+
+
+def reset_telemetry():
+    """Clear all aggregated metrics and buffered spans (local testing / benchmarks)."""
+    with _METRICS_LOCK:
+        _COUNTERS.clear()
+        _GAUGES.clear()
+        _HISTOGRAMS.clear()
+        _EXPORT.clear()
\ No newline at end of file
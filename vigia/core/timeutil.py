@@ -5,24 +5,23 @@ def _utc_now_iso():
     return datetime.now(timezone.utc).isoformat()
 
 
-def _to_iso_datetime(val):
+def _to_utc_datetime(val) -> datetime:
     """
     Accepts:
       - ISO-8601 string
       - epoch ms/int/float
       - missing -> now
-    Returns ISO-8601 string.
+    Returns an aware UTC datetime.
     """
     if val is None or val == "":
-        return _utc_now_iso()
+        return datetime.now(timezone.utc)
 
     # epoch millis
     if isinstance(val, (int, float)):
         try:
-            dt = datetime.fromtimestamp(float(val) / 1000.0, tz=timezone.utc)
-            return dt.isoformat()
+            return datetime.fromtimestamp(float(val) / 1000.0, tz=timezone.utc)
         except Exception:
-            return _utc_now_iso()
+            return datetime.now(timezone.utc)
 
     # string
     if isinstance(val, str):
@@ -30,20 +29,24 @@ def _to_iso_datetime(val):
         # epoch string?
         if s.isdigit():
             try:
-                dt = datetime.fromtimestamp(float(s) / 1000.0, tz=timezone.utc)
-                return dt.isoformat()
+                return datetime.fromtimestamp(float(s) / 1000.0, tz=timezone.utc)
             except Exception:
-                return _utc_now_iso()
+                return datetime.now(timezone.utc)
         # ISO-ish
         try:
             dt = datetime.fromisoformat(s.replace("Z", "+00:00"))
             if dt.tzinfo is None:
                 dt = dt.replace(tzinfo=timezone.utc)
-            return dt.astimezone(timezone.utc).isoformat()
+            return dt.astimezone(timezone.utc)
         except Exception:
-            return _utc_now_iso()
+            return datetime.now(timezone.utc)
+
+    return datetime.now(timezone.utc)
 
-    return _utc_now_iso()
+
+def _to_iso_datetime(val):
+    """Same inputs as _to_utc_datetime; returns the ISO-8601 string."""
+    return _to_utc_datetime(val).isoformat()
 
 
 def _round_float(x, d):
@@ -0,0 +1,138 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+
+from ..core.config import _parse_int
+from ..core.telemetry import counter_add, gauge_set
+
+
+# ---------- Admission control ahead of the auditor ----------
+#
+# AUDITOR_ADMISSION:
+#   off     - every request enters the pipeline (default)
+#   shadow  - decide and count, but admit everything
+#   enforce - shed requests answer 429 with Retry-After
+#
+# Checks run in this order. Only admitted requests spend tokens:
+#   device_rate     - per-DeviceId bucket: AUDITOR_DEVICE_RATE_PER_MIN, burst AUDITOR_DEVICE_BURST
+#   global_rate     - worker-wide bucket: AUDITOR_GLOBAL_RATE_PER_S, burst AUDITOR_GLOBAL_BURST
+#
+# Repeats of an EventId are not shed here: single-flight shares the leader's response
+# with concurrent duplicates, and the idempotency read answers finished events.
+#
+# The last AUDITOR_PRIORITY_RESERVE_PCT percent of the global bucket is kept for
+# AUDITOR_PRIORITY_HAZARDS. Under overload, normal reports are shed first and severe
+# hazards keep flowing. Device buckets apply to every report, so a flooding device
+# cannot use the reserve.
+
+_STATE = {}
+_STATE_LOCK = threading.Lock()
+_MAX_TRACKED = 50000
+
+
+def _admission_mode() -> str:
+    mode = (os.environ.get("AUDITOR_ADMISSION") or "off").strip().lower()
+    return mode if mode in ("off", "shadow", "enforce") else "off"
+
+
+class TokenBucket:
+    """`rate` tokens per second up to `burst`; take() spends one only when it can keep `floor` left."""
+
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate: float, burst: float, now: float):
+        self.rate = max(1e-9, rate)
+        self.burst = max(1.0, burst)
+        self.tokens = self.burst
+        self.updated = now
+
+    def _refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self, now: float, floor: float = 0.0):
+        """(True, 0.0) when a token was spent, else (False, seconds until one is available)."""
+        self._refill(now)
+        if self.tokens - 1.0 >= floor:
+            self.tokens -= 1.0
+            return True, 0.0
+        return False, (floor + 1.0 - self.tokens) / self.rate
+
+    def refund(self):
+        self.tokens = min(self.burst, self.tokens + 1.0)
+
+
+class AdmissionController:
+    """Per-device and worker-wide token buckets for one worker."""
+
+    def __init__(self, device_rate_per_min: int, device_burst: int, global_rate_per_s: int, global_burst: int,
+                 priority_hazards, priority_reserve_pct: int):
+        self.device_rate = device_rate_per_min / 60.0
+        self.device_burst = device_burst
+        self.priority_hazards = frozenset(priority_hazards)
+        self.reserve = global_burst * priority_reserve_pct / 100.0
+        self._lock = threading.Lock()
+        self._global = TokenBucket(global_rate_per_s, global_burst, time.monotonic())
+        self._devices = OrderedDict()  # device_id -> TokenBucket (LRU)
+
+    def admit(self, device_id: str, hazard_type: str):
+        """(admitted, reason, retry_after_s, priority); nothing is spent for a shed request."""
+        priority = str(hazard_type or "").strip().lower() in self.priority_hazards
+        now = time.monotonic()
+        with self._lock:
+            device = self._devices.get(device_id)
+            if device is None:
+                device = self._devices[device_id] = TokenBucket(self.device_rate, self.device_burst, now)
+                while len(self._devices) > _MAX_TRACKED:
+                    self._devices.popitem(last=False)
+            else:
+                self._devices.move_to_end(device_id)
+            ok, wait_s = device.take(now)
+            if not ok:
+                return False, "device_rate", wait_s, priority
+
+            ok, wait_s = self._global.take(now, floor=0.0 if priority else self.reserve)
+            if not ok:
+                device.refund()
+                return False, "global_rate", wait_s, priority
+
+            gauge_set("vigia_admission_tracked_devices", len(self._devices))
+            return True, "ok", 0.0, priority
+
+
+def _admission_controller() -> AdmissionController:
+    ctl = _STATE.get("controller")
+    if ctl is None:
+        with _STATE_LOCK:
+            if "controller" not in _STATE:
+                hazards = os.environ.get("AUDITOR_PRIORITY_HAZARDS") or "flooding,debris,accident"
+                _STATE["controller"] = AdmissionController(
+                    device_rate_per_min=_parse_int(os.environ.get("AUDITOR_DEVICE_RATE_PER_MIN", "30"), 30, 1, 60000),
+                    device_burst=_parse_int(os.environ.get("AUDITOR_DEVICE_BURST", "10"), 10, 1, 10000),
+                    global_rate_per_s=_parse_int(os.environ.get("AUDITOR_GLOBAL_RATE_PER_S", "50"), 50, 1, 100000),
+                    global_burst=_parse_int(os.environ.get("AUDITOR_GLOBAL_BURST", "100"), 100, 1, 100000),
+                    priority_hazards=[h.strip().lower() for h in hazards.split(",") if h.strip()],
+                    priority_reserve_pct=_parse_int(os.environ.get("AUDITOR_PRIORITY_RESERVE_PCT", "20"), 20, 0, 90),
+                )
+            ctl = _STATE["controller"]
+    return ctl
+
+
+def _admit_report(device_id: str, hazard_type: str):
+    """
+    None when the report may enter the pipeline, else (reason, retry_after_s) to
+    answer 429 with. Counts every decision in vigia_admission_total.
+    """
+    mode = _admission_mode()
+    if mode == "off":
+        return None
+    admitted, reason, retry_after_s, priority = _admission_controller().admit(device_id or "unknown", hazard_type)
+    if admitted:
+        decision = "admit"
+    else:
+        decision = "shed" if mode == "enforce" else "shadow_shed"
+    counter_add("vigia_admission_total", decision=decision, reason=reason, priority=str(priority).lower())
+    if admitted or mode != "enforce":
+        return None
+    return reason, retry_after_s
\ No newline at end of file
@@ -0,0 +1,251 @@
+"""
+Compaction of finished events from AuditEvents into AuditEventsArchive.
+
+    # how many events are due (nothing is written)
+    python -m vigia.infra.audit_archive --dry-run
+
+    # compact up to 50000 events, 2000 per .set-or-append
+    python -m vigia.infra.audit_archive --max-events 50000 --batch 2000
+"""
+import os
+import sys
+import json
+import time
+import argparse
+
+from ..core.config import _parse_int, get_audit_archive_table_name, get_audit_table_name, get_kusto_db_name
+from ..core.kql import _escape_kql_string
+from ..core.telemetry import counter_add
+from .kusto import _kusto_mgmt, _kusto_query, _rows_as_dicts
+
+
+# ---------- Audit compaction + tiered reads ----------
+#
+# AUDIT_ARCHIVE_MODE:
+#   off - AuditEvents only (default)
+#   on  - compaction runs, the raw table gets a retention policy and event reads
+#         merge both tiers
+#
+# An event is compacted when its last row is older than AUDIT_COMPACT_AFTER_DAYS
+# (default 7) and it has a terminal row. Events that never finished are compacted as they
+# are once older than AUDIT_COMPACT_STALE_DAYS (default retention - 2), so retention never
+# drops an event that has no archive row.
+#
+# An archive row holds the final status (terminal rows win, agent trigger rows never do),
+# the event columns, the ledger tx + receipt, the stored payload (once) and a Timeline of
+# {Status, UpdatedAt, Agent, RunId, LedgerTxId, VerificationReasoning, Details} per raw
+# row, with Details.payload moved into Payload. Compaction is one .set-or-append per
+# AUDIT_COMPACT_BATCH events, run inside Kusto. Only raw rows newer than the event's
+# archived LastAt are compacted, so re-running is safe, and rows appended after
+# compaction (RECEIPT_REVERIFIED, a late REWARDED) get their own archive row once they
+# are AUDIT_COMPACT_AFTER_DAYS old, before retention can drop them. Its final status is
+# taken over the earlier archive rows too.
+#
+# Raw rows are removed by retention (AUDIT_RAW_RETENTION_DAYS, default 45, at least
+# AUDIT_COMPACT_AFTER_DAYS + 3), applied by kusto_layout. Until then a row is in both
+# tiers. Reads expand every archive row of the event back into AuditEvents-shaped rows
+# (Details.compacted = true) and keep the raw row when both have the same
+# (Status, UpdatedAt).
+
+COMPACT_TERMINAL_STATUSES = ("REJECTED", "LEDGER_WRITTEN", "REWARDED")
+
+ARCHIVE_COLUMNS = (
+    ("EventId", "string"),
+    ("ReportId", "string"),
+    ("DeviceId", "string"),
+    ("Timestamp", "datetime"),
+    ("Latitude", "real"),
+    ("Longitude", "real"),
+    ("HazardType", "string"),
+    ("FinalStatus", "string"),
+    ("FinalReasoning", "string"),
+    ("FirstAt", "datetime"),
+    ("LastAt", "datetime"),
+    ("LedgerTxId", "string"),
+    ("Receipt", "dynamic"),
+    ("Payload", "dynamic"),
+    ("PayloadHash", "string"),
+    ("Timeline", "dynamic"),
+    ("RawRows", "long"),
+    ("CompactedAt", "datetime"),
+)
+
+# archive rows -> AuditEvents-shaped rows (one per Timeline entry)
+_ARCHIVE_EXPAND = """mv-expand T = Timeline
+        | project EventId, ReportId, DeviceId, Timestamp, Latitude, Longitude, HazardType,
+                  Status = tostring(T.Status), UpdatedAt = todatetime(T.UpdatedAt), Agent = tostring(T.Agent),
+                  RunId = tostring(T.RunId), LedgerTxId = tostring(T.LedgerTxId),
+                  Receipt = iff(tostring(T.Status) == 'LEDGER_WRITTEN', Receipt, dynamic({})),
+                  Details = bag_merge(
+                      iff(tobool(T.StoredPayload), bag_pack('payload', Payload), dynamic({})),
+                      iff(isnull(T.Details), dynamic({}), T.Details),
+                      dynamic({'compacted': true})),
+                  CreatedAt = todatetime(T.UpdatedAt), VerificationReasoning = tostring(T.VerificationReasoning)"""
+
+
+def _audit_archive_mode() -> str:
+    mode = (os.environ.get("AUDIT_ARCHIVE_MODE") or "off").strip().lower()
+    return mode if mode in ("off", "on") else "off"
+
+
+def _compact_after_days() -> int:
+    return _parse_int(os.environ.get("AUDIT_COMPACT_AFTER_DAYS", "7"), 7, 1, 3650)
+
+
+def _raw_retention_days() -> int:
+    # a compaction run may be missed; keep a margin over the compaction age
+    floor = _compact_after_days() + 3
+    return _parse_int(os.environ.get("AUDIT_RAW_RETENTION_DAYS", "45"), 45, floor, 36500)
+
+
+def _compact_stale_days() -> int:
+    retention = _raw_retention_days()
+    return _parse_int(os.environ.get("AUDIT_COMPACT_STALE_DAYS", str(retention - 2)), retention - 2, _compact_after_days(), retention - 1)
+
+
+def _kql_list(values) -> str:
+    return "dynamic([" + ", ".join(f"'{_escape_kql_string(v)}'" for v in values) + "])"
+
+
+def _audit_event_source(event_id: str) -> str:
+    """
+    KQL source of one event's rows in the AuditEvents schema (incl. VerificationReasoning
+    when AUDIT_ARCHIVE_MODE=on): the raw table, merged with the expanded archive row.
+    """
+    audit = get_audit_table_name()
+    eid = _escape_kql_string(event_id)
+    if _audit_archive_mode() == "off":
+        return f"{audit}\n        | where EventId == '{eid}'"
+    return f"""union
+        ({audit}
+         | where EventId == '{eid}'
+         | extend VerificationReasoning = column_ifexists('VerificationReasoning', tostring(Details.verification_reasoning)), Tier = 0),
+        ({get_audit_archive_table_name()}
+         | where EventId == '{eid}'
+         | {_ARCHIVE_EXPAND}
+         | extend Tier = 1)
+        | summarize arg_min(Tier, *) by Status, UpdatedAt
+        | project-away Tier"""
+
+
+def _due_events_kql(batch: int, terminal=COMPACT_TERMINAL_STATUSES) -> str:
+    """
+    `let` statements ending in `due`: up to `batch` EventIds with raw rows newer than
+    their archived LastAt (all rows when not archived yet), oldest first. Rows added to
+    an archived event only wait AUDIT_COMPACT_AFTER_DAYS.
+    """
+    return f"""let terminal = {_kql_list(terminal)};
+        let finished_after = {_compact_after_days()}d;
+        let stale_after = {_compact_stale_days()}d;
+        let archived = {get_audit_archive_table_name()}
+            | summarize ArchivedTo = max(LastAt) by EventId;
+        let due = {get_audit_table_name()}
+            | lookup kind=leftouter archived on EventId
+            | where isnull(ArchivedTo) or UpdatedAt > ArchivedTo
+            | summarize LastAt = max(UpdatedAt), Finished = countif(Status in (terminal)), Archived = countif(isnotnull(ArchivedTo)) by EventId
+            | where LastAt < ago(finished_after) and (Finished > 0 or Archived > 0 or LastAt < ago(stale_after))
+            | top {batch} by LastAt asc
+            | project EventId;"""
+
+
+def _compact_command(batch: int, terminal=COMPACT_TERMINAL_STATUSES) -> str:
+    # the final status of an event archived before is ranked against its earlier archive
+    # rows (Prior); those take no part in the Timeline or the other aggregates
+    archive = get_audit_archive_table_name()
+    return f""".set-or-append {archive} with (folder='vigia') <|
+        {_due_events_kql(batch, terminal)}
+        let prior = {archive}
+            | where EventId in (due);
+        {get_audit_table_name()}
+        | where EventId in (due)
+        | lookup kind=leftouter (prior | summarize ArchivedTo = max(LastAt) by EventId) on EventId
+        | where isnull(ArchivedTo) or UpdatedAt > ArchivedTo
+        | extend VerificationReasoning = column_ifexists('VerificationReasoning', tostring(Details.verification_reasoning)), Prior = false
+        | union (prior
+            | project EventId, ReportId, DeviceId, Timestamp, Latitude, Longitude, HazardType,
+                      Status = FinalStatus, UpdatedAt = LastAt, VerificationReasoning = FinalReasoning, Prior = true)
+        | extend Rank = iff(Status in (terminal), 2, iff(Status endswith '_AGENT_TRIGGERED', 0, 1))
+        | extend FinalKey = Rank * 100000000000000000 + tolong(UpdatedAt - datetime(1970-01-01)),
+                 FinalStatus = Status, FinalReasoning = VerificationReasoning
+        | summarize
+            arg_max(FinalKey, FinalStatus, FinalReasoning),
+            take_any(ReportId, DeviceId, Timestamp, Latitude, Longitude, HazardType),
+            FirstAt = minif(UpdatedAt, not(Prior)),
+            LastAt = maxif(UpdatedAt, not(Prior)),
+            LedgerTxId = take_anyif(LedgerTxId, isnotempty(LedgerTxId)),
+            Receipt = take_anyif(Receipt, Status == 'LEDGER_WRITTEN' and not(Prior)),
+            Payload = take_anyif(Details.payload, isnotnull(Details.payload)),
+            PayloadHash = take_anyif(tostring(Details.payload_hash), isnotempty(tostring(Details.payload_hash))),
+            Timeline = make_list_if(bag_pack(
+                'Status', Status, 'UpdatedAt', UpdatedAt, 'Agent', Agent, 'RunId', RunId,
+                'LedgerTxId', LedgerTxId, 'VerificationReasoning', VerificationReasoning,
+                'StoredPayload', isnotnull(Details.payload),
+                'Details', bag_remove_keys(Details, dynamic(['payload']))), not(Prior)),
+            RawRows = countif(not(Prior))
+            by EventId
+        | project {', '.join(c for c, _ in ARCHIVE_COLUMNS[:-1])}, CompactedAt = now()"""
+
+
+def _audit_compact(batch: int = None, max_events: int = None, time_budget_s: int = None, dry_run: bool = False,
+                   terminal=COMPACT_TERMINAL_STATUSES) -> dict:
+    """
+    Compact due events, `batch` per command, until none are left, `max_events` were
+    written or the time budget is spent. dry_run counts the due events instead.
+    """
+    if _audit_archive_mode() == "off":
+        raise ValueError("AUDIT_ARCHIVE_MODE is off")
+    batch = batch or _parse_int(os.environ.get("AUDIT_COMPACT_BATCH", "1000"), 1000, 1, 100000)
+    max_events = max_events or _parse_int(os.environ.get("AUDIT_COMPACT_MAX_EVENTS", "20000"), 20000, 1, 10000000)
+    time_budget_s = time_budget_s or 240
+    summary = {
+        "compacted": 0,
+        "batches": 0,
+        "after_days": _compact_after_days(),
+        "stale_days": _compact_stale_days(),
+        "done": False,
+    }
+
+    if dry_run:
+        q = f"{_due_events_kql(max_events, terminal)}\n        due | count"
+        rows = _rows_as_dicts(_kusto_query(q, "audit_compact_due", db=get_kusto_db_name()))
+        summary["due"] = int((rows[0] if rows else {}).get("Count") or 0)
+        return summary
+
+    deadline = time.monotonic() + time_budget_s
+    while summary["compacted"] < max_events and time.monotonic() < deadline:
+        n = min(batch, max_events - summary["compacted"])
+        table = _kusto_mgmt(_compact_command(n, terminal), "audit_compact", db=get_kusto_db_name())
+        written = sum(int(r.get("RowCount") or 0) for r in _rows_as_dicts(table)) if table is not None else 0
+        summary["compacted"] += written
+        summary["batches"] += 1
+        counter_add("vigia_audit_compacted_events_total", written)
+        if written < n:
+            summary["done"] = True
+            break
+    return summary
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="Compact finished audit events into the archive table")
+    ap.add_argument("--batch", type=int, default=None, help="events per .set-or-append (AUDIT_COMPACT_BATCH)")
+    ap.add_argument("--max-events", type=int, default=None, help="stop after this many (AUDIT_COMPACT_MAX_EVENTS)")
+    ap.add_argument("--time-budget-seconds", type=int, default=3600)
+    ap.add_argument("--dry-run", action="store_true", help="count the due events without writing")
+    args = ap.parse_args(argv)
+
+    try:
+        summary = _audit_compact(
+            batch=args.batch,
+            max_events=args.max_events,
+            time_budget_s=args.time_budget_seconds,
+            dry_run=args.dry_run,
+        )
+    except ValueError as e:
+        print(str(e), file=sys.stderr)
+        return 2
+    print(json.dumps(summary, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
\ No newline at end of file
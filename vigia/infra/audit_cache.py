@@ -0,0 +1,315 @@
+import os
+import json
+import time
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+from ..core.config import _parse_int
+from ..core.jsonx import _json_default
+from ..core.telemetry import counter_add, gauge_set
+from .clients import get_audit_cache_container_client
+
+
+# ---------- Audit read cache ----------
+#
+# AUDIT_READ_CACHE:
+#   local  - per-worker LRU of event timelines (default)
+#   shared - local + one JSON blob per finished event in AUDIT_CACHE_CONTAINER, so a
+#            read on another instance does not go to Kusto either
+#   off    - every read queries Kusto
+#
+# An entry holds the event's full timeline (rows as stored) plus its latest state and
+# explain document, both computed when the entry changes. _audit_append writes through.
+# A new transition is appended to a cached timeline, and the event's first row (RECEIVED)
+# starts a new entry. A read that misses loads the timeline from Kusto once. A load that
+# raced with a write for the same event is not stored.
+#
+# Other instances write transitions too, so entries expire:
+#   AUDIT_CACHE_TTL_SECONDS          - event still in flight (default 15)
+#   AUDIT_CACHE_TERMINAL_TTL_SECONDS - REJECTED / LEDGER_WRITTEN / REWARDED (default 300)
+# AUDIT_CACHE_MAX_EVENTS bounds the LRU (default 5000). Timelines longer than
+# AUDIT_CACHE_MAX_ROWS (default 200) are not cached.
+
+AUDIT_CACHE_CONTAINER = "vigia-audit-cache"
+
+_TERMINAL = ("REJECTED", "LEDGER_WRITTEN", "REWARDED")
+
+_STATE = {}
+_STATE_LOCK = threading.Lock()
+
+
+def _audit_cache_mode() -> str:
+    mode = (os.environ.get("AUDIT_READ_CACHE") or "local").strip().lower()
+    return mode if mode in ("off", "local", "shared") else "local"
+
+
+def _latest_index(rows: list):
+    """Index of the row _audit_get_latest(event_id) would return (no *_AGENT_TRIGGERED rows), or None."""
+    for i in range(len(rows) - 1, -1, -1):
+        if not str(rows[i].get("Status") or "").endswith("_AGENT_TRIGGERED"):
+            return i
+    return None
+
+
+def _explain_doc(event_id: str, rows: list) -> dict:
+    """Compact explanation for the copilot: latest state + one line per transition."""
+    if not rows:
+        return {"found": False, "event_id": event_id}
+    latest = rows[-1]
+    return {
+        "event_id": event_id,
+        "latest_status": latest.get("Status"),
+        "updated_at": str(latest.get("UpdatedAt")),
+        "verification_reasoning": latest.get("VerificationReasoning"),
+        "timeline": [
+            {
+                "status": r.get("Status"),
+                "updated_at": str(r.get("UpdatedAt")),
+                "agent": r.get("Agent"),
+                "reasoning": r.get("VerificationReasoning"),
+            }
+            for r in rows
+        ],
+    }
+
+
+class CachedEvent:
+    """One event's timeline with its derived read models. Never mutated; writes replace it."""
+
+    __slots__ = ("event_id", "rows", "latest_index", "explain", "expires_at")
+
+    def __init__(self, event_id: str, rows: list, expires_at: float):
+        self.event_id = event_id
+        self.rows = rows
+        self.latest_index = _latest_index(rows)
+        self.explain = _explain_doc(event_id, rows)
+        self.expires_at = expires_at
+
+    @property
+    def latest(self):
+        if self.latest_index is None:
+            return None
+        r = self.rows[self.latest_index]
+        return {k: r.get(k) for k in ("Status", "UpdatedAt", "Details", "VerificationReasoning")}
+
+    @property
+    def terminal(self) -> bool:
+        return any(r.get("Status") in _TERMINAL for r in self.rows)
+
+
+class AuditReadCache:
+    """Per-worker LRU of CachedEvent by EventId, with write sequence numbers to drop racing loads."""
+
+    def __init__(self, max_events: int, ttl_s: int, terminal_ttl_s: int, max_rows: int):
+        self.max_events = max_events
+        self.ttl_s = ttl_s
+        self.terminal_ttl_s = terminal_ttl_s
+        self.max_rows = max_rows
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # event_id -> CachedEvent
+        self._writes = OrderedDict()  # event_id -> seq of its last write
+        self._seq = 0
+
+    def _build(self, event_id: str, rows: list) -> CachedEvent:
+        entry = CachedEvent(event_id, rows, 0.0)
+        entry.expires_at = time.monotonic() + (self.terminal_ttl_s if entry.terminal else self.ttl_s)
+        return entry
+
+    def _store(self, entry: CachedEvent):
+        # caller holds self._lock
+        self._entries[entry.event_id] = entry
+        self._entries.move_to_end(entry.event_id)
+        while len(self._entries) > self.max_events:
+            self._entries.popitem(last=False)
+        gauge_set("vigia_audit_cache_events", len(self._entries))
+
+    def get(self, event_id: str):
+        with self._lock:
+            entry = self._entries.get(event_id)
+            if entry is None:
+                return None
+            if time.monotonic() >= entry.expires_at:
+                del self._entries[event_id]
+                return None
+            self._entries.move_to_end(event_id)
+            return entry
+
+    def seq(self) -> int:
+        with self._lock:
+            return self._seq
+
+    def fill(self, event_id: str, rows: list, loaded_after_seq: int):
+        """Cache a timeline read from a slower tier, unless the event was written since the read began."""
+        if not rows or len(rows) > self.max_rows:
+            return None
+        entry = self._build(event_id, rows)
+        with self._lock:
+            if self._writes.get(event_id, -1) > loaded_after_seq:
+                counter_add("vigia_audit_cache_writes_total", op="fill_raced")
+                return None
+            self._store(entry)
+        counter_add("vigia_audit_cache_writes_total", op="fill")
+        return entry
+
+    def record(self, row: dict):
+        """Write-through for one appended row; returns the updated entry, or None when not cached."""
+        event_id = row.get("EventId")
+        with self._lock:
+            self._seq += 1
+            self._writes[event_id] = self._seq
+            self._writes.move_to_end(event_id)
+            while len(self._writes) > self.max_events:
+                self._writes.popitem(last=False)
+
+            current = self._entries.get(event_id)
+            if current is not None and time.monotonic() < current.expires_at:
+                rows = current.rows + [row]
+                op = "append"
+            elif row.get("Status") == "RECEIVED":
+                rows = [row]
+                op = "create"
+            else:
+                self._entries.pop(event_id, None)
+                counter_add("vigia_audit_cache_writes_total", op="invalidate")
+                return None
+            if len(rows) > self.max_rows:
+                self._entries.pop(event_id, None)
+                counter_add("vigia_audit_cache_writes_total", op="invalidate")
+                return None
+            entry = self._build(event_id, rows)
+            self._store(entry)
+        counter_add("vigia_audit_cache_writes_total", op=op)
+        return entry
+
+    def invalidate(self, event_id: str):
+        with self._lock:
+            self._entries.pop(event_id, None)
+
+
+class BlobAuditCacheTier:
+    """
+    Shared tier: <EventId>.json with the timeline and its expiry (epoch seconds).
+    An expired blob is deleted by the read that finds it; blobs nobody reads again
+    are left to the container's lifecycle rule (see README).
+    """
+
+    def __init__(self, container_client):
+        self.container = container_client
+
+    def get(self, event_id: str):
+        from azure.core.exceptions import ResourceNotFoundError
+
+        try:
+            raw = self.container.get_blob_client(f"{event_id}.json").download_blob().readall()
+        except ResourceNotFoundError:
+            return None
+        doc = json.loads(raw)
+        if float(doc.get("expires_at") or 0) <= time.time():
+            self.delete(event_id)  # blobs are never read again after expiry otherwise
+            return None
+        return doc.get("rows") or None
+
+    def put(self, entry: CachedEvent):
+        ttl_s = max(0.0, entry.expires_at - time.monotonic())
+        doc = {"event_id": entry.event_id, "expires_at": time.time() + ttl_s, "rows": entry.rows}
+        body = json.dumps(doc, ensure_ascii=False, default=_json_default).encode("utf-8")
+        self.container.get_blob_client(f"{entry.event_id}.json").upload_blob(body, overwrite=True)
+
+    def delete(self, event_id: str):
+        from azure.core.exceptions import ResourceNotFoundError
+
+        try:
+            self.container.get_blob_client(f"{event_id}.json").delete_blob()
+        except ResourceNotFoundError:
+            pass
+
+
+def _audit_cache():
+    """The worker's AuditReadCache, or None when AUDIT_READ_CACHE=off."""
+    if _audit_cache_mode() == "off":
+        return None
+    cache = _STATE.get("local")
+    if cache is None:
+        with _STATE_LOCK:
+            cache = _STATE.setdefault(
+                "local",
+                AuditReadCache(
+                    max_events=_parse_int(os.environ.get("AUDIT_CACHE_MAX_EVENTS", "5000"), 5000, 1, 1000000),
+                    ttl_s=_parse_int(os.environ.get("AUDIT_CACHE_TTL_SECONDS", "15"), 15, 0, 3600),
+                    terminal_ttl_s=_parse_int(os.environ.get("AUDIT_CACHE_TERMINAL_TTL_SECONDS", "300"), 300, 0, 86400),
+                    max_rows=_parse_int(os.environ.get("AUDIT_CACHE_MAX_ROWS", "200"), 200, 1, 10000),
+                ),
+            )
+    return cache
+
+
+def _shared_tier():
+    if _audit_cache_mode() != "shared":
+        return None
+    tier = _STATE.get("shared")
+    if tier is None:
+        with _STATE_LOCK:
+            if "shared" not in _STATE:
+                _STATE["shared"] = BlobAuditCacheTier(get_audit_cache_container_client(AUDIT_CACHE_CONTAINER))
+            tier = _STATE["shared"]
+    return tier
+
+
+def _audit_cache_record(row: dict):
+    """Write-through hook for every audit row this worker appends (never raises)."""
+    cache = _audit_cache()
+    if cache is None:
+        return
+    try:
+        if row.get("UpdatedAt") is None:
+            # ingestion-time rows: the local clock stands in for now() at ingestion
+            now = datetime.now(timezone.utc)
+            row = dict(row, UpdatedAt=now, CreatedAt=row.get("CreatedAt") or now)
+        entry = cache.record(row)
+
+        tier = _shared_tier()
+        if tier is None:
+            return
+        # the shared tier holds finished events only; a later row replaces or drops the blob
+        if entry is not None and entry.terminal:
+            tier.put(entry)
+            counter_add("vigia_audit_cache_shared_total", op="put")
+        elif row.get("Status") in _TERMINAL or entry is None:
+            tier.delete(row.get("EventId"))
+            counter_add("vigia_audit_cache_shared_total", op="delete")
+    except Exception:
+        logging.warning("Audit cache write-through failed", exc_info=True)
+        counter_add("vigia_audit_cache_shared_total", op="error")
+
+
+def _audit_cached(event_id: str, load, endpoint: str):
+    """
+    CachedEvent for an event: local tier, then the shared tier, then load(event_id)
+    (Kusto). None when the cache is off; an uncached CachedEvent for timelines that
+    are empty or too long to keep.
+    """
+    cache = _audit_cache()
+    if cache is None:
+        return None
+    entry = cache.get(event_id)
+    if entry is not None:
+        counter_add("vigia_audit_cache_total", endpoint=endpoint, outcome="hit")
+        return entry
+
+    seq = cache.seq()
+    tier = _shared_tier()
+    if tier is not None:
+        try:
+            rows = tier.get(event_id)
+        except Exception:
+            logging.warning("Shared audit cache read failed", exc_info=True)
+            rows = None
+        if rows:
+            counter_add("vigia_audit_cache_total", endpoint=endpoint, outcome="shared_hit")
+            return cache.fill(event_id, rows, seq) or cache._build(event_id, rows)
+
+    counter_add("vigia_audit_cache_total", endpoint=endpoint, outcome="miss")
+    rows = load(event_id)
+    return cache.fill(event_id, rows, seq) or cache._build(event_id, rows)
\ No newline at end of file
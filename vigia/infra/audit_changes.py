@@ -0,0 +1,254 @@
+import os
+import time
+import base64
+import threading
+from collections import deque
+from datetime import datetime, timedelta, timezone
+
+from ..core.config import _parse_int, get_audit_table_name, get_kusto_db_name
+from ..core.kql import _escape_kql_string
+from ..core.telemetry import counter_add, gauge_set
+from .kusto import _kusto_query, _rows_as_dicts
+
+
+# ---------- Audit change feed ----------
+#
+# Every AuditEvents row is a transition. The feed orders them by a cursor
+# (IngestedAt, ChangeKey): IngestedAt is ingestion_time() cut to microseconds,
+# ChangeKey = EventId|Status|UpdatedAt breaks ties inside one ingested batch.
+# ingestion_time() rather than UpdatedAt, because WAL group commits
+# (audit_wal.py) land rows whose UpdatedAt is older than rows already visible.
+# Rows younger than AUDIT_CHANGES_SETTLE_SECONDS are held back, so concurrent
+# ingestions that commit slightly out of order are not skipped.
+#
+# A process-wide tail runs ONE unfiltered query per AUDIT_CHANGES_POLL_MS and keeps
+# the last AUDIT_CHANGES_BUFFER_ROWS transitions in memory. Every waiting request
+# on the worker is answered from it, with its filters applied in memory. Cursors
+# older than the buffer are answered by a direct, filtered Kusto query.
+
+_TAIL_PAGE = 1000
+_FILTER_COLUMNS = ("Status", "HazardType", "DeviceId")
+
+
+def _changes_settle_seconds() -> int:
+    return _parse_int(os.environ.get("AUDIT_CHANGES_SETTLE_SECONDS", "2"), 2, 0, 60)
+
+
+def _changes_poll_seconds() -> float:
+    return _parse_int(os.environ.get("AUDIT_CHANGES_POLL_MS", "1000"), 1000, 100, 60000) / 1000.0
+
+
+def _changes_max_wait_seconds() -> int:
+    return _parse_int(os.environ.get("AUDIT_CHANGES_MAX_WAIT_SECONDS", "25"), 25, 0, 200)
+
+
+# --- cursors ---
+
+def _change_key(event_id, status, updated_at) -> str:
+    """Python twin of the KQL ChangeKey (see _kql_changes)."""
+    ts = updated_at.strftime("%Y-%m-%d %H:%M:%S.%f") if isinstance(updated_at, datetime) else str(updated_at or "")
+    return f"{event_id or ''}|{status or ''}|{ts}"
+
+
+def _utc(dt: datetime) -> datetime:
+    return dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
+
+
+def _encode_cursor(cursor) -> str:
+    t, k = cursor
+    raw = f"{t.strftime('%Y-%m-%dT%H:%M:%S.%fZ')}\n{k}".encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def _decode_cursor(token: str):
+    """
+    Cursor from a token returned by the feed, or from a plain ISO-8601 datetime
+    (start after that ingestion time). Raises ValueError otherwise.
+    """
+    token = (token or "").strip()
+    try:
+        return _utc(datetime.fromisoformat(token.replace("Z", "+00:00"))), ""
+    except ValueError:
+        pass
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)).decode("utf-8")
+        t, k = raw.split("\n", 1)
+        return _utc(datetime.fromisoformat(t.replace("Z", "+00:00"))), k
+    except Exception:
+        raise ValueError(f"Invalid cursor: {token[:64]}")
+
+
+def _start_cursor(lookback_minutes: int):
+    return datetime.now(timezone.utc) - timedelta(minutes=lookback_minutes), ""
+
+
+# --- queries ---
+
+def _kql_in(column: str, values) -> str:
+    return f"| where {column} in~ (" + ", ".join(f"'{_escape_kql_string(v)}'" for v in sorted(values)) + ")"
+
+
+def _kql_changes(cursor, limit: int, filters: dict = None) -> str:
+    t, k = cursor
+    where = "\n            ".join(_kql_in(c, filters[c]) for c in _FILTER_COLUMNS if (filters or {}).get(c))
+    return f"""
+            {get_audit_table_name()}
+            | extend IngestedAt = bin(ingestion_time(), 1microsecond)
+            | where IngestedAt >= datetime('{t.strftime('%Y-%m-%dT%H:%M:%S.%fZ')}') and IngestedAt < ago({_changes_settle_seconds()}s)
+            | extend ChangeKey = strcat(EventId, '|', Status, '|', format_datetime(UpdatedAt, 'yyyy-MM-dd HH:mm:ss.ffffff'))
+            | where IngestedAt > datetime('{t.strftime('%Y-%m-%dT%H:%M:%S.%fZ')}') or strcmp(ChangeKey, '{_escape_kql_string(k)}') > 0
+            {where}
+            | extend VerificationReasoning = column_ifexists('VerificationReasoning', tostring(Details.verification_reasoning))
+            | sort by IngestedAt asc, ChangeKey asc
+            | take {limit}
+            | project IngestedAt, ChangeKey, EventId, ReportId, DeviceId, HazardType, Status, UpdatedAt, Agent, RunId, LedgerTxId, VerificationReasoning
+            """
+
+
+def _query_changes(cursor, limit: int, filters: dict = None, op: str = "audit_changes") -> list:
+    rows = _rows_as_dicts(_kusto_query(_kql_changes(cursor, limit, filters), op, db=get_kusto_db_name()))
+    for r in rows:
+        if isinstance(r.get("IngestedAt"), datetime):
+            r["IngestedAt"] = _utc(r["IngestedAt"])
+    return rows
+
+
+def _row_cursor(row: dict):
+    return row["IngestedAt"], str(row.get("ChangeKey") or "")
+
+
+def _matches(row: dict, filters: dict) -> bool:
+    for c in _FILTER_COLUMNS:
+        wanted = filters.get(c)
+        if wanted and str(row.get(c) or "").casefold() not in wanted:
+            return False
+    return True
+
+
+# --- shared tail ---
+
+class ChangeTail:
+    """
+    In-memory window over the newest transitions. Rows after `floor` are complete
+    up to `head`; the buffer is refreshed by whichever request finds it stale.
+    Concurrent requests wait for that refresh instead of issuing their own.
+    """
+
+    def __init__(self, max_rows: int):
+        self.max_rows = max(_TAIL_PAGE, max_rows)
+        self._cond = threading.Condition()
+        self._rows = deque()  # (cursor, row), ascending
+        self._floor = None
+        self._head = None
+        self._fetching = False
+        self._fetched_at = 0.0
+
+    def floor(self):
+        with self._cond:
+            return self._floor
+
+    def refresh(self, min_interval_s: float):
+        with self._cond:
+            if self._head is None:
+                # the tail only covers what happens after it started
+                self._floor = self._head = (datetime.now(timezone.utc) - timedelta(seconds=_changes_settle_seconds()), "")
+            while self._fetching:
+                self._cond.wait()
+            if time.monotonic() - self._fetched_at < min_interval_s:
+                return
+            self._fetching = True
+            head = self._head
+
+        try:
+            fetched = []
+            for _ in range(max(1, self.max_rows // _TAIL_PAGE)):
+                page = _query_changes(head, _TAIL_PAGE, op="audit_changes_tail")
+                counter_add("vigia_audit_changes_queries_total", source="tail")
+                fetched.extend(page)
+                if page:
+                    head = _row_cursor(page[-1])
+                if len(page) < _TAIL_PAGE:
+                    break
+        finally:
+            with self._cond:
+                self._fetching = False
+                self._fetched_at = time.monotonic()
+                self._cond.notify_all()
+
+        with self._cond:
+            for r in fetched:
+                self._rows.append((_row_cursor(r), r))
+            while len(self._rows) > self.max_rows:
+                self._floor = self._rows.popleft()[0]
+            self._head = head
+            gauge_set("vigia_audit_changes_buffer_rows", len(self._rows))
+            if fetched:
+                self._cond.notify_all()
+
+    def read(self, since, filters: dict, limit: int):
+        """
+        (rows, next cursor, more) for transitions after `since`, or None when
+        `since` is older than the buffer. With no match the cursor still moves
+        to the head, so the next read does not rescan the same rows.
+        """
+        with self._cond:
+            if self._floor is None or since < self._floor:
+                return None
+            out = []
+            for cur, row in self._rows:
+                if cur <= since or not _matches(row, filters):
+                    continue
+                out.append(row)
+                if len(out) >= limit:
+                    return out, cur, True
+            return out, max(since, self._head), False
+
+    def wait(self, timeout_s: float):
+        with self._cond:
+            head = self._head
+            self._cond.wait_for(lambda: self._head != head, timeout=max(0.0, timeout_s))
+
+
+_TAIL = {}
+_TAIL_LOCK = threading.Lock()
+
+
+def _change_tail() -> ChangeTail:
+    tail = _TAIL.get("tail")
+    if tail is None:
+        with _TAIL_LOCK:
+            tail = _TAIL.setdefault(
+                "tail", ChangeTail(_parse_int(os.environ.get("AUDIT_CHANGES_BUFFER_ROWS", "20000"), 20000, 1000, 1000000))
+            )
+    return tail
+
+
+def _audit_changes(since, filters: dict, limit: int, wait_s: float):
+    """
+    Transitions after `since` matching `filters` ({column: {casefolded values}}).
+    Long-polls up to `wait_s` when there is nothing new. Returns (rows, next cursor, more).
+    """
+    tail = _change_tail()
+    poll_s = _changes_poll_seconds()
+    deadline = time.monotonic() + max(0.0, wait_s)
+
+    while True:
+        tail.refresh(poll_s)
+        res = tail.read(since, filters, limit)
+        if res is None:
+            rows = _query_changes(since, limit, filters)
+            counter_add("vigia_audit_changes_queries_total", source="direct")
+            if rows:
+                counter_add("vigia_audit_changes_rows_total", len(rows))
+                return rows, _row_cursor(rows[-1]), len(rows) >= limit
+            # nothing matched up to now - settle, which is past the tail's floor
+            since = max(since, tail.floor())
+            continue
+
+        rows, cursor, more = res
+        left = deadline - time.monotonic()
+        if rows or left <= 0:
+            counter_add("vigia_audit_changes_rows_total", len(rows))
+            return rows, cursor, more
+        since = cursor
+        tail.wait(min(left, poll_s))
\ No newline at end of file
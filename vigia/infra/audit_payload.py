@@ -0,0 +1,144 @@
+import os
+import json
+import zlib
+import base64
+import hashlib
+import threading
+from collections import OrderedDict
+
+from ..core.config import _parse_int
+from ..core.jsonx import _json_fallback
+from ..core.report import Report
+from ..core.telemetry import counter_add
+
+
+# ---------- Content-addressed payloads + capped diagnostic blobs ----------
+#
+# AUDIT_PAYLOAD_MODE:
+#   ref    - the first row written for (EventId, payload hash) carries Details.payload and
+#            Details.payload_hash; later rows carry only Details.payload_ref (default)
+#   inline - every row embeds the full payload, as before
+#
+# Diagnostic dumps (run_steps, trace, messages_preview, assistant_text) larger than
+# AUDIT_BLOB_INLINE_BYTES are cut at AUDIT_BLOB_MAX_BYTES and stored zlib+base64.
+
+_BLOB_KEYS = ("run_steps", "trace", "messages_preview", "assistant_text")
+_BLOB_CODEC = "zlib+b64"
+
+_PAYLOAD_SEEN = OrderedDict()  # (event_id, payload_hash) already stored with a full payload
+_PAYLOAD_SEEN_LOCK = threading.Lock()
+_PAYLOAD_SEEN_MAX = 50000
+
+
+def _payload_mode() -> str:
+    mode = (os.environ.get("AUDIT_PAYLOAD_MODE") or "ref").strip().lower()
+    return mode if mode in ("ref", "inline") else "ref"
+
+
+def _payload_hash(payload: dict) -> str:
+    if isinstance(payload, Report):
+        # every audit row of the event carries the same report: hash it once
+        return payload.cached("payload_hash", lambda: _canonical_hash(payload))
+    return _canonical_hash(payload)
+
+
+def _canonical_hash(payload: dict) -> str:
+    canon = json.dumps(payload, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=_json_fallback)
+    return "sha256:" + hashlib.sha256(canon.encode("utf-8")).hexdigest()
+
+
+def _payload_mark_stored(event_id: str, payload_hash: str):
+    """Called after the row carrying the full payload was accepted (Kusto or WAL)."""
+    with _PAYLOAD_SEEN_LOCK:
+        _PAYLOAD_SEEN[(event_id, payload_hash)] = True
+        _PAYLOAD_SEEN.move_to_end((event_id, payload_hash))
+        while len(_PAYLOAD_SEEN) > _PAYLOAD_SEEN_MAX:
+            _PAYLOAD_SEEN.popitem(last=False)
+
+
+def _payload_stored(event_id: str, payload_hash: str) -> bool:
+    with _PAYLOAD_SEEN_LOCK:
+        return (event_id, payload_hash) in _PAYLOAD_SEEN
+
+
+def _pack_blob(value, max_bytes: int) -> dict:
+    raw = json.dumps(value, ensure_ascii=False, default=_json_fallback).encode("utf-8")
+    kept = raw[:max_bytes]
+    counter_add("vigia_audit_blob_packed_total")
+    counter_add("vigia_audit_blob_bytes_saved_total", max(0, len(raw) - len(kept)))
+    return {
+        "blob": _BLOB_CODEC,
+        "bytes": len(raw),
+        "truncated": len(kept) < len(raw),
+        "sha256": hashlib.sha256(raw).hexdigest(),
+        "data": base64.b64encode(zlib.compress(kept, 6)).decode("ascii"),
+    }
+
+
+def _unpack_blob(value):
+    if not (isinstance(value, dict) and value.get("blob") == _BLOB_CODEC):
+        return value
+    text = zlib.decompress(base64.b64decode(value.get("data") or "")).decode("utf-8", errors="replace")
+    if value.get("truncated"):
+        return text
+    try:
+        return json.loads(text)
+    except ValueError:
+        return text
+
+
+def _cap_blobs(details: dict, inline_bytes: int, max_bytes: int, depth: int = 0) -> dict:
+    out = {}
+    for k, v in details.items():
+        if k in _BLOB_KEYS and v:
+            size = len(json.dumps(v, ensure_ascii=False, default=_json_fallback).encode("utf-8"))
+            out[k] = _pack_blob(v, max_bytes) if size > inline_bytes else v
+        elif isinstance(v, dict) and depth < 3 and k != "payload":
+            out[k] = _cap_blobs(v, inline_bytes, max_bytes, depth + 1)
+        else:
+            out[k] = v
+    return out
+
+
+def _compact_details(event_id: str, details: dict) -> dict:
+    """
+    Copy of `details` as it should be stored: payload replaced by payload_ref once
+    the event already has a stored copy, diagnostic blobs capped and compressed.
+    """
+    out = dict(details or {})
+    payload = out.get("payload")
+    if isinstance(payload, dict) and payload and _payload_mode() == "ref":
+        h = _payload_hash(payload)
+        if _payload_stored(event_id, h):
+            out.pop("payload")
+            out["payload_ref"] = h
+            counter_add("vigia_audit_payload_refs_total")
+        else:
+            out["payload_hash"] = h
+
+    inline_bytes = _parse_int(os.environ.get("AUDIT_BLOB_INLINE_BYTES", "2048"), 2048, 0, 10000000)
+    max_bytes = _parse_int(os.environ.get("AUDIT_BLOB_MAX_BYTES", "65536"), 65536, 256, 10000000)
+    return _cap_blobs(out, inline_bytes, max_bytes)
+
+
+def _expand_blobs(details: dict, depth: int = 0) -> dict:
+    out = {}
+    for k, v in details.items():
+        if k in _BLOB_KEYS:
+            out[k] = _unpack_blob(v)
+        elif isinstance(v, dict) and depth < 3 and k != "payload":
+            out[k] = _expand_blobs(v, depth + 1)
+        else:
+            out[k] = v
+    return out
+
+
+def _hydrate_details(details, payloads: dict):
+    """Details with payload_ref resolved from `payloads` (hash -> payload) and blobs expanded."""
+    if not isinstance(details, dict):
+        return details
+    out = _expand_blobs(details)
+    ref = out.get("payload_ref")
+    if ref and "payload" not in out and ref in payloads:
+        out["payload"] = payloads[ref]
+    return out
\ No newline at end of file
@@ -1,10 +1,18 @@
+import os
 import json
+from datetime import datetime, timezone
 
-from ..core.config import get_audit_table_name, get_kusto_db_name
+from ..core.config import _parse_int, get_audit_table_name, get_kusto_db_name
 from ..core.jsonx import _json_fallback
 from ..core.kql import _escape_kql_string
+from ..core.report import Report
 from ..core.timeutil import _round_float, _to_iso_datetime
-from .clients import _CLIENTS, _LOCK, get_kusto_client
+from .clients import _REGISTRY
+from .audit_archive import _audit_event_source
+from .audit_cache import _audit_cache_record
+from .audit_payload import _compact_details, _hydrate_details, _payload_mark_stored
+from .audit_wal import _audit_wal, _wal_timestamp
+from .kusto import _kusto_mgmt, _kusto_query, _rows_as_dicts
 
 
 # ---------- Audit / Idempotency ----------
@@ -13,45 +21,52 @@ def _audit_has_verification_reasoning_col() -> bool:
     """
     Cache whether AuditEvents has VerificationReasoning.
     Safe fallback if user hasn't altered the table yet.
+    Re-checked every AUDIT_SCHEMA_CHECK_SECONDS, so an .alter is picked up without a restart.
     """
-    cache_key = "audit_has_verification_reasoning"
-    if cache_key in _CLIENTS:
-        return _CLIENTS[cache_key]
+    max_age_s = _parse_int(os.environ.get("AUDIT_SCHEMA_CHECK_SECONDS", "600"), 600, 10, 86400)
+    return _REGISTRY.get("audit_has_verification_reasoning", _check_verification_reasoning_col, max_age_s=max_age_s)
 
+
+def _check_verification_reasoning_col() -> bool:
     db = get_kusto_db_name()
     audit_table = get_audit_table_name()
 
     try:
         # control command: schema info
         cmd = f".show table {audit_table} schema"
-        table = get_kusto_client().execute_mgmt(db, cmd).primary_results[0]
+        table = _kusto_mgmt(cmd, "audit_schema", db=db)
         cols = [c.column_name for c in table.columns]
         # result includes a column that contains schema text; search within rows
         joined = " ".join([str(x) for r in table.rows for x in r])
         has_col = ("VerificationReasoning" in joined)
     except Exception:
         has_col = False
-
-    with _LOCK:
-        _CLIENTS[cache_key] = has_col
     return has_col
 
 
-def _audit_append(event_id: str, report_id: str, status: str, details: dict, verification_reasoning: str = ""):
+def _audit_columns(p: dict) -> tuple:
+    """(DeviceId, Timestamp, Latitude, Longitude, HazardType) column values for a payload."""
+    return (
+        str(p.get("DeviceId") or p.get("deviceId") or ""),
+        _to_iso_datetime(p.get("Timestamp")),
+        _round_float(p.get("Latitude"), 6) or 0.0,
+        _round_float(p.get("Longitude"), 6) or 0.0,
+        str(p.get("HazardType") or "none"),
+    )
+
+
+def _audit_row(event_id: str, report_id: str, status: str, details: dict, verification_reasoning: str = "",
+               updated_at: str = None) -> dict:
     """
-    Append-only audit log row into AuditEvents (or AUDIT_TABLE_NAME).
-    Must match FULL table schema (incl. VerificationReasoning).
+    Column values for one AuditEvents row (FULL table schema, incl. VerificationReasoning).
+    updated_at=None means "now() at ingestion"; the WAL passes its own local write time.
     """
-    db = get_kusto_db_name()
-    audit_table = get_audit_table_name()
-
     # Pull base telemetry fields from details["payload"] if present
     p = (details or {}).get("payload") or {}
-    device_id = str(p.get("DeviceId") or p.get("deviceId") or "")
-    ts_iso = _to_iso_datetime(p.get("Timestamp"))
-    lat = _round_float(p.get("Latitude"), 6) or 0.0
-    lon = _round_float(p.get("Longitude"), 6) or 0.0
-    hazard_type = (p.get("HazardType") or "none")
+    if isinstance(p, Report):
+        device_id, ts_iso, lat, lon, hazard_type = p.cached("audit_columns", lambda: _audit_columns(p))
+    else:
+        device_id, ts_iso, lat, lon, hazard_type = _audit_columns(p)
 
     # Optional metadata (agent triggers / ledger writes)
     agent = str((details or {}).get("agent") or "")
@@ -75,59 +90,248 @@ def _audit_append(event_id: str, report_id: str, status: str, details: dict, ver
         or ""
     )
 
+    return {
+        "EventId": event_id,
+        "ReportId": report_id or "",
+        "DeviceId": device_id,
+        "Timestamp": ts_iso,
+        "Latitude": lat,
+        "Longitude": lon,
+        "HazardType": hazard_type,
+        "Status": status or "",
+        "UpdatedAt": updated_at,
+        "Agent": agent,
+        "RunId": run_id,
+        "LedgerTxId": ledger_tx,
+        "Receipt": receipt_obj or {},
+        "Details": _compact_details(event_id, details_obj),
+        "CreatedAt": updated_at,
+        "VerificationReasoning": verification_reasoning,
+    }
+
+
+def _audit_print(row: dict) -> str:
+    """`print ... | project ...` producing one AuditEvents row."""
+
     def esc(s: str) -> str:
         return _escape_kql_string(s)
 
-    eid = esc(event_id)
-    rid = esc(report_id or "")
-    did = esc(device_id)
-    hz = esc(str(hazard_type))
-    st = esc(status or "")
-    ag = esc(agent)
-    rn = esc(run_id)
-    ltx = esc(ledger_tx)
-    vr = esc(verification_reasoning)
-
-    details_json = esc(json.dumps(details_obj, ensure_ascii=False, default=_json_fallback))
-    receipt_json = esc(json.dumps(receipt_obj or {}, ensure_ascii=False, default=_json_fallback))
-    mgmt = f""".append {audit_table} <|
-            print
-                EventId='{eid}',
-                ReportId='{rid}',
-                DeviceId='{did}',
-                Timestamp=datetime('{esc(ts_iso)}'),
-                Latitude=real({lat}),
-                Longitude=real({lon}),
-                HazardType='{hz}',
-                Status='{st}',
-                UpdatedAt=now(),
-                Agent='{ag}',
-                RunId='{rn}',
-                LedgerTxId='{ltx}',
+    def ts(v) -> str:
+        return f"datetime('{esc(v)}')" if v else "now()"
+
+    details_json = esc(json.dumps(row["Details"], ensure_ascii=False, default=_json_fallback))
+    receipt_json = esc(json.dumps(row["Receipt"] or {}, ensure_ascii=False, default=_json_fallback))
+    return f"""print
+                EventId='{esc(row["EventId"])}',
+                ReportId='{esc(row["ReportId"])}',
+                DeviceId='{esc(row["DeviceId"])}',
+                Timestamp=datetime('{esc(row["Timestamp"])}'),
+                Latitude=real({row["Latitude"]}),
+                Longitude=real({row["Longitude"]}),
+                HazardType='{esc(row["HazardType"])}',
+                Status='{esc(row["Status"])}',
+                UpdatedAt={ts(row["UpdatedAt"])},
+                Agent='{esc(row["Agent"])}',
+                RunId='{esc(row["RunId"])}',
+                LedgerTxId='{esc(row["LedgerTxId"])}',
                 Receipt=parse_json('{receipt_json}'),
                 Details=parse_json('{details_json}'),
-                CreatedAt=now(),
-                VerificationReasoning='{vr}'
-            | project EventId, ReportId, DeviceId, Timestamp, Latitude, Longitude, HazardType, Status, UpdatedAt, Agent, RunId, LedgerTxId, Receipt, Details, CreatedAt, VerificationReasoning
-            """
-    get_kusto_client().execute_mgmt(db, mgmt)
+                CreatedAt={ts(row["CreatedAt"])},
+                VerificationReasoning='{esc(row["VerificationReasoning"])}'
+            | project EventId, ReportId, DeviceId, Timestamp, Latitude, Longitude, HazardType, Status, UpdatedAt, Agent, RunId, LedgerTxId, Receipt, Details, CreatedAt, VerificationReasoning"""
 
 
-def _audit_get_latest(event_id: str):
+def _audit_append_rows(rows: list):
+    """One .append for many prepared rows (WAL group commit)."""
+    if not rows:
+        return
     db = get_kusto_db_name()
     audit_table = get_audit_table_name()
-    eid = _escape_kql_string(event_id)
+    if len(rows) == 1:
+        source = _audit_print(rows[0])
+    else:
+        source = "union\n            " + ",\n            ".join(f"({_audit_print(r)})" for r in rows)
+    _kusto_mgmt(f".append {audit_table} <|\n            {source}\n            ", "audit_append_batch", db=db)
 
+
+def _audit_append(event_id: str, report_id: str, status: str, details: dict, verification_reasoning: str = ""):
+    """
+    Append-only audit log row into AuditEvents (or AUDIT_TABLE_NAME).
+    The payload is stored in full once per event (see audit_payload.py).
+    With AUDIT_WAL_MODE=on the row is made durable in the local WAL and
+    group-committed to Kusto in the background.
+    """
+    wal = _audit_wal(_audit_append_rows)
+    if wal is not None:
+        row = _audit_row(event_id, report_id, status, details, verification_reasoning, _wal_timestamp())
+        wal.append(row)
+    else:
+        db = get_kusto_db_name()
+        audit_table = get_audit_table_name()
+        row = _audit_row(event_id, report_id, status, details, verification_reasoning)
+        mgmt = f""".append {audit_table} <|
+            {_audit_print(row)}
+            """
+        _kusto_mgmt(mgmt, "audit_append", db=db)
+
+    if row["Details"].get("payload_hash"):
+        _payload_mark_stored(event_id, row["Details"]["payload_hash"])
+    _audit_cache_record(row)
+
+
+def _as_utc(v):
+    if isinstance(v, datetime):
+        return v if v.tzinfo else v.replace(tzinfo=timezone.utc)
+    try:
+        dt = datetime.fromisoformat(str(v).replace("Z", "+00:00"))
+        return dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
+    except Exception:
+        return datetime.min.replace(tzinfo=timezone.utc)
+
+
+def _audit_merge_pending(event_id: str, rows: list) -> list:
+    """
+    Kusto rows for an event plus its WAL rows not committed yet, sorted by UpdatedAt.
+    A row that is in both (committed, not yet deleted locally) appears once.
+    """
+    wal = _audit_wal(_audit_append_rows)
+    if wal is None:
+        return rows
+    pending = wal.pending(event_id)
+    if not pending:
+        return rows
+    seen = {(r.get("Status"), _as_utc(r.get("UpdatedAt"))) for r in rows}
+    merged = list(rows)
+    for r in pending:
+        if (r.get("Status"), _as_utc(r.get("UpdatedAt"))) not in seen:
+            merged.append(r)
+    merged.sort(key=lambda r: _as_utc(r.get("UpdatedAt")))
+    return merged
+
+
+def _audit_timeline(event_id: str) -> list:
+    """Every row of an event (incl. unflushed WAL rows), oldest first; what the audit read cache holds."""
     q = f"""
-        {audit_table}
-        | where EventId == '{eid}'
+        {_audit_event_source(event_id)}
         | extend VerificationReasoning = column_ifexists('VerificationReasoning', tostring(Details.verification_reasoning))
-        | top 1 by UpdatedAt desc
+        | sort by UpdatedAt asc
+        """
+    table = _kusto_query(q, "audit_timeline", db=get_kusto_db_name())
+    return _audit_merge_pending(event_id, _rows_as_dicts(table))
+
+
+def _kql_status_list(statuses) -> str:
+    return "(" + ", ".join(f"'{_escape_kql_string(s)}'" for s in statuses) + ")"
+
+
+def _audit_get_latest(event_id: str, statuses=None, prefer=None):
+    """
+    Latest state row for an event. `statuses` restricts it to those statuses
+    (the auditor's idempotency read asks for the terminal ones, so a later
+    RECEIVED row from a duplicate delivery does not hide them). Rows whose status
+    is in `prefer` win over later rows (a terminal row over a stray checkpoint).
+    """
+    db = get_kusto_db_name()
+    status_filter = ""
+    if statuses:
+        status_filter = f"| where Status in {_kql_status_list(statuses)}"
+    order = "UpdatedAt desc"
+    if prefer:
+        status_filter += f"\n        | extend Preferred = Status in {_kql_status_list(prefer)}"
+        order = "Preferred desc, UpdatedAt desc"
+
+    # *_AGENT_TRIGGERED rows are informational and may land after the terminal row
+    # (background note dispatch), so they never count as the latest state.
+    q = f"""
+        {_audit_event_source(event_id)}
+        | where Status !endswith '_AGENT_TRIGGERED'
+        {status_filter}
+        | extend VerificationReasoning = column_ifexists('VerificationReasoning', tostring(Details.verification_reasoning))
+        | top 1 by {order}
         | project Status, UpdatedAt, Details, VerificationReasoning
         """
-    res = get_kusto_client().execute(db, q).primary_results[0]
-    if not res.rows:
+    res = _kusto_query(q, "audit_get_latest", db=db)
+    row = None
+    if res.rows:
+        cols = [c.column_name for c in res.columns]
+        row = dict(zip(cols, res.rows[0]))
+
+    # read-your-writes: unflushed WAL rows for this event
+    merged = [
+        r for r in _audit_merge_pending(event_id, [row] if row else [])
+        if not str(r.get("Status") or "").endswith("_AGENT_TRIGGERED")
+        and (not statuses or r.get("Status") in statuses)
+    ]
+    if not merged:
         return None
-    cols = [c.column_name for c in res.columns]
-    row = dict(zip(cols, res.rows[0]))
-    return row
\ No newline at end of file
+    preferred = [r for r in merged if prefer and r.get("Status") in prefer]
+    latest = (preferred or merged)[-1]
+    return {k: latest.get(k) for k in ("Status", "UpdatedAt", "Details", "VerificationReasoning")}
+
+
+def _audit_stuck_events(checkpoints, terminal, stuck_minutes: int, max_age_hours: int, limit: int) -> list:
+    """
+    Events updated in the last `max_age_hours` that have no `terminal` row and whose
+    latest `checkpoints` row is older than `stuck_minutes`, oldest first.
+    """
+    q = f"""
+        {get_audit_table_name()}
+        | where UpdatedAt > ago({max_age_hours}h)
+        | where Status in {_kql_status_list(tuple(checkpoints) + tuple(terminal))}
+        | summarize Finished = countif(Status in {_kql_status_list(terminal)}), arg_max(UpdatedAt, Status, ReportId, DeviceId) by EventId
+        | where Finished == 0 and UpdatedAt < ago({stuck_minutes}m)
+        | top {limit} by UpdatedAt asc
+        | project EventId, ReportId, DeviceId, Status, UpdatedAt
+        """
+    return _rows_as_dicts(_kusto_query(q, "audit_stuck_events", db=get_kusto_db_name()))
+
+
+def _audit_ledger_anchor(event_id: str):
+    """
+    (collectionId, transactionId) of the ledger entry already written for an event
+    (LEDGER_SUBMITTED / LEDGER_WRITTEN rows), or None. Checked before every ledger
+    write so a retried event never anchors twice.
+    """
+    q = f"""
+        {_audit_event_source(event_id)}
+        | where isnotempty(LedgerTxId)
+        | top 1 by UpdatedAt desc
+        | project Status, UpdatedAt, LedgerTxId, Details
+        """
+    rows = _rows_as_dicts(_kusto_query(q, "audit_ledger_anchor", db=get_kusto_db_name()))
+    rows = [r for r in _audit_merge_pending(event_id, rows) if r.get("LedgerTxId")]
+    if not rows:
+        return None
+    details = rows[-1].get("Details") if isinstance(rows[-1].get("Details"), dict) else {}
+    return (str(details.get("collectionId") or "") or None), str(rows[-1]["LedgerTxId"])
+
+
+def _audit_hydrate(event_id: str, rows: list) -> list:
+    """
+    Rows with Details.payload restored for payload_ref rows and compressed
+    diagnostic blobs expanded. Costs one extra query only when the rows given
+    do not include the one that stored the payload.
+    """
+    def _details(r):
+        d = r.get("Details")
+        return d if isinstance(d, dict) else {}
+
+    payloads = {
+        _details(r)["payload_hash"]: _details(r)["payload"]
+        for r in rows
+        if _details(r).get("payload_hash") and isinstance(_details(r).get("payload"), dict)
+    }
+    missing = {_details(r).get("payload_ref") for r in rows} - set(payloads) - {None, ""}
+    if missing:
+        q = f"""
+            {_audit_event_source(event_id)}
+            | where isnotempty(tostring(Details.payload_hash))
+            | project Status, UpdatedAt, Details
+            """
+        stored = _rows_as_dicts(_kusto_query(q, "audit_payload", db=get_kusto_db_name()))
+        for r in _audit_merge_pending(event_id, stored):
+            d = _details(r)
+            if d.get("payload_hash") in missing and isinstance(d.get("payload"), dict):
+                payloads[d["payload_hash"]] = d["payload"]
+
+    return [dict(r, Details=_hydrate_details(r.get("Details"), payloads)) for r in rows]
\ No newline at end of file
@@ -0,0 +1,317 @@
+import os
+import json
+import time
+import atexit
+import socket
+import sqlite3
+import logging
+import tempfile
+import threading
+from datetime import datetime, timedelta, timezone
+
+from ..core.config import _parse_int
+from ..core.jsonx import _json_fallback
+from ..core.telemetry import counter_add, gauge_set, histogram_record
+from .clients import _is_connection_error
+
+
+# ---------- Audit write-ahead log (opt-in: AUDIT_WAL_MODE=on) ----------
+#
+# Audit rows are inserted into a SQLite file under AUDIT_WAL_DIR (journal_mode=WAL,
+# synchronous=FULL, so an acknowledged row is on disk) and a background committer
+# group-commits them to Kusto. Rows carry their own UpdatedAt/CreatedAt, so the
+# order in which batches land does not change "latest by UpdatedAt".
+#
+# Several worker processes may share the file: the committer claims rows under a
+# lease (AUDIT_WAL_CLAIM_LEASE_SECONDS) before sending them, and rows whose claim
+# expired (crashed process, restart) are picked up again. Rows are deleted once
+# Kusto acknowledged the batch, so a crash between the two can re-send a batch
+# (at-least-once).
+#
+# A failed group commit counts an attempt on each of its rows (connection errors do
+# not: Kusto was not reached). Once the oldest row has failed AUDIT_WAL_MAX_ATTEMPTS
+# times (default 5), each further failure halves the batch, so one row Kusto rejects
+# cannot stall the log: the rows around it commit in smaller batches and it ends up
+# alone. A single-row batch that fails at that point is moved to the audit_wal_dead
+# table in the same file (vigia_audit_wal_dead_letters_total), with the error.
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS audit_wal (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    event_id TEXT NOT NULL,
+    status TEXT NOT NULL,
+    updated_at TEXT NOT NULL,
+    row_json TEXT NOT NULL,
+    bytes INTEGER NOT NULL,
+    written_at REAL NOT NULL,
+    claimed_by TEXT,
+    claimed_at REAL,
+    attempts INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS audit_wal_event ON audit_wal (event_id, seq);
+CREATE TABLE IF NOT EXISTS audit_wal_dead (
+    seq INTEGER PRIMARY KEY,
+    event_id TEXT NOT NULL,
+    status TEXT NOT NULL,
+    updated_at TEXT NOT NULL,
+    row_json TEXT NOT NULL,
+    attempts INTEGER NOT NULL,
+    error TEXT,
+    failed_at REAL NOT NULL
+);
+"""
+
+_TS_LOCK = threading.Lock()
+_TS_LAST = [None]
+
+
+def _wal_timestamp() -> str:
+    """UTC now as ISO-8601, strictly increasing within the process."""
+    with _TS_LOCK:
+        now = datetime.now(timezone.utc)
+        if _TS_LAST[0] is not None and now <= _TS_LAST[0]:
+            now = _TS_LAST[0] + timedelta(microseconds=1)
+        _TS_LAST[0] = now
+    return now.strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+
+class AuditWAL:
+    def __init__(self, path: str, flush_fn, batch_rows: int, batch_bytes: int, interval_s: float, lease_s: float,
+                 max_attempts: int = 5):
+        self.path = path
+        self.flush_fn = flush_fn
+        self.batch_rows = max(1, batch_rows)
+        self.batch_bytes = max(1024, batch_bytes)
+        self.interval_s = max(0.01, interval_s)
+        self.lease_s = max(1.0, lease_s)
+        self.max_attempts = max(1, max_attempts)
+        self._local = threading.local()
+        self._wake = threading.Event()
+        self._start_lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self._unflushed = 0  # appended by this process since the last flush
+        self._backoff_s = 0.0
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        c = self._conn()
+        c.executescript(_SCHEMA)
+        if "attempts" not in {r[1] for r in c.execute("PRAGMA table_info(audit_wal)")}:
+            # log written before attempts were tracked
+            c.execute("ALTER TABLE audit_wal ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0")
+
+    # --- storage ---
+
+    def _conn(self) -> sqlite3.Connection:
+        c = getattr(self._local, "conn", None)
+        if c is None or getattr(self._local, "pid", None) != os.getpid():
+            c = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            c.execute("PRAGMA journal_mode=WAL")
+            c.execute("PRAGMA synchronous=FULL")
+            self._local.conn = c
+            self._local.pid = os.getpid()
+        return c
+
+    def append(self, row: dict):
+        """Persist one prepared audit row; returns once it is durable locally."""
+        t0 = time.perf_counter()
+        body = json.dumps(row, ensure_ascii=False, default=_json_fallback)
+        self._conn().execute(
+            "INSERT INTO audit_wal (event_id, status, updated_at, row_json, bytes, written_at) VALUES (?, ?, ?, ?, ?, ?)",
+            (row["EventId"], row["Status"], row["UpdatedAt"], body, len(body.encode("utf-8")), time.time()),
+        )
+        histogram_record("vigia_audit_wal_append_ms", (time.perf_counter() - t0) * 1000.0)
+        counter_add("vigia_audit_wal_rows_appended_total")
+
+        self.start()
+        self._unflushed += 1
+        if self._unflushed >= self.batch_rows:
+            self._wake.set()
+
+    def pending(self, event_id: str) -> list:
+        """Rows for an event that Kusto may not have yet, oldest first."""
+        cur = self._conn().execute("SELECT row_json FROM audit_wal WHERE event_id = ? ORDER BY seq", (event_id,))
+        return [json.loads(r[0]) for r in cur.fetchall()]
+
+    def backlog(self):
+        """(rows waiting, seconds since the oldest one was written)."""
+        n, oldest = self._conn().execute("SELECT COUNT(*), MIN(written_at) FROM audit_wal").fetchone()
+        return int(n or 0), (time.time() - oldest) if oldest else 0.0
+
+    # --- committer ---
+
+    def start(self):
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+                return
+            self._pid = os.getpid()
+            self._owner = f"{socket.gethostname()}:{self._pid}:{id(self)}"
+            self._thread = threading.Thread(target=self._run, name="vigia-audit-wal", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wake.wait(max(self.interval_s, self._backoff_s))
+            self._wake.clear()
+            try:
+                while self.flush_once() >= self.batch_rows:
+                    pass
+            except Exception:
+                logging.error("Audit WAL committer error", exc_info=True)
+
+    def _claim(self) -> list:
+        now = time.time()
+        c = self._conn()
+        c.execute("BEGIN IMMEDIATE")
+        try:
+            rows = c.execute(
+                "SELECT seq, row_json, bytes, written_at, attempts FROM audit_wal "
+                "WHERE claimed_by IS NULL OR claimed_at < ? ORDER BY seq LIMIT ?",
+                (now - self.lease_s, self.batch_rows),
+            ).fetchall()
+            limit = self.batch_rows
+            if rows and rows[0][4] >= self.max_attempts:
+                # the oldest row keeps failing: halve the batch per extra failure to isolate it
+                limit = max(1, self.batch_rows >> min(30, rows[0][4] - self.max_attempts + 1))
+            batch, size = [], 0
+            for r in rows[:limit]:
+                if batch and size + r[2] > self.batch_bytes:
+                    break
+                batch.append(r)
+                size += r[2]
+            if batch:
+                c.executemany(
+                    "UPDATE audit_wal SET claimed_by = ?, claimed_at = ? WHERE seq = ?",
+                    [(self._owner, now, r[0]) for r in batch],
+                )
+            c.execute("COMMIT")
+            return batch
+        except Exception:
+            c.execute("ROLLBACK")
+            raise
+
+    def _write_many(self, sql: str, params: list):
+        c = self._conn()
+        c.execute("BEGIN IMMEDIATE")
+        try:
+            c.executemany(sql, params)
+            c.execute("COMMIT")
+        except Exception:
+            c.execute("ROLLBACK")
+            raise
+
+    def flush_once(self) -> int:
+        """Send one batch to Kusto. Returns the number of rows committed (0 when idle or failed)."""
+        self.start()
+        batch = self._claim()
+        if not batch:
+            self._publish()
+            return 0
+
+        seqs = [(r[0],) for r in batch]
+        t0 = time.perf_counter()
+        try:
+            self.flush_fn([json.loads(r[1]) for r in batch])
+        except Exception as e:
+            logging.warning("Audit WAL group commit failed (%d rows); will retry", len(batch), exc_info=True)
+            counter_add("vigia_audit_wal_flush_failures_total")
+            attempt = 0 if _is_connection_error(e) else 1
+            if attempt and len(batch) == 1 and batch[0][4] + 1 >= self.max_attempts:
+                self._dead_letter(batch[0], e)
+                self._publish()
+                return 0
+            self._write_many(
+                "UPDATE audit_wal SET claimed_by = NULL, claimed_at = NULL, attempts = attempts + ? WHERE seq = ?",
+                [(attempt, r[0]) for r in batch],
+            )
+            self._backoff_s = min(30.0, max(0.5, self._backoff_s * 2))
+            self._publish()
+            return 0
+
+        self._write_many("DELETE FROM audit_wal WHERE seq = ?", seqs)
+        self._backoff_s = 0.0
+        self._unflushed = max(0, self._unflushed - len(batch))
+        counter_add("vigia_audit_wal_rows_flushed_total", len(batch))
+        histogram_record("vigia_audit_wal_batch_rows", len(batch))
+        histogram_record("vigia_audit_wal_commit_ms", (time.perf_counter() - t0) * 1000.0)
+        histogram_record("vigia_audit_wal_row_lag_ms", (time.time() - min(r[3] for r in batch)) * 1000.0)
+        self._publish()
+        return len(batch)
+
+    def _dead_letter(self, row, error: Exception):
+        seq, body = row[0], row[1]
+        data = json.loads(body)
+        c = self._conn()
+        c.execute("BEGIN IMMEDIATE")
+        try:
+            c.execute(
+                "INSERT OR REPLACE INTO audit_wal_dead (seq, event_id, status, updated_at, row_json, attempts, error, failed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (seq, data.get("EventId"), data.get("Status"), data.get("UpdatedAt"), body, row[4] + 1,
+                 str(error)[:2000], time.time()),
+            )
+            c.execute("DELETE FROM audit_wal WHERE seq = ?", (seq,))
+            c.execute("COMMIT")
+        except Exception:
+            c.execute("ROLLBACK")
+            raise
+        logging.error("Audit WAL row %s (%s %s) moved to audit_wal_dead after %d attempts",
+                      seq, data.get("EventId"), data.get("Status"), row[4] + 1)
+        counter_add("vigia_audit_wal_dead_letters_total")
+
+    def drain(self, timeout_s: float = 30.0) -> bool:
+        """Flush until the log is empty (tests, benchmarks, shutdown)."""
+        deadline = time.monotonic() + timeout_s
+        while time.monotonic() < deadline:
+            if self.backlog()[0] == 0:
+                return True
+            if not self.flush_once():
+                time.sleep(0.05)
+        return self.backlog()[0] == 0
+
+    def _publish(self):
+        n, lag = self.backlog()
+        gauge_set("vigia_audit_wal_backlog_rows", n)
+        gauge_set("vigia_audit_wal_lag_seconds", round(lag, 3))
+        gauge_set("vigia_audit_wal_dead_rows", self._conn().execute("SELECT COUNT(*) FROM audit_wal_dead").fetchone()[0])
+
+
+_WAL = {}
+_WAL_LOCK = threading.Lock()
+
+
+def _audit_wal_enabled() -> bool:
+    return (os.environ.get("AUDIT_WAL_MODE") or "off").strip().lower() in ("on", "true", "1")
+
+
+def _audit_wal(flush_fn):
+    """
+    Per-process WAL (created on first use, which also starts replay of anything
+    left unflushed by a previous process). None when AUDIT_WAL_MODE is off.
+    """
+    if not _audit_wal_enabled():
+        return None
+    wal = _WAL.get("wal")
+    if wal is not None:
+        return wal
+
+    with _WAL_LOCK:
+        if "wal" not in _WAL:
+            directory = os.environ.get("AUDIT_WAL_DIR") or os.path.join(tempfile.gettempdir(), "vigia-audit-wal")
+            wal = AuditWAL(
+                os.path.join(directory, "audit_wal.sqlite3"),
+                flush_fn,
+                _parse_int(os.environ.get("AUDIT_WAL_BATCH_MAX_ROWS", "500"), 500, 1, 10000),
+                _parse_int(os.environ.get("AUDIT_WAL_BATCH_MAX_BYTES", "4000000"), 4000000, 1024, 64000000),
+                _parse_int(os.environ.get("AUDIT_WAL_FLUSH_INTERVAL_MS", "500"), 500, 10, 60000) / 1000.0,
+                _parse_int(os.environ.get("AUDIT_WAL_CLAIM_LEASE_SECONDS", "60"), 60, 1, 3600),
+                _parse_int(os.environ.get("AUDIT_WAL_MAX_ATTEMPTS", "5"), 5, 1, 100),
+            )
+            wal.start()
+            atexit.register(
+                wal.drain, _parse_int(os.environ.get("AUDIT_WAL_SHUTDOWN_FLUSH_SECONDS", "5"), 5, 0, 300)
+            )
+            _WAL["wal"] = wal
+        return _WAL["wal"]
\ No newline at end of file
@@ -1,44 +1,243 @@
 import os
+import time
+import logging
 import threading
 
-from ..core.config import require_env
+from ..core.config import _parse_int, get_kusto_db_name, require_env
+from ..core.telemetry import counter_add, histogram_record, span
 
 
-_CLIENTS = {}  # lazy singletons per worker
-_LOCK = threading.Lock()
+# ---------- Client registry ----------
+#
+# One lazily built client per name and process. get() builds under a per-name lock
+# with a double check, so concurrent cold starts build each client once. Entries are
+# owned by the process that built them. After a fork the child drops them, including
+# locks a parent thread may have held, and builds its own.
+#
+# Recycling:
+#   max_idle_s - an entry unused for longer is health-checked (or rebuilt when it has
+#                no check): idle keep-alive connections are dropped by load balancers
+#   max_age_s  - an entry older than this is rebuilt (cached flags, service certificates)
+#   invalidate - callers drop an entry after a connection error
+# Entries installed with put() (offline stand-ins) are pinned and never recycled.
+#
+# HTTP pools are sized to the concurrency that can use them (<BACKEND>_POOL_SIZE overrides):
+#   kusto  - worker threads (PYTHON_THREADPOOL_THREAD_COUNT) + background note workers
+#   agents - VERIFICATION_AGENT_MAX_CONCURRENCY + AGENT_NOTE_WORKERS
+#   ledger - LEDGER_MAX_INFLIGHT + 2
+#   storage - 4
+
+class _Entry:
+    __slots__ = ("value", "built_at", "used_at", "pinned")
+
+    def __init__(self, value, now: float, pinned: bool = False):
+        self.value = value
+        self.built_at = now
+        self.used_at = now
+        self.pinned = pinned
+
+
+class ClientRegistry:
+    """Per-process lazy singletons with double-checked builds, recycling and fork ownership."""
+
+    def __init__(self):
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._build_locks = {}
+        self._entries = {}
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._after_fork)
+
+    def _after_fork(self):
+        if self._pid == os.getpid():
+            return
+        # locks may have been held by parent threads that do not exist in the child
+        self._lock = threading.Lock()
+        self._build_locks = {}
+        dropped = [n for n, e in self._entries.items() if not e.pinned]
+        self._entries = {n: e for n, e in self._entries.items() if e.pinned}
+        self._pid = os.getpid()
+        for name in dropped:
+            counter_add("vigia_client_recycles_total", client=name, reason="fork")
+
+    def _build_lock(self, name: str) -> threading.Lock:
+        with self._lock:
+            return self._build_locks.setdefault(name, threading.Lock())
+
+    def _usable(self, name: str, e: _Entry, now: float, max_idle_s, max_age_s, health) -> bool:
+        if e.pinned:
+            return True
+        if max_age_s is not None and now - e.built_at > max_age_s:
+            counter_add("vigia_client_recycles_total", client=name, reason="age")
+            return False
+        if max_idle_s is not None and now - e.used_at > max_idle_s:
+            try:
+                ok = health is not None and bool(health(e.value))
+            except Exception:
+                logging.warning("Health check for client %s failed", name, exc_info=True)
+                ok = False
+            if not ok:
+                counter_add("vigia_client_recycles_total", client=name, reason="idle" if health is None else "health")
+            return ok
+        return True
+
+    def get(self, name: str, factory, max_idle_s: float = None, max_age_s: float = None, health=None):
+        """The entry for `name`, built with factory() when missing or recycled."""
+        if self._pid != os.getpid():
+            self._after_fork()
+        seen = self._entries.get(name)
+        now = time.monotonic()
+        if seen is not None and self._usable(name, seen, now, max_idle_s, max_age_s, health):
+            seen.used_at = now
+            counter_add("vigia_client_reuse_total", client=name)
+            return seen.value
+
+        with self._build_lock(name):
+            current = self._entries.get(name)
+            if current is not None and current is not seen:
+                # another thread built (or rebuilt) it while we waited
+                current.used_at = time.monotonic()
+                counter_add("vigia_client_reuse_total", client=name)
+                return current.value
+            t0 = time.perf_counter()
+            value = factory()
+            histogram_record("vigia_client_build_ms", (time.perf_counter() - t0) * 1000.0, client=name)
+            counter_add("vigia_client_builds_total", client=name)
+            self._entries[name] = _Entry(value, time.monotonic())
+            return value
+
+    def put(self, name: str, value):
+        """Install a pinned entry (offline stand-ins); it is never recycled."""
+        with self._lock:
+            self._entries[name] = _Entry(value, time.monotonic(), pinned=True)
+
+    def pop(self, name: str):
+        with self._lock:
+            e = self._entries.pop(name, None)
+        return e.value if e is not None else None
+
+    def peek(self, name: str):
+        """The current entry without building or touching it, or None."""
+        e = self._entries.get(name)
+        return e.value if e is not None else None
+
+    def invalidate(self, name: str, reason: str = "error"):
+        """Drop a built (not pinned) entry so the next get() rebuilds it."""
+        with self._lock:
+            e = self._entries.get(name)
+            if e is None or e.pinned:
+                return
+            del self._entries[name]
+        counter_add("vigia_client_recycles_total", client=name, reason=reason)
+
+
+_REGISTRY = ClientRegistry()
+
+
+def _client_max_idle_s() -> int:
+    return _parse_int(os.environ.get("CLIENT_MAX_IDLE_SECONDS", "240"), 240, 10, 86400)
+
+
+def _worker_threads() -> int:
+    default = min(32, (os.cpu_count() or 1) + 4)  # Python worker default
+    return _parse_int(os.environ.get("PYTHON_THREADPOOL_THREAD_COUNT", str(default)), default, 1, 256)
+
+
+def _pool_size(backend: str) -> int:
+    note_workers = _parse_int(os.environ.get("AGENT_NOTE_WORKERS", "4"), 4, 1, 64)
+    defaults = {
+        "kusto": _worker_threads() + note_workers,
+        "agents": _parse_int(os.environ.get("VERIFICATION_AGENT_MAX_CONCURRENCY", "8"), 8, 1, 256) + note_workers,
+        "ledger": _parse_int(os.environ.get("LEDGER_MAX_INFLIGHT", "8"), 8, 1, 256) + 2,
+        "storage": 4,
+    }
+    default = defaults.get(backend, 10)
+    return _parse_int(os.environ.get(f"{backend.upper()}_POOL_SIZE", str(default)), default, 1, 512)
+
+
+def _pooled_transport(backend: str):
+    """azure-core transport whose requests session keeps _pool_size(backend) connections per host."""
+    import requests
+    from requests.adapters import HTTPAdapter
+    from azure.core.pipeline.transport import RequestsTransport
+
+    size = _pool_size(backend)
+    session = requests.Session()
+    session.mount("https://", HTTPAdapter(pool_connections=size, pool_maxsize=size))
+    return RequestsTransport(session=session)
+
+
+def _is_connection_error(e: Exception) -> bool:
+    names = {c.__name__ for c in type(e).__mro__}
+    return bool(names & {"ConnectionError", "ServiceRequestError", "KustoNetworkError"})
 
 
 def get_auth_credential():
-    with _LOCK:
-        if "credential" not in _CLIENTS:
-            from azure.identity import DefaultAzureCredential
-            _CLIENTS["credential"] = DefaultAzureCredential()
-        return _CLIENTS["credential"]
+    def _build():
+        from azure.identity import DefaultAzureCredential
+        return DefaultAzureCredential()
 
+    return _REGISTRY.get("credential", _build)
 
-# ---------- Lazy client factories ----------
 
-def get_kusto_client():
-    if "kusto" in _CLIENTS:
-        return _CLIENTS["kusto"]
+# ---------- Lazy client factories ----------
 
+def _build_kusto_client(cluster: str = None):
     from azure.kusto.data import KustoClient, KustoConnectionStringBuilder
 
-    cluster = require_env("FABRIC_KUSTO_CLUSTER")
+    cluster = cluster or require_env("FABRIC_KUSTO_CLUSTER")
     kcsb = KustoConnectionStringBuilder.with_azure_token_credential(
         cluster, get_auth_credential()
     )
     client = KustoClient(kcsb)
 
-    with _LOCK:
-        _CLIENTS["kusto"] = client
+    # KustoClient keeps its requests session private; resize its pool when it is there
+    session = getattr(client, "_session", None)
+    if session is not None:
+        try:
+            size = _pool_size("kusto")
+            old = session.get_adapter(cluster)
+            kwargs = {"socket_options": old.socket_options} if getattr(old, "socket_options", None) else {}
+            session.mount("https://", type(old)(pool_connections=size, pool_maxsize=size, **kwargs))
+        except Exception:
+            logging.warning("Could not resize the Kusto connection pool", exc_info=True)
     return client
 
 
-def get_project_client():
-    if "project_client" in _CLIENTS:
-        return _CLIENTS["project_client"]
+def _kusto_healthy(client) -> bool:
+    client.execute_mgmt(get_kusto_db_name(), ".show version")
+    return True
 
+
+def _kusto_client_name(cluster: str = None) -> str:
+    """Registry name of the client for `cluster`; the leader (FABRIC_KUSTO_CLUSTER) is "kusto"."""
+    if not cluster or cluster == os.environ.get("FABRIC_KUSTO_CLUSTER"):
+        return "kusto"
+    return f"kusto:{cluster}"
+
+
+def get_kusto_client(cluster: str = None):
+    """Client for the leader cluster, or for `cluster` (e.g. a follower) when given."""
+    name = _kusto_client_name(cluster)
+    if name == "kusto":
+        return _REGISTRY.get("kusto", _build_kusto_client, max_idle_s=_client_max_idle_s(), health=_kusto_healthy)
+    # no health check: a follower may not attach the leader's database name
+    return _REGISTRY.get(name, lambda: _build_kusto_client(cluster), max_idle_s=_client_max_idle_s())
+
+
+def get_kusto_request_properties():
+    """
+    Returns the ClientRequestProperties class (azure.kusto.data) used for per-query
+    options. Cached like the clients so offline stand-ins can replace it.
+    """
+    def _load():
+        from azure.kusto.data import ClientRequestProperties
+        return ClientRequestProperties
+
+    return _REGISTRY.get("kusto_request_properties", _load)
+
+
+def _build_project_client():
     from azure.ai.projects import AIProjectClient
 
     endpoint = (
@@ -49,45 +248,175 @@ def get_project_client():
     if not endpoint:
         raise RuntimeError("Missing AI project endpoint. Set AI_PROJECT_ENDPOINT (recommended).")
 
-    client = AIProjectClient(endpoint=endpoint, credential=get_auth_credential())
+    return AIProjectClient(endpoint=endpoint, credential=get_auth_credential(), transport=_pooled_transport("agents"))
 
-    with _LOCK:
-        _CLIENTS["project_client"] = client
-    return client
 
+def get_project_client():
+    return _REGISTRY.get("project_client", _build_project_client, max_idle_s=_client_max_idle_s())
 
-def get_ledger_service_cert_pem() -> str:
-    if "ledger_tls_pem" in _CLIENTS:
-        return _CLIENTS["ledger_tls_pem"]
 
+def _fetch_ledger_service_cert_pem() -> str:
     from azure.confidentialledger.certificate import ConfidentialLedgerCertificateClient
 
     ledger_id = require_env("CONFIDENTIAL_LEDGER_ID")
     identity_url = os.environ.get("CONFIDENTIAL_LEDGER_IDENTITY_URL") or "https://identity.confidential-ledger.core.azure.com"
 
-    cert_client = ConfidentialLedgerCertificateClient(identity_url)
-    ident = cert_client.get_ledger_identity(ledger_id)
+    with span("ledger.identity", round_trips=1):
+        cert_client = ConfidentialLedgerCertificateClient(identity_url)
+        ident = cert_client.get_ledger_identity(ledger_id)
     pem = ident.get("ledgerTlsCertificate")
     if not pem:
         raise RuntimeError("Unable to fetch ledgerTlsCertificate from identity service")
-
-    with _LOCK:
-        _CLIENTS["ledger_tls_pem"] = pem
     return pem
 
 
-def get_ledger_cert_path() -> str:
-    if "ledger_cert_path" in _CLIENTS and os.path.exists(_CLIENTS["ledger_cert_path"]):
-        return _CLIENTS["ledger_cert_path"]
+def _ledger_cert_max_age_s() -> int:
+    return _parse_int(os.environ.get("LEDGER_CERT_MAX_AGE_SECONDS", "86400"), 86400, 60, 30 * 86400)
+
 
+def get_ledger_service_cert_pem() -> str:
+    """Ledger TLS certificate; re-fetched after LEDGER_CERT_MAX_AGE_SECONDS (rotation)."""
+    return _REGISTRY.get("ledger_tls_pem", _fetch_ledger_service_cert_pem, max_age_s=_ledger_cert_max_age_s())
+
+
+def get_ledger_cert_path() -> str:
     pem = get_ledger_service_cert_pem()
     ledger_id = require_env("CONFIDENTIAL_LEDGER_ID")
     path = f"/tmp/acl_{ledger_id}.pem"
 
-    if not os.path.exists(path):
-        with open(path, "w") as f:
+    # rewritten when missing or when the certificate rotated
+    try:
+        with open(path, "r") as f:
+            current = f.read()
+    except FileNotFoundError:
+        current = None
+    if current != pem:
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
             f.write(pem)
+        os.replace(tmp, path)
+    return path
+
+
+def _build_ledger_client():
+    from azure.confidentialledger import ConfidentialLedgerClient
+
+    return ConfidentialLedgerClient(
+        endpoint=require_env("CONFIDENTIAL_LEDGER_URL"),
+        credential=get_auth_credential(),
+        ledger_certificate_path=get_ledger_cert_path(),
+        transport=_pooled_transport("ledger"),
+    )
+
+
+def get_ledger_client():
+    # rebuilt with the certificate: the client pins the file it was given
+    return _REGISTRY.get(
+        "ledger_client", _build_ledger_client, max_idle_s=_client_max_idle_s(), max_age_s=_ledger_cert_max_age_s()
+    )
+
+
+def get_receipt_verifier():
+    """
+    Returns the receipt verification function (azure.confidentialledger.receipt.verify_receipt).
+    Cached like the clients so offline stand-ins can replace it.
+    """
+    def _load():
+        from azure.confidentialledger.receipt import verify_receipt
+        return verify_receipt
+
+    return _REGISTRY.get("receipt_verifier", _load)
+
+
+def get_note_spill_queue_client(queue_name: str):
+    """
+    Storage queue that receives agent note jobs the in-process dispatcher could not hold.
+    Uses AGENT_NOTE_SPILL_CONNECTION (default: the AzureWebJobsStorage connection string),
+    or the identity-based AzureWebJobsStorage__accountName setting.
+    """
+    return _REGISTRY.get(f"note_spill_queue:{queue_name}", lambda: _build_note_spill_queue_client(queue_name))
+
+
+def _build_note_spill_queue_client(queue_name: str):
+    from azure.storage.queue import QueueClient, TextBase64EncodePolicy
+
+    conn = os.environ.get(os.environ.get("AGENT_NOTE_SPILL_CONNECTION") or "AzureWebJobsStorage")
+    if conn:
+        return QueueClient.from_connection_string(
+            conn, queue_name, message_encode_policy=TextBase64EncodePolicy(), transport=_pooled_transport("storage")
+        )
+    account = require_env("AzureWebJobsStorage__accountName")
+    return QueueClient(
+        f"https://{account}.queue.core.windows.net",
+        queue_name,
+        credential=get_auth_credential(),
+        message_encode_policy=TextBase64EncodePolicy(),
+        transport=_pooled_transport("storage"),
+    )
+
+
+def get_lease_container_client(container: str):
+    """
+    Blob container holding the auditor's single-flight leases (created on first use).
+    Uses AUDITOR_LEASE_CONNECTION (default: the AzureWebJobsStorage connection string),
+    or the identity-based AzureWebJobsStorage__accountName setting.
+    """
+    return _REGISTRY.get(
+        f"lease_container:{container}", lambda: _build_container_client(container, "AUDITOR_LEASE_CONNECTION")
+    )
+
+
+def get_audit_cache_container_client(container: str):
+    """
+    Blob container holding the shared audit read cache (created on first use).
+    Uses AUDIT_CACHE_CONNECTION (default: the AzureWebJobsStorage connection string),
+    or the identity-based AzureWebJobsStorage__accountName setting.
+    """
+    return _REGISTRY.get(
+        f"audit_cache_container:{container}", lambda: _build_container_client(container, "AUDIT_CACHE_CONNECTION")
+    )
+
+
+def get_profile_container_client(container: str):
+    """
+    Blob container receiving request profiles (PROFILE_SINK=blob; created on first use).
+    Uses PROFILE_CONNECTION (default: the AzureWebJobsStorage connection string),
+    or the identity-based AzureWebJobsStorage__accountName setting.
+    """
+    return _REGISTRY.get(
+        f"profile_container:{container}", lambda: _build_container_client(container, "PROFILE_CONNECTION")
+    )
+
+
+def get_reverify_checkpoint_container_client(container: str):
+    """
+    Blob container holding receipt re-verification checkpoints (created on first use).
+    Uses RECEIPT_REVERIFY_CHECKPOINT_CONNECTION (default: the AzureWebJobsStorage connection
+    string), or the identity-based AzureWebJobsStorage__accountName setting.
+    """
+    return _REGISTRY.get(
+        f"reverify_checkpoint_container:{container}",
+        lambda: _build_container_client(container, "RECEIPT_REVERIFY_CHECKPOINT_CONNECTION"),
+    )
+
+
+def _build_container_client(container: str, connection_setting: str):
+    from azure.core.exceptions import ResourceExistsError
+    from azure.storage.blob import ContainerClient
 
-    with _LOCK:
-        _CLIENTS["ledger_cert_path"] = path
-    return path
\ No newline at end of file
+    conn = os.environ.get(os.environ.get(connection_setting) or "AzureWebJobsStorage")
+    if conn:
+        client = ContainerClient.from_connection_string(conn, container, transport=_pooled_transport("storage"))
+    else:
+        account = require_env("AzureWebJobsStorage__accountName")
+        client = ContainerClient(
+            f"https://{account}.blob.core.windows.net",
+            container,
+            credential=get_auth_credential(),
+            transport=_pooled_transport("storage"),
+        )
+    try:
+        client.create_container()
+    except ResourceExistsError:
+        pass
+    return client
\ No newline at end of file
@@ -1,11 +1,10 @@
 import os
 import hashlib
-from datetime import datetime, timezone
-
 from ..core.config import _parse_int, get_kusto_db_name
 from ..core.kql import _escape_kql_string
-from ..core.timeutil import _round_float, _to_iso_datetime
-from .clients import get_kusto_client
+from ..core.report import as_report
+from .kusto import _kusto_query
+from .kusto_layout import _precomputed_keys
 
 
 # ---------- Deterministic EventId / Dedupe / Gate ----------
@@ -13,22 +12,14 @@ from .clients import get_kusto_client
 def _compute_event_id(payload: dict) -> str:
     dec = _parse_int(os.environ.get("DEDUP_LATLON_DECIMALS", "3"), 3, 1, 6)
     bucket_min = _parse_int(os.environ.get("DEDUP_TIME_BUCKET_MINUTES", "60"), 60, 1, 1440)
+    report = as_report(payload)
 
-    lat = _round_float(payload.get("Latitude"), dec)
-    lon = _round_float(payload.get("Longitude"), dec)
-    hz = (payload.get("HazardType") or "none").strip().lower()
-
-    ts_iso = _to_iso_datetime(payload.get("Timestamp"))
-    dt = datetime.fromisoformat(ts_iso.replace("Z", "+00:00"))
-    minute = (dt.minute // bucket_min) * bucket_min
-    bucketed = dt.replace(minute=minute, second=0, microsecond=0)
-    time_bucket = bucketed.astimezone(timezone.utc).isoformat()
+    def _event_id():
+        lat, lon = report.rounded(dec)
+        raw = f"{lat}|{lon}|{report.time_bucket(bucket_min)}|{report.hazard_key}|{report.evidence_hash}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
 
-    evidence = (payload.get("GaussianSplatURL") or "") + "|" + (payload.get("ReportId") or "")
-    evidence_hash = hashlib.sha256(evidence.encode("utf-8")).hexdigest()
-
-    raw = f"{lat}|{lon}|{time_bucket}|{hz}|{evidence_hash}"
-    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+    return report.cached(("event_id", dec, bucket_min), _event_id)
 
 
 def _kql_dedupe_summary(payload: dict):
@@ -36,23 +27,35 @@ def _kql_dedupe_summary(payload: dict):
     dec = _parse_int(os.environ.get("DEDUP_LATLON_DECIMALS", "3"), 3, 1, 6)
     bucket_min = _parse_int(os.environ.get("DEDUP_TIME_BUCKET_MINUTES", "60"), 60, 1, 1440)
 
-    lat = _round_float(payload.get("Latitude"), dec)
-    lon = _round_float(payload.get("Longitude"), dec)
-    hz = _escape_kql_string((payload.get("HazardType") or "none"))
-    ts_iso = _to_iso_datetime(payload.get("Timestamp"))
+    report = as_report(payload)
+    lat, lon = report.rounded(dec)
+    hz = _escape_kql_string(report.hazard_type)
+    ts_iso = report["Timestamp"]
 
     ttl_hours = _parse_int(os.environ.get("AUDIT_IDEMPOTENCY_TTL_HOURS", "24"), 24, 1, 168)
 
+    # LatB/LonB/TimeB are ingestion-time columns once the layout is provisioned (kusto_layout.py).
+    # Rows that reached RoadTelemetry without the update policy (a writer still appending
+    # to it directly) have them empty; those are keyed at query time instead.
+    if _precomputed_keys(dec, bucket_min, ttl_hours):
+        keys = (
+            f"| extend LatB = iff(isnull(LatB), round(Latitude, {dec}), LatB), "
+            f"LonB = iff(isnull(LonB), round(Longitude, {dec}), LonB), "
+            f"TimeB = iff(isnull(TimeB), bin(Timestamp, {bucket_min}m), TimeB)"
+        )
+    else:
+        keys = f"| extend LatB = round(Latitude, {dec}), LonB = round(Longitude, {dec}), TimeB = bin(Timestamp, {bucket_min}m)"
+
     q = f"""
     RoadTelemetry
     | where Timestamp > ago({ttl_hours}h)
-    | extend LatB = round(Latitude, {dec}), LonB = round(Longitude, {dec}), TimeB = bin(Timestamp, {bucket_min}m)
+    {keys}
     | where HazardType == '{hz}'
     | where LatB == {lat} and LonB == {lon}
     | where TimeB == bin(datetime({ts_iso}), {bucket_min}m)
     | summarize DuplicateCount = count(), SampleReportIds = make_set(ReportId, 20) by HazardType, LatB, LonB, TimeB
     """
-    table = get_kusto_client().execute(db, q).primary_results[0]
+    table = _kusto_query(q, "dedupe_summary", db=db)
     if not table.rows:
         group_key = f"{hz}|{lat}|{lon}|{ts_iso}"
         gid = hashlib.sha256(group_key.encode("utf-8")).hexdigest()
@@ -0,0 +1,279 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+
+import azure.functions as func
+
+from ..core.config import _parse_int, get_kusto_db_name
+from ..core.jsonx import _json_default
+from ..core.telemetry import counter_add, gauge_set, span
+from .hotspots import _geohash_bounds
+from .kusto import _kusto_query, _rows_as_dicts
+
+
+# ---------- Conditional GET + delta sync for the hazard map ----------
+#
+# HazardWatermarks (materialized view over RoadTelemetry) keeps, per HazardType and geohash
+# cell at HAZARD_WATERMARK_GEOHASH_PRECISION (default 4, ~39 x 20 km), the last ingestion
+# time and the row count. Each worker loads the whole view every
+# HAZARD_WATERMARK_REFRESH_SECONDS (default 15). Requests are answered from that snapshot:
+#   ETag          - hash of the request scope + the (last ingestion, rows) of the cells it covers
+#   Last-Modified - last ingestion time of those cells
+#   If-None-Match / If-Modified-Since that still match -> 304, no Kusto query
+# Windowed queries (time_range_hours) also change as old rows age out; their ETag carries
+# a HAZARD_ETAG_AGE_SECONDS bucket (default 300). When no snapshot is available, the ETag is
+# the hash of the response body: this saves bandwidth but not the query.
+#
+# Delta sync (since=<watermark>): only rows ingested after the watermark, plus the new
+# watermark to send next time. Rows that commit late can carry an earlier ingestion time,
+# so the query looks back HAZARD_DELTA_OVERLAP_SECONDS (default 60) further. Clients upsert
+# rows by ReportId. When the snapshot shows nothing newer in the region, the delta is
+# answered without a query.
+#
+# A 304 can lag new data by up to one snapshot refresh.
+
+HAZARD_WATERMARK_VIEW = "HazardWatermarks"
+
+_STATE = {}
+_STATE_LOCK = threading.Lock()
+_REFRESH_LOCK = threading.Lock()
+
+
+def _watermark_precision() -> int:
+    return _parse_int(os.environ.get("HAZARD_WATERMARK_GEOHASH_PRECISION", "4"), 4, 2, 6)
+
+
+def _watermark_view_command(precision: int = None, cell_column: str = None) -> str:
+    """
+    Control command creating HazardWatermarks. `cell_column` names a precomputed geohash
+    column of higher precision (see kusto_layout.py); its prefix is the coarser cell.
+    """
+    precision = precision or _watermark_precision()
+    cell = f"geo_point_to_geohash(Longitude, Latitude, {precision})"
+    if cell_column:
+        cell = f"iff(isempty({cell_column}), {cell}, substring({cell_column}, 0, {precision}))"
+    return (
+        f".create-or-alter materialized-view with (backfill=true) {HAZARD_WATERMARK_VIEW} on table RoadTelemetry\n"
+        "{\n"
+        "    RoadTelemetry\n"
+        f"    | extend Cell = {cell}\n"
+        "    | summarize LastIngest = max(ingestion_time()), Rows = count() by HazardType, Cell\n"
+        "}"
+    )
+
+
+class WatermarkIndex:
+    """Snapshot of HazardWatermarks: per (HazardType, cell) last ingestion (epoch s) and row count."""
+
+    def __init__(self, rows, loaded_at: float):
+        self.loaded_at = loaded_at
+        self._cells = []  # (hazard_type, lat_lo, lat_hi, lon_lo, lon_hi, last_s, rows)
+        for r in rows:
+            cell = str(r.get("Cell") or "")
+            last = r.get("LastIngest")
+            if not cell or last is None:
+                continue
+            if isinstance(last, str):
+                last = datetime.fromisoformat(last.replace("Z", "+00:00"))
+            if last.tzinfo is None:
+                last = last.replace(tzinfo=timezone.utc)
+            self._cells.append((str(r.get("HazardType") or ""), *_geohash_bounds(cell), last.timestamp(), int(r.get("Rows") or 0)))
+
+    def __len__(self):
+        return len(self._cells)
+
+    def scope(self, s=None, n=None, w=None, e=None, hazard_type: str = None):
+        """(last ingestion epoch s or None, rows) over the cells that overlap the bounds / match the type."""
+        last, total = None, 0
+        for ht, lat_lo, lat_hi, lon_lo, lon_hi, last_s, rows in self._cells:
+            if hazard_type is not None and ht != hazard_type:
+                continue
+            if s is not None and (lat_hi < s or lat_lo > n or lon_hi < w or lon_lo > e):
+                continue
+            total += rows
+            if last is None or last_s > last:
+                last = last_s
+        return last, total
+
+
+def _load_watermarks() -> WatermarkIndex:
+    db = get_kusto_db_name()
+    q = f"{HAZARD_WATERMARK_VIEW} | project HazardType, Cell, LastIngest, Rows"
+    try:
+        with span("hazard_sync.watermarks", source="view"):
+            rows = _rows_as_dicts(_kusto_query(q, "hazard_watermarks", db=db))
+    except Exception:
+        # view not provisioned yet: same aggregate over the table
+        logging.warning("Could not read %s; computing watermarks from RoadTelemetry", HAZARD_WATERMARK_VIEW, exc_info=True)
+        q = (
+            "RoadTelemetry "
+            f"| extend Cell = geo_point_to_geohash(Longitude, Latitude, {_watermark_precision()}) "
+            "| summarize LastIngest = max(ingestion_time()), Rows = count() by HazardType, Cell"
+        )
+        with span("hazard_sync.watermarks", source="table"):
+            rows = _rows_as_dicts(_kusto_query(q, "hazard_watermarks_table", db=db))
+    return WatermarkIndex(rows, time.monotonic())
+
+
+def _watermarks():
+    """Current WatermarkIndex, refreshed by one caller at a time; None if it cannot be loaded."""
+    index = _STATE.get("index")
+    refresh_s = _parse_int(os.environ.get("HAZARD_WATERMARK_REFRESH_SECONDS", "15"), 15, 1, 3600)
+    if index is not None and time.monotonic() - index.loaded_at < refresh_s:
+        return index
+    if time.monotonic() - _STATE.get("failed_at", float("-inf")) < refresh_s:
+        return index  # the last load failed; do not retry on every request
+    # others keep answering from the previous snapshot while one request reloads it
+    if not _REFRESH_LOCK.acquire(blocking=index is None):
+        return index
+    try:
+        index = _STATE.get("index")
+        if index is None or time.monotonic() - index.loaded_at >= refresh_s:
+            try:
+                index = _load_watermarks()
+            except Exception:
+                logging.warning("Hazard watermark refresh failed", exc_info=True)
+                counter_add("vigia_hazard_watermark_refresh_total", outcome="error")
+                with _STATE_LOCK:
+                    _STATE["failed_at"] = time.monotonic()
+                return index
+            with _STATE_LOCK:
+                _STATE["index"] = index
+            counter_add("vigia_hazard_watermark_refresh_total", outcome="ok")
+            gauge_set("vigia_hazard_watermark_cells", len(index))
+        return index
+    finally:
+        _REFRESH_LOCK.release()
+
+
+# --- validators ---
+
+def _age_bucket() -> int:
+    return int(time.time()) // _parse_int(os.environ.get("HAZARD_ETAG_AGE_SECONDS", "300"), 300, 1, 86400)
+
+
+def _etag(*parts) -> str:
+    raw = "|".join(json.dumps(p, sort_keys=True, default=str) for p in parts)
+    return 'W/"' + hashlib.sha256(raw.encode("utf-8")).hexdigest()[:32] + '"'
+
+
+def _http_date(epoch_s: float) -> str:
+    return format_datetime(datetime.fromtimestamp(int(epoch_s), tz=timezone.utc), usegmt=True)
+
+
+def _not_modified(req: func.HttpRequest, etag: str, last_s: float = None) -> bool:
+    """RFC 9110 evaluation: If-None-Match wins over If-Modified-Since."""
+    inm = req.headers.get("If-None-Match")
+    if inm:
+        tags = [t.strip() for t in inm.split(",")]
+        weak = etag[2:] if etag.startswith("W/") else etag
+        return "*" in tags or any((t[2:] if t.startswith("W/") else t) == weak for t in tags)
+    ims = req.headers.get("If-Modified-Since")
+    if ims and last_s is not None:
+        try:
+            return int(last_s) <= parsedate_to_datetime(ims).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def _validator_headers(etag: str, last_s: float = None) -> dict:
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if last_s is not None:
+        headers["Last-Modified"] = _http_date(last_s)
+    return headers
+
+
+def _scope_validators(scope: dict, windowed: bool, s=None, n=None, w=None, e=None, hazard_type: str = None):
+    """(etag, last_modified_s) from the watermark snapshot, or (None, None) without one."""
+    index = _watermarks()
+    if index is None:
+        return None, None
+    last_s, rows = index.scope(s, n, w, e, hazard_type=hazard_type)
+    parts = [scope, last_s, rows]
+    if windowed:
+        parts.append(_age_bucket())
+    return _etag(*parts), last_s
+
+
+def _conditional_json(req: func.HttpRequest, endpoint: str, produce, etag: str = None, last_s: float = None,
+                      watermark: bool = False):
+    """
+    304 when the client's validators still match `etag`; otherwise the JSON body from
+    produce(). Without an etag (no snapshot) the ETag is the body hash. With `watermark`,
+    X-Hazard-Watermark carries the since= value for the client's first delta.
+    """
+    headers = {}
+    if watermark and last_s is not None:
+        headers["X-Hazard-Watermark"] = datetime.fromtimestamp(last_s, tz=timezone.utc).isoformat()
+    if etag is not None and _not_modified(req, etag, last_s):
+        counter_add("vigia_hazard_sync_total", endpoint=endpoint, outcome="not_modified")
+        return func.HttpResponse(status_code=304, headers={**_validator_headers(etag, last_s), **headers})
+
+    body = json.dumps(produce(), ensure_ascii=False, default=_json_default)
+    if etag is None:
+        etag = _etag(body)
+        if _not_modified(req, etag):
+            counter_add("vigia_hazard_sync_total", endpoint=endpoint, outcome="not_modified_body")
+            return func.HttpResponse(status_code=304, headers=_validator_headers(etag))
+    counter_add("vigia_hazard_sync_total", endpoint=endpoint, outcome="full")
+    return func.HttpResponse(
+        body, status_code=200, headers={**_validator_headers(etag, last_s), **headers}, mimetype="application/json"
+    )
+
+
+# --- delta ---
+
+def _parse_since(since: str) -> datetime:
+    try:
+        dt = datetime.fromisoformat(str(since).strip().replace("Z", "+00:00"))
+    except ValueError:
+        raise ValueError(f"Invalid since watermark: {since}")
+    return dt.replace(tzinfo=timezone.utc) if dt.tzinfo is None else dt.astimezone(timezone.utc)
+
+
+def _regional_delta(s: float, n: float, w: float, e: float, since: str) -> dict:
+    """Rows in the bounds ingested after `since`, with the watermark to send next time."""
+    since_dt = _parse_since(since)
+    since_iso = since_dt.isoformat()
+
+    index = _watermarks()
+    last_s = None
+    if index is not None:
+        last_s, _ = index.scope(s, n, w, e)
+        if last_s is None or last_s <= since_dt.timestamp():
+            counter_add("vigia_hazard_sync_total", endpoint="regional", outcome="delta_empty")
+            return {"since": since_iso, "watermark": since_iso, "hazards": [], "delta": True}
+
+    overlap_s = _parse_int(os.environ.get("HAZARD_DELTA_OVERLAP_SECONDS", "60"), 60, 0, 3600)
+    after = (since_dt - timedelta(seconds=overlap_s)).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+    query = (
+        "RoadTelemetry "
+        f"| where ingestion_time() > datetime({after}) "
+        f"| where Latitude between({s} .. {n}) "
+        f"| where Longitude between({w} .. {e}) "
+        "| where ConfidenceScore > 0.7 "
+        "| extend IngestedAt = ingestion_time() "
+        "| project ReportId, Latitude, Longitude, HazardType, ConfidenceScore, GForceZ, GaussianSplatURL, IngestedAt"
+    )
+    rows = _rows_as_dicts(_kusto_query(query, "regional_hazards_delta", db=get_kusto_db_name()))
+
+    # rows up to the snapshot's last ingestion were all returned (or filtered out)
+    watermark = since_dt
+    if last_s is not None:
+        watermark = max(watermark, datetime.fromtimestamp(last_s, tz=timezone.utc))
+    for r in rows:
+        t = r.get("IngestedAt")
+        if isinstance(t, str):
+            t = _parse_since(t)
+        elif isinstance(t, datetime) and t.tzinfo is None:
+            t = t.replace(tzinfo=timezone.utc)
+        if isinstance(t, datetime) and t > watermark:
+            watermark = t
+    counter_add("vigia_hazard_sync_total", endpoint="regional", outcome="delta")
+    return {"since": since_iso, "watermark": watermark.isoformat(), "hazards": rows, "delta": True}
\ No newline at end of file
@@ -0,0 +1,243 @@
+import os
+import heapq
+import threading
+from datetime import datetime, timezone
+
+from ..core.config import _parse_int
+from ..core.kql import _escape_kql_string
+from ..core.telemetry import counter_add
+from ..core.report import as_report
+
+
+# ---------- Hazard hotspots on a geohash grid ----------
+#
+# Two aggregate granularities, both keyed by (HazardType, geohash Cell, TimeBin):
+#   hourly  - HazardHotspots1h materialized view / in-process hour buckets (48h kept)
+#   daily   - HazardHotspots1d materialized view / in-process day buckets (8d kept)
+# A window of up to 168h is answered from at most ~48 hourly + 7 daily bins:
+# hourly bins for the partial first day and for today, daily bins in between.
+# Cost is bounded by the bin count, not by the number of raw rows in the window.
+
+HOTSPOT_VIEW_HOURLY = "HazardHotspots1h"
+HOTSPOT_VIEW_DAILY = "HazardHotspots1d"
+
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+_HOUR = 3600
+_DAY = 86400
+
+
+def _hotspot_precision() -> int:
+    return _parse_int(os.environ.get("HOTSPOT_GEOHASH_PRECISION", "7"), 7, 4, 9)
+
+
+def _geohash(lat: float, lon: float, precision: int) -> str:
+    lat_lo, lat_hi, lon_lo, lon_hi = -90.0, 90.0, -180.0, 180.0
+    out, bits, ch, even = [], 0, 0, True
+    while len(out) < precision:
+        if even:
+            mid = (lon_lo + lon_hi) / 2
+            if lon >= mid:
+                ch, lon_lo = (ch << 1) | 1, mid
+            else:
+                ch, lon_hi = ch << 1, mid
+        else:
+            mid = (lat_lo + lat_hi) / 2
+            if lat >= mid:
+                ch, lat_lo = (ch << 1) | 1, mid
+            else:
+                ch, lat_hi = ch << 1, mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            out.append(_BASE32[ch])
+            bits, ch = 0, 0
+    return "".join(out)
+
+
+def _geohash_bounds(cell: str):
+    """(lat_lo, lat_hi, lon_lo, lon_hi) of a geohash cell."""
+    lat_lo, lat_hi, lon_lo, lon_hi = -90.0, 90.0, -180.0, 180.0
+    even = True
+    for c in cell:
+        v = _BASE32.index(c)
+        for shift in range(4, -1, -1):
+            bit = (v >> shift) & 1
+            if even:
+                mid = (lon_lo + lon_hi) / 2
+                lon_lo, lon_hi = (mid, lon_hi) if bit else (lon_lo, mid)
+            else:
+                mid = (lat_lo + lat_hi) / 2
+                lat_lo, lat_hi = (mid, lat_hi) if bit else (lat_lo, mid)
+            even = not even
+    return lat_lo, lat_hi, lon_lo, lon_hi
+
+
+def _geohash_center(cell: str):
+    lat_lo, lat_hi, lon_lo, lon_hi = _geohash_bounds(cell)
+    return round((lat_lo + lat_hi) / 2, 6), round((lon_lo + lon_hi) / 2, 6)
+
+
+def _window_bins(now_s: float, hours: int):
+    """(first hourly bin, first full day, start of today) for a window ending now."""
+    since = now_s - hours * _HOUR
+    return since - since % _HOUR, since - since % _DAY + _DAY, now_s - now_s % _DAY
+
+
+# ---------- Kusto materialized views ----------
+
+def _hotspot_view_commands(precision: int = None, cell_column: str = None) -> list:
+    """
+    Control commands creating the hourly and daily hotspot views over RoadTelemetry.
+    `cell_column` names a precomputed geohash column (see kusto_layout.py); rows
+    ingested before it existed fall back to computing the cell.
+    """
+    precision = precision or _hotspot_precision()
+    cell = f"geo_point_to_geohash(Longitude, Latitude, {precision})"
+    if cell_column:
+        cell = f"iff(isempty({cell_column}), {cell}, {cell_column})"
+    cmds = []
+    for view, grain in ((HOTSPOT_VIEW_HOURLY, "1h"), (HOTSPOT_VIEW_DAILY, "1d")):
+        cmds.append(
+            f".create-or-alter materialized-view with (backfill=true) {view} on table RoadTelemetry\n"
+            "{\n"
+            "    RoadTelemetry\n"
+            f"    | extend Cell = {cell}\n"
+            "    | summarize Count = count(), ConfidenceSum = sum(todouble(ConfidenceScore)), LastSeen = max(Timestamp)\n"
+            f"        by HazardType, Cell, TimeBin = bin(Timestamp, {grain})\n"
+            "}"
+        )
+    return cmds
+
+
+def _kql_hotspot_topk(hazard_type: str, hours: int, k: int) -> str:
+    ht = _escape_kql_string(hazard_type)
+    return f"""
+        let since = ago({hours}h);
+        let firstDay = startofday(since) + 1d;
+        let today = startofday(now());
+        union
+            ({HOTSPOT_VIEW_HOURLY}
+                | where HazardType == '{ht}' and TimeBin >= bin(since, 1h)
+                | where TimeBin < firstDay or TimeBin >= today),
+            ({HOTSPOT_VIEW_DAILY}
+                | where HazardType == '{ht}' and TimeBin >= firstDay and TimeBin < today)
+        | summarize Count = sum(Count), ConfidenceSum = sum(ConfidenceSum), LastSeen = max(LastSeen) by Cell
+        | top {k} by Count
+        | extend Center = geo_geohash_to_central_point(Cell)
+        | project Cell, Latitude = todouble(Center.coordinates[1]), Longitude = todouble(Center.coordinates[0]),
+                  Count, AvgConfidence = round(ConfidenceSum / Count, 4), LastSeen
+        """
+
+
+# ---------- In-process rolling aggregator ----------
+
+class HotspotAggregator:
+    """
+    Hour and day buckets of per-cell counts, fed by the auditor for every new event.
+    Covers only the reports this worker has seen since it started.
+    """
+
+    def __init__(self, precision: int, keep_hours: int = 48, keep_days: int = 8):
+        self.precision = precision
+        self.keep_hours = keep_hours
+        self.keep_days = keep_days
+        self._lock = threading.Lock()
+        self._hours = {}  # hazard_type -> {bin_start: {cell: [count, conf_sum, last_seen]}}
+        self._days = {}
+        self._pruned_at = 0.0
+
+    def record(self, hazard_type: str, lat: float, lon: float, ts_s: float, confidence: float, now_s: float):
+        if ts_s < now_s - self.keep_days * _DAY or ts_s > now_s + _HOUR:
+            return
+        cell = _geohash(lat, lon, self.precision)
+        with self._lock:
+            for buckets, grain in ((self._hours, _HOUR), (self._days, _DAY)):
+                b = buckets.setdefault(hazard_type, {}).setdefault(ts_s - ts_s % grain, {})
+                agg = b.get(cell)
+                if agg is None:
+                    b[cell] = [1, confidence, ts_s]
+                else:
+                    agg[0] += 1
+                    agg[1] += confidence
+                    agg[2] = max(agg[2], ts_s)
+            if now_s - self._pruned_at > _HOUR:
+                self._prune(now_s)
+
+    def _prune(self, now_s: float):
+        # caller holds self._lock
+        self._pruned_at = now_s
+        for buckets, cutoff in ((self._hours, now_s - self.keep_hours * _HOUR), (self._days, now_s - self.keep_days * _DAY)):
+            for per_type in buckets.values():
+                for start in [s for s in per_type if s < cutoff]:
+                    del per_type[start]
+
+    def top(self, hazard_type: str, hours: int, k: int, now_s: float) -> list:
+        """
+        Top-k cells over the window. When the window's partial first day is older than
+        the hourly buckets kept, that day is counted from its whole daily bucket.
+        """
+        first_hour, first_day, today = _window_bins(now_s, hours)
+        first_daily = first_day
+        if first_hour < now_s - self.keep_hours * _HOUR and first_day < today:
+            first_hour, first_daily = first_day, first_day - _DAY
+        merged = {}
+        with self._lock:
+            parts = [
+                (b for s, b in self._hours.get(hazard_type, {}).items()
+                 if s >= first_hour and (s < first_day or s >= today)),
+                (b for s, b in self._days.get(hazard_type, {}).items() if first_daily <= s < today),
+            ]
+            for part in parts:
+                for bucket in part:
+                    for cell, (n, conf, last) in bucket.items():
+                        m = merged.get(cell)
+                        if m is None:
+                            merged[cell] = [n, conf, last]
+                        else:
+                            m[0] += n
+                            m[1] += conf
+                            m[2] = max(m[2], last)
+
+        out = []
+        for cell, (n, conf, last) in heapq.nlargest(k, merged.items(), key=lambda kv: kv[1][0]):
+            lat, lon = _geohash_center(cell)
+            out.append({
+                "Cell": cell,
+                "Latitude": lat,
+                "Longitude": lon,
+                "Count": n,
+                "AvgConfidence": round(conf / n, 4),
+                "LastSeen": datetime.fromtimestamp(last, tz=timezone.utc).isoformat(),
+            })
+        return out
+
+
+_AGGREGATOR = {}
+_AGGREGATOR_LOCK = threading.Lock()
+
+
+def _hotspot_aggregator() -> HotspotAggregator:
+    agg = _AGGREGATOR.get("local")
+    if agg is None:
+        with _AGGREGATOR_LOCK:
+            agg = _AGGREGATOR.setdefault("local", HotspotAggregator(_hotspot_precision()))
+    return agg
+
+
+def _hotspot_record(payload: dict):
+    """Feed one report into the in-process aggregator (never raises)."""
+    try:
+        report = as_report(payload)
+    except ValueError:
+        return
+    if report.latitude is None or report.longitude is None:
+        return
+    _hotspot_aggregator().record(
+        report.hazard_type,
+        report.latitude,
+        report.longitude,
+        report.timestamp.timestamp(),
+        report.confidence,
+        datetime.now(timezone.utc).timestamp(),
+    )
+    counter_add("vigia_hotspot_records_total")
\ No newline at end of file
@@ -0,0 +1,203 @@
+import os
+import time
+import functools
+import threading
+import contextvars
+from datetime import timedelta
+
+from ..core.config import _parse_int, get_kusto_db_name
+from ..core.telemetry import counter_add, gauge_set, histogram_record, span
+from .clients import _REGISTRY, _is_connection_error, _kusto_client_name, get_kusto_client, get_kusto_request_properties
+
+
+# ---------- Connection profiles ----------
+#
+# Every query runs under a profile. Routes pick one with @kusto_profile(name) (below
+# @profiled); everything else, incl. the auditor and background workers, runs under
+# pipeline. KUSTO_ROUTE_PROFILES (function=profile,... e.g. audit_latest=pipeline)
+# overrides the decorator per route.
+#
+#   pipeline  - strong consistency on the leader (FABRIC_KUSTO_CLUSTER / database):
+#               the auditor's own reads see its writes
+#   dashboard - hazard map and audit read routes: weak consistency, optionally on a
+#               follower cluster / database, with its own timeout and concurrency cap so
+#               heavy map queries cannot take every worker thread
+#
+# Per profile (<P> = PIPELINE | DASHBOARD):
+#   KUSTO_<P>_CONSISTENCY     - strong | weak | affinitized_weak | database_affinitized_weak
+#                               (default pipeline strong, dashboard weak)
+#   KUSTO_<P>_CLUSTER, _DB    - target cluster / database (default: the leader's)
+#   KUSTO_<P>_TIMEOUT_SECONDS - server timeout per query (default pipeline 30, dashboard 20)
+#   KUSTO_<P>_MAX_CONCURRENT  - queries in flight per worker, 0 = no limit
+#                               (default pipeline 0, dashboard 4)
+#   KUSTO_<P>_QUEUE_SECONDS   - wait for a slot before KustoBusyError (default 2)
+#
+# Weakly consistent reads may lag the leader by seconds (minutes on a follower), so a
+# dashboard read can miss a transition the pipeline just wrote. Control commands
+# (.append, .set-or-append, layout) always go to the leader.
+
+KUSTO_PROFILES = ("pipeline", "dashboard")
+
+_CONSISTENCY = {
+    "strong": "strongconsistency",
+    "weak": "weakconsistency",
+    "affinitized_weak": "affinitizedweakconsistency",
+    "database_affinitized_weak": "databaseaffinitizedweakconsistency",
+}
+
+_DEFAULTS = {
+    # consistency, timeout s, max concurrent
+    "pipeline": ("strong", 30, 0),
+    "dashboard": ("weak", 20, 4),
+}
+
+_CURRENT_PROFILE = contextvars.ContextVar("vigia_kusto_profile", default="pipeline")
+
+_STATE = {}
+_STATE_LOCK = threading.Lock()
+
+
+class KustoBusyError(RuntimeError):
+    """A profile's concurrency cap was reached and no slot freed up in its queue time."""
+
+    def __init__(self, profile: str, retry_after_s: int):
+        super().__init__(f"Kusto profile '{profile}' is at its concurrency limit")
+        self.profile = profile
+        self.retry_after_s = retry_after_s
+
+
+class KustoProfile:
+    """Target, request properties and in-flight cap of one profile (read from the environment once)."""
+
+    def __init__(self, name: str):
+        consistency, timeout_s, max_concurrent = _DEFAULTS[name]
+        env = f"KUSTO_{name.upper()}"
+        mode = (os.environ.get(f"{env}_CONSISTENCY") or consistency).strip().lower()
+        self.name = name
+        self.consistency = mode if mode in _CONSISTENCY else consistency
+        self.cluster = (os.environ.get(f"{env}_CLUSTER") or "").strip() or None
+        self.database = (os.environ.get(f"{env}_DB") or "").strip() or None
+        self.timeout_s = _parse_int(os.environ.get(f"{env}_TIMEOUT_SECONDS", str(timeout_s)), timeout_s, 1, 3600)
+        self.max_concurrent = _parse_int(
+            os.environ.get(f"{env}_MAX_CONCURRENT", str(max_concurrent)), max_concurrent, 0, 1024
+        )
+        self.queue_s = _parse_int(os.environ.get(f"{env}_QUEUE_SECONDS", "2"), 2, 0, 300)
+        self._sem = threading.BoundedSemaphore(self.max_concurrent) if self.max_concurrent else None
+        self._lock = threading.Lock()
+        self._inflight = 0
+
+    def properties(self):
+        props = get_kusto_request_properties()()
+        props.set_option("servertimeout", timedelta(seconds=self.timeout_s))
+        if self.consistency != "strong":
+            props.set_option("queryconsistency", _CONSISTENCY[self.consistency])
+        return props
+
+    def __enter__(self):
+        if self._sem is not None:
+            t0 = time.perf_counter()
+            acquired = self._sem.acquire(timeout=self.queue_s)
+            histogram_record("vigia_kusto_slot_wait_ms", (time.perf_counter() - t0) * 1000.0, profile=self.name)
+            if not acquired:
+                counter_add("vigia_kusto_profile_total", profile=self.name, outcome="busy")
+                raise KustoBusyError(self.name, max(1, self.queue_s))
+        with self._lock:
+            self._inflight += 1
+            gauge_set("vigia_kusto_inflight", self._inflight, profile=self.name)
+        return self
+
+    def __exit__(self, *exc):
+        with self._lock:
+            self._inflight -= 1
+            gauge_set("vigia_kusto_inflight", self._inflight, profile=self.name)
+        if self._sem is not None:
+            self._sem.release()
+        return False
+
+
+def _kusto_profile(name: str = None) -> KustoProfile:
+    name = name or _CURRENT_PROFILE.get()
+    profile = _STATE.get(name)
+    if profile is None:
+        with _STATE_LOCK:
+            profile = _STATE.setdefault(name, KustoProfile(name))
+    return profile
+
+
+def _route_profile_overrides() -> dict:
+    out = {}
+    for item in (os.environ.get("KUSTO_ROUTE_PROFILES") or "").split(","):
+        fn, _, profile = item.partition("=")
+        if fn.strip() and profile.strip().lower() in KUSTO_PROFILES:
+            out[fn.strip()] = profile.strip().lower()
+    return out
+
+
+def kusto_profile(name: str):
+    """Route decorator (below @profiled): run the route's Kusto queries under profile `name`."""
+    if name not in KUSTO_PROFILES:
+        raise ValueError(f"Unknown Kusto profile: {name}")
+
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            token = _CURRENT_PROFILE.set(_route_profile_overrides().get(fn.__name__, name))
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                _CURRENT_PROFILE.reset(token)
+
+        return wrapper
+
+    return decorate
+
+
+# ---------- Traced Kusto execution ----------
+
+def _drop_broken_client(e: Exception, cluster: str = None):
+    # a connection-level failure rebuilds the client (and its pool) on the next call;
+    # query errors (semantic, throttling) keep it
+    if _is_connection_error(e):
+        _REGISTRY.invalidate(_kusto_client_name(cluster), reason="error")
+
+
+def _kusto_query(query: str, op: str, db: str = None, profile: str = None):
+    """
+    Run a KQL query and return the primary result table.
+    Every call is one round trip and is recorded as span 'kusto.<op>'. The query runs
+    under `profile` (default: the current route's, else pipeline); a profile with its
+    own database reads that instead of `db`.
+    """
+    p = _kusto_profile(profile)
+    database = p.database or db or get_kusto_db_name()
+    with p, span(f"kusto.{op}", kind="query", round_trips=1, request_bytes=len(query.encode("utf-8"))) as sp:
+        sp.set_attribute("profile", p.name)
+        try:
+            table = get_kusto_client(p.cluster).execute(database, query, properties=p.properties()).primary_results[0]
+        except Exception as e:
+            counter_add("vigia_kusto_profile_total", profile=p.name, outcome="error")
+            _drop_broken_client(e, p.cluster)
+            raise
+        counter_add("vigia_kusto_profile_total", profile=p.name, outcome="ok")
+        sp.set_attribute("rows", len(table.rows))
+        return table
+
+
+def _kusto_mgmt(command: str, op: str, db: str = None):
+    """
+    Run a control command (.append, .show, ...) on the leader and return the primary result table.
+    """
+    with span(f"kusto.{op}", kind="mgmt", round_trips=1, request_bytes=len(command.encode("utf-8"))) as sp:
+        try:
+            res = get_kusto_client().execute_mgmt(db or get_kusto_db_name(), command)
+        except Exception as e:
+            _drop_broken_client(e)
+            raise
+        table = res.primary_results[0] if res.primary_results else None
+        sp.set_attribute("rows", len(table.rows) if table is not None else 0)
+        return table
+
+
+def _rows_as_dicts(table) -> list:
+    cols = [c.column_name for c in table.columns]
+    return [dict(zip(cols, r)) for r in table.rows]
\ No newline at end of file
@@ -0,0 +1,278 @@
+"""
+Table layout for RoadTelemetry / AuditEvents / AuditEventsArchive: precomputed dedupe
+keys, partitioning, caching, retention and ingestion batching. Every command is
+idempotent (.create-merge / .alter-merge / .create-or-alter / .alter ... policy), so
+the CLI can be re-run.
+
+    # print the commands without running them
+    python -m vigia.infra.kusto_layout --dry-run
+
+    # apply everything
+    python -m vigia.infra.kusto_layout
+"""
+import os
+import re
+import sys
+import json
+import time
+import logging
+import argparse
+import threading
+from datetime import datetime, timedelta, timezone
+
+from ..core.config import _parse_int, get_audit_archive_table_name, get_audit_table_name
+from ..core.telemetry import counter_add
+from .audit_archive import ARCHIVE_COLUMNS, _audit_archive_mode, _raw_retention_days
+from .hazard_sync import HAZARD_WATERMARK_VIEW, _watermark_precision, _watermark_view_command
+from .hotspots import HOTSPOT_VIEW_DAILY, HOTSPOT_VIEW_HOURLY, _hotspot_precision, _hotspot_view_commands
+from .kusto import _kusto_mgmt, _rows_as_dicts
+
+
+# ---------- Provisioned layout ----------
+#
+# Reports are ingested into KUSTO_TELEMETRY_STAGING_TABLE. An update policy copies them
+# into RoadTelemetry with four computed columns:
+#   LatB, LonB - round(Latitude/Longitude, DEDUP_LATLON_DECIMALS)
+#   TimeB      - bin(Timestamp, DEDUP_TIME_BUCKET_MINUTES)
+#   GeoCell    - geohash at HOTSPOT_GEOHASH_PRECISION
+# The staging table keeps nothing (soft delete 0s).
+#
+# RoadTelemetry is hash-partitioned on GeoCell and range-partitioned on Timestamp (1d).
+# The partitioning policy allows only one hash key. HazardType has a handful of values,
+# so it is left to the default column index.
+#
+# Hot cache:
+#   RoadTelemetry - KUSTO_TELEMETRY_HOT_DAYS (default 8; queries look back at most 168h)
+#   AuditEvents   - KUSTO_AUDIT_HOT_DAYS (default 30)
+# AuditEvents ingestion batching applies to queued ingestion (not inline .append):
+# KUSTO_AUDIT_BATCH_SECONDS, KUSTO_AUDIT_BATCH_ITEMS, KUSTO_AUDIT_BATCH_MB.
+#
+# AuditEventsArchive (compacted events, see audit_archive.py) is always created:
+# hot for KUSTO_AUDIT_ARCHIVE_HOT_DAYS (default 90), kept AUDIT_ARCHIVE_RETENTION_DAYS
+# (default 3650). The AuditEvents retention (AUDIT_RAW_RETENTION_DAYS) is set only with
+# AUDIT_ARCHIVE_MODE=on, so raw rows are never dropped while nothing compacts them.
+#
+# The last command writes the layout parameters into the RoadTelemetry docstring.
+# Queries switch to the precomputed columns once the parameters match their own config.
+# They also wait until the marker is older than their lookback window, because rows
+# ingested before provisioning have empty columns. The marker is re-read every
+# KUSTO_LAYOUT_CHECK_SECONDS.
+
+TELEMETRY_TABLE = "RoadTelemetry"
+TELEMETRY_EXPAND_FUNCTION = "RoadTelemetryExpand"
+TELEMETRY_COLUMNS = (
+    ("ReportId", "string"),
+    ("DeviceId", "string"),
+    ("Timestamp", "datetime"),
+    ("Latitude", "real"),
+    ("Longitude", "real"),
+    ("HazardType", "string"),
+    ("ConfidenceScore", "real"),
+    ("GForceZ", "real"),
+    ("GaussianSplatURL", "string"),
+)
+COMPUTED_COLUMNS = (("LatB", "real"), ("LonB", "real"), ("TimeB", "datetime"), ("GeoCell", "string"))
+
+_MARKER = "vigia-layout"
+_MARKER_RE = re.compile(_MARKER + r" dec=(\d+) bucket=(\d+) geohash=(\d+) at=(\S+)")
+
+_LAYOUT = {}
+_LAYOUT_LOCK = threading.Lock()
+
+
+def _staging_table() -> str:
+    return os.environ.get("KUSTO_TELEMETRY_STAGING_TABLE") or "RoadTelemetryIngest"
+
+
+def _layout_params() -> dict:
+    return {
+        "dec": _parse_int(os.environ.get("DEDUP_LATLON_DECIMALS", "3"), 3, 1, 6),
+        "bucket": _parse_int(os.environ.get("DEDUP_TIME_BUCKET_MINUTES", "60"), 60, 1, 1440),
+        "geohash": _hotspot_precision(),
+    }
+
+
+def _schema(columns) -> str:
+    return ", ".join(f"{c}:{t}" for c, t in columns)
+
+
+def _layout_commands(params: dict = None, marked_at: str = None) -> list:
+    """(name, control command) pairs, in the order they must run."""
+    p = params or _layout_params()
+    staging = _staging_table()
+    audit = get_audit_table_name()
+    telemetry_hot = _parse_int(os.environ.get("KUSTO_TELEMETRY_HOT_DAYS", "8"), 8, 1, 3650)
+    audit_hot = _parse_int(os.environ.get("KUSTO_AUDIT_HOT_DAYS", "30"), 30, 1, 3650)
+    archive = get_audit_archive_table_name()
+    archive_hot = _parse_int(os.environ.get("KUSTO_AUDIT_ARCHIVE_HOT_DAYS", "90"), 90, 1, 36500)
+    archive_keep = _parse_int(os.environ.get("AUDIT_ARCHIVE_RETENTION_DAYS", "3650"), 3650, 1, 36500)
+    batch_s = _parse_int(os.environ.get("KUSTO_AUDIT_BATCH_SECONDS", "10"), 10, 1, 1800)
+    batching = {
+        "MaximumBatchingTimeSpan": f"{batch_s // 3600:02d}:{batch_s // 60 % 60:02d}:{batch_s % 60:02d}",
+        "MaximumNumberOfItems": _parse_int(os.environ.get("KUSTO_AUDIT_BATCH_ITEMS", "500"), 500, 1, 20000),
+        "MaximumRawDataSizeMB": _parse_int(os.environ.get("KUSTO_AUDIT_BATCH_MB", "256"), 256, 1, 4096),
+    }
+    partitioning = {
+        "PartitionKeys": [
+            {
+                "ColumnName": "GeoCell",
+                "Kind": "Hash",
+                "Properties": {"Function": "XxHash64", "MaxPartitionCount": 128, "Seed": 1, "PartitionAssignmentMode": "Uniform"},
+            },
+            {
+                "ColumnName": "Timestamp",
+                "Kind": "UniformRange",
+                "Properties": {"Reference": "1970-01-01T00:00:00", "RangeSize": "1.00:00:00", "OverrideCreationTime": False},
+            },
+        ]
+    }
+    update_policy = [
+        {
+            "IsEnabled": True,
+            "Source": staging,
+            "Query": f"{TELEMETRY_EXPAND_FUNCTION}()",
+            "IsTransactional": True,
+            "PropagateIngestionProperties": True,
+        }
+    ]
+    expand = (
+        f".create-or-alter function with (folder='vigia', docstring='{TELEMETRY_TABLE} rows with precomputed dedupe keys')\n"
+        f"{TELEMETRY_EXPAND_FUNCTION}() {{\n"
+        f"    {staging}\n"
+        f"    | extend LatB = round(Latitude, {p['dec']}), LonB = round(Longitude, {p['dec']}),\n"
+        f"             TimeB = bin(Timestamp, {p['bucket']}m), GeoCell = geo_point_to_geohash(Longitude, Latitude, {p['geohash']})\n"
+        f"    | project {', '.join(c for c, _ in TELEMETRY_COLUMNS + COMPUTED_COLUMNS)}\n"
+        "}"
+    )
+    marked_at = marked_at or datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+    cmds = [
+        ("staging_table", f".create-merge table {staging} ({_schema(TELEMETRY_COLUMNS)})"),
+        ("staging_retention", f".alter-merge table {staging} policy retention softdelete = 0s recoverability = disabled"),
+        ("computed_columns", f".alter-merge table {TELEMETRY_TABLE} ({_schema(TELEMETRY_COLUMNS + COMPUTED_COLUMNS)})"),
+        ("expand_function", expand),
+        ("update_policy", f".alter table {TELEMETRY_TABLE} policy update @'{json.dumps(update_policy)}'"),
+        ("partitioning", f".alter table {TELEMETRY_TABLE} policy partitioning ```{json.dumps(partitioning)}```"),
+        ("telemetry_caching", f".alter table {TELEMETRY_TABLE} policy caching hot = {telemetry_hot}d"),
+        ("audit_caching", f".alter table {audit} policy caching hot = {audit_hot}d"),
+        ("audit_batching", f".alter table {audit} policy ingestionbatching @'{json.dumps(batching)}'"),
+        ("archive_table", f".create-merge table {archive} ({_schema(ARCHIVE_COLUMNS)})"),
+        ("archive_caching", f".alter table {archive} policy caching hot = {archive_hot}d"),
+        ("archive_retention", f".alter-merge table {archive} policy retention softdelete = {archive_keep}d recoverability = enabled"),
+    ]
+    if _audit_archive_mode() == "on":
+        cmds.append(("audit_retention", f".alter-merge table {audit} policy retention softdelete = {_raw_retention_days()}d"))
+    views = (HOTSPOT_VIEW_HOURLY, HOTSPOT_VIEW_DAILY)
+    for view, cmd in zip(views, _hotspot_view_commands(p["geohash"], cell_column="GeoCell")):
+        cmds.append((f"view_{view}", cmd))
+    for view in views:
+        # the hourly view also serves the partial first day of a 168h window
+        cmds.append((f"view_{view}_caching", f".alter materialized-view {view} policy caching hot = {telemetry_hot}d"))
+    # one row per (HazardType, cell) over all history: small, read by every worker
+    coarse = _watermark_precision()
+    cell_column = "GeoCell" if coarse <= p["geohash"] else None  # the coarser cell is a GeoCell prefix
+    cmds.append((f"view_{HAZARD_WATERMARK_VIEW}", _watermark_view_command(coarse, cell_column=cell_column)))
+    cmds.append((f"view_{HAZARD_WATERMARK_VIEW}_caching", f".alter materialized-view {HAZARD_WATERMARK_VIEW} policy caching hot = 3650d"))
+    cmds.append((
+        "layout_marker",
+        f".alter table {TELEMETRY_TABLE} docstring "
+        f"'{_MARKER} dec={p['dec']} bucket={p['bucket']} geohash={p['geohash']} at={marked_at}'",
+    ))
+    return cmds
+
+
+# --- reading the marker ---
+
+def _parse_layout(row: dict):
+    m = _MARKER_RE.search(str(row.get("DocString") or ""))
+    if not m or not all(c in str(row.get("Schema") or "") for c, _ in COMPUTED_COLUMNS):
+        return None
+    return {
+        "dec": int(m.group(1)),
+        "bucket": int(m.group(2)),
+        "geohash": int(m.group(3)),
+        "at": datetime.fromisoformat(m.group(4).replace("Z", "+00:00")),
+    }
+
+
+def _read_layout():
+    try:
+        rows = _rows_as_dicts(_kusto_mgmt(f".show table {TELEMETRY_TABLE} cslschema", "telemetry_layout"))
+    except Exception:
+        logging.warning("Could not read the %s layout; using query-time keys", TELEMETRY_TABLE, exc_info=True)
+        return None
+    return _parse_layout(rows[0]) if rows else None
+
+
+def _telemetry_layout():
+    """Provisioned layout of RoadTelemetry ({dec, bucket, geohash, at}) or None; cached."""
+    cached = _LAYOUT.get("telemetry")
+    if cached is not None and time.monotonic() < cached[0]:
+        return cached[1]
+    layout = _read_layout()
+    ttl_s = _parse_int(os.environ.get("KUSTO_LAYOUT_CHECK_SECONDS", "300"), 300, 0, 86400)
+    with _LAYOUT_LOCK:
+        _LAYOUT["telemetry"] = (time.monotonic() + ttl_s, layout)
+    return layout
+
+
+def _precomputed_keys(dec: int, bucket_min: int, window_hours: int) -> bool:
+    """True when LatB/LonB/TimeB exist for this config and cover every row in the window."""
+    layout = _telemetry_layout()
+    ok = (
+        layout is not None
+        and layout["dec"] == dec
+        and layout["bucket"] == bucket_min
+        and layout["at"] <= datetime.now(timezone.utc) - timedelta(hours=window_hours)
+    )
+    counter_add("vigia_kusto_layout_checks_total", keys="precomputed" if ok else "query_time")
+    return ok
+
+
+# --- provisioning ---
+
+def _provision_layout(dry_run: bool = False) -> list:
+    """
+    Run the layout commands in order, stopping at the first failure. The existing
+    marker time is kept when the parameters are unchanged, so a re-run does not
+    push the query switch-over back.
+    """
+    params = _layout_params()
+    current = _read_layout()
+    marked_at = None
+    if current and all(current[k] == params[k] for k in ("dec", "bucket", "geohash")):
+        marked_at = current["at"].strftime("%Y-%m-%dT%H:%M:%SZ")
+
+    out = []
+    for name, cmd in _layout_commands(params, marked_at):
+        if dry_run:
+            out.append({"name": name, "command": cmd, "ok": None})
+            continue
+        try:
+            _kusto_mgmt(cmd, f"layout_{name}")
+            out.append({"name": name, "ok": True})
+        except Exception as e:
+            out.append({"name": name, "ok": False, "error": f"{type(e).__name__}: {e}"})
+            logging.error("Layout command %s failed", name, exc_info=True)
+            break
+    with _LAYOUT_LOCK:
+        _LAYOUT.pop("telemetry", None)
+    return out
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="Provision RoadTelemetry / AuditEvents / AuditEventsArchive table layout and policies")
+    ap.add_argument("--dry-run", action="store_true", help="print the commands without running them")
+    args = ap.parse_args(argv)
+
+    out = _provision_layout(dry_run=args.dry_run)
+    if args.dry_run:
+        for step in out:
+            print(f"// {step['name']}\n{step['command']}\n")
+        return 0
+    print(json.dumps(out, indent=2))
+    return 0 if all(step["ok"] for step in out) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
\ No newline at end of file
@@ -1,38 +1,144 @@
+import os
+import json
+import time
 import hashlib
+import threading
 
-from ..core.config import require_env
-from .clients import get_auth_credential, get_ledger_cert_path, get_ledger_service_cert_pem
+from ..core.config import _parse_int
+from ..core.report import as_report
+from ..core.telemetry import counter_add, gauge_set, histogram_record, span
+from .clients import get_ledger_client, get_ledger_service_cert_pem, get_receipt_verifier
+from .hotspots import _geohash
 
 
-def _ledger_write_and_verify(proof_hash: str) -> dict:
-    from azure.confidentialledger import ConfidentialLedgerClient
-    from azure.confidentialledger.receipt import verify_receipt
+# ---------- Collection sharding + bounded in-flight LROs ----------
+#
+# LEDGER_SHARD_BY:
+#   none        - every proof goes to the ledger's default collection (default)
+#   hazard_type - collection chosen by HazardType
+#   region      - collection chosen by the geohash cell (LEDGER_REGION_GEOHASH_PRECISION)
+#
+# LEDGER_COLLECTIONS lists the collection ids. Plain entries form a hash ring
+# ("vigia-0,vigia-1,vigia-2"); "key=collection" entries pin a shard key
+# ("pothole=potholes,flooding=floods,*=vigia-other"). LEDGER_MAX_INFLIGHT bounds the
+# create/receipt LROs running at once in this worker.
 
-    ledger_url = require_env("CONFIDENTIAL_LEDGER_URL")
+_INFLIGHT = {}
+_INFLIGHT_LOCK = threading.Lock()
 
-    ledger_client = ConfidentialLedgerClient(
-        endpoint=ledger_url,
-        credential=get_auth_credential(),
-        ledger_certificate_path=get_ledger_cert_path(),
-    )
 
-    write_result = ledger_client.begin_create_ledger_entry({"contents": proof_hash}).result()
-    tx_id = write_result.get("transactionId")
-    if not tx_id:
-        raise RuntimeError(f"Ledger write succeeded but no transactionId returned: {write_result}")
+def _ledger_shard_by() -> str:
+    by = (os.environ.get("LEDGER_SHARD_BY") or "none").strip().lower()
+    return by if by in ("none", "hazard_type", "region") else "none"
 
-    receipt_result = ledger_client.begin_get_receipt(tx_id).result()
+
+def _ledger_collection_for(payload: dict):
+    """Collection id for a report, or None for the default collection."""
+    by = _ledger_shard_by()
+    entries = [e.strip() for e in (os.environ.get("LEDGER_COLLECTIONS") or "").split(",") if e.strip()]
+    if by == "none" or not entries:
+        return None
+
+    report = as_report(payload)
+    if by == "hazard_type":
+        key = report.hazard_key
+    else:
+        precision = _parse_int(os.environ.get("LEDGER_REGION_GEOHASH_PRECISION", "3"), 3, 1, 6)
+        if report.latitude is None or report.longitude is None:
+            key = "none"
+        else:
+            key = _geohash(report.latitude, report.longitude, precision)
+
+    pinned = dict(e.split("=", 1) for e in entries if "=" in e)
+    if key in pinned:
+        return pinned[key].strip()
+    ring = [e for e in entries if "=" not in e]
+    if ring:
+        return ring[int(hashlib.sha256(key.encode("utf-8")).hexdigest()[:8], 16) % len(ring)]
+    return pinned.get("*", "").strip() or None
+
+
+class _InflightSlots:
+    """Semaphore with an in-flight gauge and a wait histogram."""
+
+    def __init__(self, limit: int):
+        self._sem = threading.BoundedSemaphore(max(1, limit))
+        self._lock = threading.Lock()
+        self._inflight = 0
+
+    def __enter__(self):
+        t0 = time.perf_counter()
+        self._sem.acquire()
+        histogram_record("vigia_ledger_slot_wait_ms", (time.perf_counter() - t0) * 1000.0)
+        with self._lock:
+            self._inflight += 1
+            gauge_set("vigia_ledger_inflight", self._inflight)
+        return self
+
+    def __exit__(self, *exc):
+        with self._lock:
+            self._inflight -= 1
+            gauge_set("vigia_ledger_inflight", self._inflight)
+        self._sem.release()
+        return False
+
+
+def _ledger_slots() -> _InflightSlots:
+    slots = _INFLIGHT.get("slots")
+    if slots is None:
+        with _INFLIGHT_LOCK:
+            slots = _INFLIGHT.setdefault(
+                "slots", _InflightSlots(_parse_int(os.environ.get("LEDGER_MAX_INFLIGHT", "8"), 8, 1, 256))
+            )
+    return slots
+
+
+def _ledger_write_and_verify(proof_hash: str, collection_id: str = None, transaction_id: str = None,
+                             on_submitted=None) -> dict:
+    """
+    Write `proof_hash` (into `collection_id`, default collection when None), then fetch
+    and verify its receipt. With `transaction_id` the write is skipped and the existing
+    entry is verified (retry after a crash). `on_submitted(tx_id, collection_id)` runs
+    as soon as the write is committed, before the receipt is requested.
+    """
+    ledger_client = get_ledger_client()
+    verify_receipt = get_receipt_verifier()
+    slots = _ledger_slots()
+    collection_label = collection_id or "default"
+
+    tx_id = transaction_id
+    if tx_id:
+        counter_add("vigia_ledger_writes_total", collection=collection_label, outcome="reused")
+    else:
+        entry = {"contents": proof_hash}
+        kwargs = {"collection_id": collection_id} if collection_id else {}
+        with slots, span("ledger.create_entry", round_trips=1, request_bytes=len(json.dumps(entry))) as sp:
+            sp.set_attribute("collection", collection_label)
+            write_result = ledger_client.begin_create_ledger_entry(entry, **kwargs).result()
+        tx_id = write_result.get("transactionId")
+        if not tx_id:
+            raise RuntimeError(f"Ledger write succeeded but no transactionId returned: {write_result}")
+        counter_add("vigia_ledger_writes_total", collection=collection_label, outcome="written")
+        if on_submitted is not None:
+            on_submitted(tx_id, collection_id)
+
+    with slots, span("ledger.get_receipt", round_trips=1) as sp:
+        receipt_result = ledger_client.begin_get_receipt(tx_id).result()
+        sp.set_attribute("response_bytes", len(json.dumps(receipt_result, default=str)))
     service_cert_pem = get_ledger_service_cert_pem()
     application_claims = receipt_result.get("applicationClaims")
 
-    verify_receipt(
-        receipt_result["receipt"],
-        service_cert_pem,
-        application_claims=application_claims,
-    )
+    with span("ledger.verify_receipt"):
+        verify_receipt(
+            receipt_result["receipt"],
+            service_cert_pem,
+            application_claims=application_claims,
+        )
 
     return {
         "transactionId": tx_id,
+        "collectionId": collection_id or "",
+        "reused_transaction": bool(transaction_id),
         "receipt_verified": True,
         "service_cert_sha256": hashlib.sha256(service_cert_pem.encode("utf-8")).hexdigest(),
         "receipt_result": receipt_result,
@@ -1,18 +1,387 @@
 import os
+import json
+import math
+import time
+import logging
+import hashlib
+import threading
 
+from ..core.report import as_report
+from ..core.telemetry import counter_add
 
-def _deterministic_verify_gate(payload: dict) -> (bool, str, float):
-    threshold = float(os.environ.get("VERIFY_CONFIDENCE_THRESHOLD", "0.7"))
 
-    hazard_type = (payload.get("HazardType") or "none").strip().lower()
-    conf = float(payload.get("ConfidenceScore") or 0.0)
-    url = (payload.get("GaussianSplatURL") or "").strip().lower()
+# ---------- Data-driven policy gate ----------
+#
+# Rules come from POLICY_RULES_PATH (.json / .yaml / .yml) or POLICY_RULES_JSON,
+# are compiled once, and re-checked for changes every POLICY_RULES_RELOAD_SECONDS.
+# Without either, _DEFAULT_RULES reproduce the original hard-coded gate exactly.
+#
+#   {
+#     "confidence_threshold": 0.7,                      # VERIFY_CONFIDENCE_THRESHOLD wins when set
+#     "invalid_hazard_types": ["none", "", "unknown"],
+#     "missing_evidence_values": ["", "pending"],
+#     "evidence_exempt_hazard_types": ["red_light_violation"],
+#     "hazard_types": {"pothole": {"confidence_threshold": 0.6, "evidence_required": true}},
+#     "geofence_cell_deg": 0.05,
+#     "geofences": [
+#       {"name": "school_zone_12", "circle": {"lat": 25.2, "lon": 55.27, "radius_m": 300},
+#        "hazard_types": ["debris"], "confidence_threshold": 0.5, "evidence_required": true},
+#       {"name": "e11", "polygon": [[25.1, 55.1], [25.3, 55.3], [25.3, 55.31]], "confidence_threshold": 0.8},
+#       {"name": "depot", "bbox": {"s": 25.0, "w": 55.0, "n": 25.01, "e": 55.01}, "evidence_required": false}
+#     ]
+#   }
+#
+# Precedence: global < hazard_types[type] < matching geofences in file order (later wins).
+# Reason codes: hazard_type_none, confidence_below_<threshold>, missing_evidence_url, passed_policy_gate.
+
+_DEFAULT_RULES = {
+    "confidence_threshold": 0.7,
+    "invalid_hazard_types": ["none", "", "unknown"],
+    "missing_evidence_values": ["", "pending"],
+    "evidence_exempt_hazard_types": ["red_light_violation"],
+    "hazard_types": {},
+    "geofences": [],
+}
+
+_EARTH_RADIUS_M = 6371008.8
+_M_PER_DEG_LAT = 111320.0
+_MAX_CELLS_PER_FENCE = 4096
+
+
+def _norm(s) -> str:
+    return str(s).strip().lower()
+
+
+def _opt_float(v):
+    try:
+        f = float(v)
+    except (TypeError, ValueError):
+        return None
+    return None if math.isnan(f) else f
+
+
+class _Geofence:
+    __slots__ = ("name", "kind", "bbox", "shape", "hazard_types", "threshold", "evidence_required")
+
+    def __init__(self, spec: dict):
+        self.name = str(spec.get("name") or "geofence")
+        ht = spec.get("hazard_types")
+        self.hazard_types = frozenset(_norm(h) for h in ht) if ht else None
+        self.threshold = float(spec["confidence_threshold"]) if spec.get("confidence_threshold") is not None else None
+        ev = spec.get("evidence_required")
+        self.evidence_required = bool(ev) if ev is not None else None
+
+        if spec.get("circle"):
+            c = spec["circle"]
+            lat, lon, r = float(c["lat"]), float(c["lon"]), float(c["radius_m"])
+            dlat = r / _M_PER_DEG_LAT
+            dlon = r / (_M_PER_DEG_LAT * max(1e-6, math.cos(math.radians(lat))))
+            self.kind, self.shape = "circle", (lat, lon, r)
+            self.bbox = (lat - dlat, lon - dlon, lat + dlat, lon + dlon)
+        elif spec.get("polygon"):
+            pts = [(float(p[0]), float(p[1])) for p in spec["polygon"]]
+            if len(pts) < 3:
+                raise ValueError(f"Geofence '{self.name}': polygon needs at least 3 points")
+            self.kind, self.shape = "polygon", pts
+            lats, lons = [p[0] for p in pts], [p[1] for p in pts]
+            self.bbox = (min(lats), min(lons), max(lats), max(lons))
+        elif spec.get("bbox"):
+            b = spec["bbox"]
+            self.kind = "bbox"
+            self.bbox = self.shape = (float(b["s"]), float(b["w"]), float(b["n"]), float(b["e"]))
+        else:
+            raise ValueError(f"Geofence '{self.name}': expected circle, polygon or bbox")
+
+    def applies_to(self, hazard_type: str) -> bool:
+        return self.hazard_types is None or hazard_type in self.hazard_types
+
+    def contains(self, lat: float, lon: float) -> bool:
+        s, w, n, e = self.bbox
+        if not (s <= lat <= n and w <= lon <= e):
+            return False
+        if self.kind == "bbox":
+            return True
+        if self.kind == "circle":
+            clat, clon, r = self.shape
+            p1, p2 = math.radians(clat), math.radians(lat)
+            a = math.sin((p2 - p1) / 2) ** 2 + math.cos(p1) * math.cos(p2) * math.sin(math.radians(lon - clon) / 2) ** 2
+            return 2 * _EARTH_RADIUS_M * math.asin(min(1.0, math.sqrt(a))) <= r
+        inside = False
+        pts = self.shape
+        j = len(pts) - 1
+        for i in range(len(pts)):
+            yi, xi = pts[i]
+            yj, xj = pts[j]
+            if (yi > lat) != (yj > lat) and lon < (xj - xi) * (lat - yi) / (yj - yi) + xi:
+                inside = not inside
+            j = i
+        return inside
+
+    def contains_many(self, np, lat, lon):
+        s, w, n, e = self.bbox
+        mask = (lat >= s) & (lat <= n) & (lon >= w) & (lon <= e)
+        if self.kind == "bbox" or not mask.any():
+            return mask
+        if self.kind == "circle":
+            clat, clon, r = self.shape
+            p1, p2 = math.radians(clat), np.radians(lat)
+            a = np.sin((p2 - p1) / 2) ** 2 + math.cos(p1) * np.cos(p2) * np.sin(np.radians(lon - clon) / 2) ** 2
+            return mask & (2 * _EARTH_RADIUS_M * np.arcsin(np.minimum(1.0, np.sqrt(a))) <= r)
+        inside = np.zeros(lat.shape, dtype=bool)
+        pts = self.shape
+        j = len(pts) - 1
+        with np.errstate(divide="ignore", invalid="ignore"):
+            for i in range(len(pts)):
+                yi, xi = pts[i]
+                yj, xj = pts[j]
+                if yi != yj:
+                    cross = ((yi > lat) != (yj > lat)) & (lon < (xj - xi) * (lat - yi) / (yj - yi) + xi)
+                    inside ^= cross
+                j = i
+        return mask & inside
+
+
+class CompiledPolicy:
+    """
+    Rule table compiled into lookup sets, per-hazard parameters and a uniform-grid
+    spatial index over geofence bounding boxes.
+    """
+
+    def __init__(self, rules: dict, threshold_override=None):
+        rules = {**_DEFAULT_RULES, **(rules or {})}
+        base = float(threshold_override) if threshold_override is not None else float(rules["confidence_threshold"])
+        exempt = frozenset(_norm(h) for h in rules.get("evidence_exempt_hazard_types") or [])
+
+        self.threshold = base
+        self.invalid = frozenset(_norm(h) for h in rules.get("invalid_hazard_types") or [])
+        self.missing_evidence = frozenset(_norm(v) for v in rules.get("missing_evidence_values") or [])
+        self.exempt = exempt
+        self.by_type = {}
+        for ht, spec in (rules.get("hazard_types") or {}).items():
+            spec = spec or {}
+            ev = spec.get("evidence_required")
+            self.by_type[_norm(ht)] = (
+                float(spec["confidence_threshold"]) if spec.get("confidence_threshold") is not None else base,
+                bool(ev) if ev is not None else _norm(ht) not in exempt,
+            )
+
+        self.geofences = [_Geofence(g) for g in rules.get("geofences") or []]
+        self.cell_deg = float(rules.get("geofence_cell_deg") or 0.05)
+        self._grid = {}
+        self._global = []
+        for idx, g in enumerate(self.geofences):
+            s, w, n, e = g.bbox
+            i0, i1 = math.floor(s / self.cell_deg), math.floor(n / self.cell_deg)
+            j0, j1 = math.floor(w / self.cell_deg), math.floor(e / self.cell_deg)
+            if (i1 - i0 + 1) * (j1 - j0 + 1) > _MAX_CELLS_PER_FENCE:
+                self._global.append(idx)
+                continue
+            for i in range(i0, i1 + 1):
+                for j in range(j0, j1 + 1):
+                    self._grid.setdefault((i, j), []).append(idx)
+
+        self._reasons = {}
+
+    def _below(self, threshold: float) -> str:
+        r = self._reasons.get(threshold)
+        if r is None:
+            r = self._reasons[threshold] = f"confidence_below_{threshold}"
+        return r
+
+    def _candidates(self, lat: float, lon: float):
+        cell = self._grid.get((math.floor(lat / self.cell_deg), math.floor(lon / self.cell_deg)), [])
+        return sorted(cell + self._global) if self._global else cell
+
+    def params(self, hazard_type: str, lat=None, lon=None):
+        """(confidence threshold, evidence required) for a hazard type at a location."""
+        threshold, evidence = self.by_type.get(hazard_type) or (self.threshold, hazard_type not in self.exempt)
+        if self.geofences and lat is not None and lon is not None:
+            for idx in self._candidates(lat, lon):
+                g = self.geofences[idx]
+                if g.applies_to(hazard_type) and g.contains(lat, lon):
+                    if g.threshold is not None:
+                        threshold = g.threshold
+                    if g.evidence_required is not None:
+                        evidence = g.evidence_required
+        return threshold, evidence
+
+    def evaluate(self, payload: dict) -> (bool, str, float):
+        report = as_report(payload)
+        hazard_type = report.hazard_key
+        conf = report.confidence
+        url = (report.get("GaussianSplatURL") or "").strip().lower()
+
+        if hazard_type in self.invalid:
+            return False, "hazard_type_none", conf
+        threshold, evidence = self.params(hazard_type, report.latitude, report.longitude)
+        if conf < threshold:
+            return False, self._below(threshold), conf
+        if url in self.missing_evidence and evidence:
+            return False, "missing_evidence_url", conf
+
+        return True, "passed_policy_gate", conf
+
+    def evaluate_batch(self, payloads) -> list:
+        """
+        Same results as [evaluate(p) for p in payloads], computed with numpy array
+        operations; geofences are tested once per occupied grid cell. numpy is in
+        requirements.txt; the scalar loop only runs where it is missing (bare dev envs).
+        """
+        try:
+            import numpy as np
+        except ImportError:
+            return [self.evaluate(p) for p in payloads]
+
+        payloads = list(payloads)
+        n = len(payloads)
+        if n == 0:
+            return []
+
+        types = [(p.get("HazardType") or "none").strip().lower() for p in payloads]
+        conf = np.fromiter((float(p.get("ConfidenceScore") or 0.0) for p in payloads), dtype=float, count=n)
+        no_evidence = np.fromiter(
+            ((p.get("GaussianSplatURL") or "").strip().lower() in self.missing_evidence for p in payloads),
+            dtype=bool, count=n,
+        )
+        type_arr = np.array(types, dtype=object)
+        invalid = np.fromiter((t in self.invalid for t in types), dtype=bool, count=n)
+
+        threshold = np.full(n, self.threshold)
+        evidence = np.fromiter((t not in self.exempt for t in types), dtype=bool, count=n)
+        for ht, (thr, ev) in self.by_type.items():
+            m = type_arr == ht
+            threshold[m] = thr
+            evidence[m] = ev
+
+        if self.geofences:
+            lat = np.array([_opt_float(p.get("Latitude")) for p in payloads], dtype=float)
+            lon = np.array([_opt_float(p.get("Longitude")) for p in payloads], dtype=float)
+            located = ~(np.isnan(lat) | np.isnan(lon)) & ~invalid
+            rows = np.nonzero(located)[0]
+            if rows.size:
+                ci = np.floor(lat[rows] / self.cell_deg).astype(np.int64)
+                cj = np.floor(lon[rows] / self.cell_deg).astype(np.int64)
+                cells, inverse = np.unique(np.stack([ci, cj], axis=1), axis=0, return_inverse=True)
+                inverse = inverse.reshape(-1)
+                for k, (i, j) in enumerate(cells.tolist()):
+                    cand = self._grid.get((i, j), [])
+                    cand = sorted(cand + self._global) if self._global else cand
+                    if not cand:
+                        continue
+                    idx = rows[inverse == k]
+                    for gi in cand:
+                        g = self.geofences[gi]
+                        hit = g.contains_many(np, lat[idx], lon[idx])
+                        if g.hazard_types is not None:
+                            hit &= np.fromiter((types[r] in g.hazard_types for r in idx), dtype=bool, count=idx.size)
+                        if not hit.any():
+                            continue
+                        if g.threshold is not None:
+                            threshold[idx[hit]] = g.threshold
+                        if g.evidence_required is not None:
+                            evidence[idx[hit]] = g.evidence_required
+
+        below = ~invalid & (conf < threshold)
+        missing = ~invalid & ~below & no_evidence & evidence
+
+        out = []
+        conf_l = conf.tolist()
+        thr_l = threshold.tolist()
+        for k in range(n):
+            if invalid[k]:
+                out.append((False, "hazard_type_none", conf_l[k]))
+            elif below[k]:
+                out.append((False, self._below(thr_l[k]), conf_l[k]))
+            elif missing[k]:
+                out.append((False, "missing_evidence_url", conf_l[k]))
+            else:
+                out.append((True, "passed_policy_gate", conf_l[k]))
+        return out
+
+
+# ---------- Loading + hot reload ----------
+
+_POLICY = {"compiled": None, "signature": None, "checked_at": 0.0}
+_POLICY_LOCK = threading.Lock()
+
+
+def _load_rules_file(path: str) -> dict:
+    with open(path, encoding="utf-8") as f:
+        text = f.read()
+    if path.lower().endswith((".yaml", ".yml")):
+        try:
+            import yaml
+        except ImportError:
+            raise RuntimeError("YAML policy rules need PyYAML (pip install pyyaml)")
+        return yaml.safe_load(text) or {}
+    return json.loads(text or "{}")
+
+
+def _rules_signature():
+    path = (os.environ.get("POLICY_RULES_PATH") or "").strip()
+    inline = os.environ.get("POLICY_RULES_JSON") or ""
+    if path:
+        try:
+            st = os.stat(path)
+            src = ("file", path, st.st_mtime_ns, st.st_size)
+        except OSError:
+            src = ("file", path, None, None)
+    elif inline:
+        src = ("inline", hashlib.sha256(inline.encode("utf-8")).hexdigest())
+    else:
+        src = ("default",)
+    return src + (os.environ.get("VERIFY_CONFIDENCE_THRESHOLD"),)
+
+
+def _compile_rules(signature) -> CompiledPolicy:
+    kind = signature[0]
+    if kind == "file":
+        rules = _load_rules_file(signature[1])
+    elif kind == "inline":
+        rules = json.loads(os.environ.get("POLICY_RULES_JSON") or "{}")
+    else:
+        rules = _DEFAULT_RULES
+    return CompiledPolicy(rules, threshold_override=signature[-1])
+
+
+def _compiled_policy() -> CompiledPolicy:
+    """
+    Current compiled rule set. Sources are re-checked at most every
+    POLICY_RULES_RELOAD_SECONDS; a rule file that fails to load keeps the last good
+    policy in place (or the defaults on first load).
+    """
+    try:
+        reload_s = float(os.environ.get("POLICY_RULES_RELOAD_SECONDS", "5"))
+    except ValueError:
+        reload_s = 5.0
+
+    compiled = _POLICY["compiled"]
+    now = time.monotonic()
+    if compiled is not None and now - _POLICY["checked_at"] < reload_s:
+        return compiled
+
+    with _POLICY_LOCK:
+        if _POLICY["compiled"] is not None and now - _POLICY["checked_at"] < reload_s:
+            return _POLICY["compiled"]
+        sig = _rules_signature()
+        if sig != _POLICY["signature"] or _POLICY["compiled"] is None:
+            try:
+                _POLICY["compiled"] = _compile_rules(sig)
+                counter_add("vigia_policy_reloads_total", source=sig[0], outcome="ok")
+            except Exception:
+                logging.error("Policy rules failed to load; keeping previous rules", exc_info=True)
+                counter_add("vigia_policy_reloads_total", source=sig[0], outcome="error")
+                if _POLICY["compiled"] is None:
+                    _POLICY["compiled"] = CompiledPolicy(_DEFAULT_RULES, threshold_override=sig[-1])
+            _POLICY["signature"] = sig
+        _POLICY["checked_at"] = now
+        return _POLICY["compiled"]
+
+
+def _deterministic_verify_gate(payload: dict) -> (bool, str, float):
+    return _compiled_policy().evaluate(payload)
 
-    if hazard_type in ("none", "", "unknown"):
-        return False, "hazard_type_none", conf
-    if conf < threshold:
-        return False, f"confidence_below_{threshold}", conf
-    if url in ("", "pending") and hazard_type not in ("red_light_violation",):
-        return False, "missing_evidence_url", conf
 
-    return True, "passed_policy_gate", conf
\ No newline at end of file
+def _deterministic_verify_gate_batch(payloads) -> list:
+    """Vectorized gate: one (ok, reason, score) tuple per payload, in order."""
+    return _compiled_policy().evaluate_batch(payloads)
\ No newline at end of file
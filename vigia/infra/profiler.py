@@ -0,0 +1,333 @@
+"""
+On-demand sampling profiler for HTTP routes.
+
+    # header value for a signed profiling request, valid 10 minutes (needs PROFILE_SIGNING_KEY)
+    python -m vigia.infra.profiler token --ttl 600
+
+    # one flamegraph input from many requests (flamegraph.pl, speedscope, inferno)
+    python -m vigia.infra.profiler merge /tmp/vigia-profiles --kind cpu > audit.folded
+"""
+import os
+import sys
+import json
+import time
+import hmac
+import uuid
+import random
+import hashlib
+import logging
+import argparse
+import tempfile
+import functools
+import threading
+from datetime import datetime, timezone
+
+from ..core.config import _parse_int
+from ..core.telemetry import counter_add, histogram_record
+from .clients import get_profile_container_client
+
+
+# ---------- Sampling profiler ----------
+#
+# A request is profiled when either:
+#   - it carries X-Vigia-Profile: <expires epoch>.<hex HMAC-SHA256(PROFILE_SIGNING_KEY, expires)>
+#     (mint one with `python -m vigia.infra.profiler token`), or
+#   - it is picked at random with probability PROFILE_SAMPLE_RATE (0..1, default 0).
+# Neither set means off: the route pays for two env lookups.
+#
+# A profiled request gets a sampler thread that reads the request thread's stack every
+# PROFILE_INTERVAL_MS (default 5) for at most PROFILE_MAX_SECONDS (default 60).
+# PROFILE_THREADS=all samples every thread in the process instead (agent pools,
+# WAL committer, ...), prefixed with the thread name. Each sample is charged the wall time
+# since the previous one and the thread's CPU time over the same span (Unix thread CPU
+# clocks), so waiting on Kusto / the ledger shows as wall without CPU.
+#
+# When the request finishes the sampler writes, off the request path:
+#   <id>.wall.folded / <id>.cpu.folded - "frame;frame;... microseconds" (collapsed stacks)
+#   <id>.json                          - totals and the top vigia functions / leaf packages
+# to PROFILE_DIR (PROFILE_SINK=disk, default <tmp>/vigia-profiles) or to the
+# vigia-profiles container (PROFILE_SINK=blob, PROFILE_CONNECTION, default
+# AzureWebJobsStorage). At most PROFILE_MAX_CONCURRENT (default 2) requests per worker are
+# profiled at once; the response carries X-Vigia-Profile-Id.
+
+PROFILE_HEADER = "X-Vigia-Profile"
+PROFILE_CONTAINER = "vigia-profiles"
+
+_MAX_DEPTH = 128
+_TOP_N = 20
+
+_ACTIVE = {"n": 0}
+_ACTIVE_LOCK = threading.Lock()
+
+
+def _sample_rate() -> float:
+    try:
+        return min(1.0, max(0.0, float(os.environ.get("PROFILE_SAMPLE_RATE") or 0)))
+    except ValueError:
+        return 0.0
+
+
+def _sign(key: str, expires: int) -> str:
+    return hmac.new(key.encode("utf-8"), str(expires).encode("ascii"), hashlib.sha256).hexdigest()
+
+
+def _profile_token(key: str, ttl_s: int) -> str:
+    expires = int(time.time()) + ttl_s
+    return f"{expires}.{_sign(key, expires)}"
+
+
+def _token_valid(key: str, token: str) -> bool:
+    """Signature matches and the token expires in the future, but no more than PROFILE_TOKEN_MAX_SECONDS ahead."""
+    expires, _, sig = token.strip().partition(".")
+    try:
+        expires = int(expires)
+    except ValueError:
+        return False
+    max_ttl = _parse_int(os.environ.get("PROFILE_TOKEN_MAX_SECONDS", "3600"), 3600, 60, 86400)
+    if not (time.time() < expires <= time.time() + max_ttl):
+        return False
+    return hmac.compare_digest(sig, _sign(key, expires))
+
+
+def _profile_trigger(req):
+    """'header' / 'sample' when this request should be profiled, else None."""
+    key = os.environ.get("PROFILE_SIGNING_KEY")
+    token = req.headers.get(PROFILE_HEADER) if key else None
+    if token:
+        if _token_valid(key, token):
+            return "header"
+        counter_add("vigia_profiles_total", trigger="header", outcome="bad_token")
+    rate = _sample_rate()
+    if rate > 0 and random.random() < rate:
+        return "sample"
+    return None
+
+
+def _cpu_clock(ident: int):
+    try:
+        return time.pthread_getcpuclockid(ident)
+    except (AttributeError, OSError):
+        return None  # not available on this platform: CPU columns stay 0
+
+
+def _cpu_now(clock) -> float:
+    try:
+        return time.clock_gettime(clock)
+    except (OSError, TypeError):
+        return 0.0
+
+
+def _fold(frame, prefix=None) -> tuple:
+    """Stack as ("module:function", ...) from the outermost frame to the leaf."""
+    out = []
+    while frame is not None and len(out) < _MAX_DEPTH:
+        out.append(f"{frame.f_globals.get('__name__', '?')}:{frame.f_code.co_name}")
+        frame = frame.f_back
+    if prefix:
+        out.append(prefix)
+    out.reverse()
+    return tuple(out)
+
+
+def _attribution(stack: tuple):
+    """(innermost vigia function, top-level package of the leaf frame)."""
+    owner = next((f for f in reversed(stack) if f.startswith("vigia.")), "(outside vigia)")
+    leaf = stack[-1].split(":", 1)[0].split(".", 1)[0] if stack else "?"
+    return owner, leaf
+
+
+class ProfileSession(threading.Thread):
+    """Samples one request; writes its profile once stop() is called."""
+
+    def __init__(self, endpoint: str, trigger: str, target_ident: int):
+        super().__init__(name=f"vigia-profiler-{endpoint}", daemon=False)
+        self.endpoint = endpoint
+        self.trigger = trigger
+        self.target_ident = target_ident
+        self.all_threads = (os.environ.get("PROFILE_THREADS") or "request").strip().lower() == "all"
+        self.interval_s = _parse_int(os.environ.get("PROFILE_INTERVAL_MS", "5"), 5, 1, 1000) / 1000.0
+        self.max_s = _parse_int(os.environ.get("PROFILE_MAX_SECONDS", "60"), 60, 1, 3600)
+        self.profile_id = f"{datetime.now(timezone.utc):%Y%m%dT%H%M%SZ}-{endpoint}-{uuid.uuid4().hex[:8]}"
+        self.wall = {}  # stack -> microseconds
+        self.cpu = {}
+        self.samples = 0
+        self._stop_evt = threading.Event()
+        self._t0 = time.perf_counter()
+        self._elapsed_s = 0.0
+
+    def stop(self):
+        self._elapsed_s = time.perf_counter() - self._t0
+        self._stop_evt.set()
+
+    def _targets(self):
+        if not self.all_threads:
+            return {self.target_ident: None}
+        names = {t.ident: t.name for t in threading.enumerate()}
+        return {ident: names.get(ident, str(ident)) for ident in sys._current_frames() if ident != self.ident}
+
+    def run(self):
+        clocks = {self.target_ident: _cpu_clock(self.target_ident)}
+        last_cpu = {self.target_ident: _cpu_now(clocks[self.target_ident])}
+        last_wall = time.perf_counter()
+        deadline = last_wall + self.max_s
+        while not self._stop_evt.wait(self.interval_s):
+            now = time.perf_counter()
+            wall_us = int((now - last_wall) * 1e6)
+            last_wall = now
+            frames = sys._current_frames()
+            for ident, label in self._targets().items():
+                frame = frames.get(ident)
+                if frame is None:
+                    continue
+                if ident not in clocks:
+                    clocks[ident] = _cpu_clock(ident)
+                    last_cpu[ident] = _cpu_now(clocks[ident])
+                cpu_now = _cpu_now(clocks[ident])
+                cpu_us = int(max(0.0, cpu_now - last_cpu[ident]) * 1e6)
+                last_cpu[ident] = cpu_now
+                stack = _fold(frame, label)
+                self.wall[stack] = self.wall.get(stack, 0) + wall_us
+                if cpu_us:
+                    self.cpu[stack] = self.cpu.get(stack, 0) + cpu_us
+            del frames
+            self.samples += 1
+            if now >= deadline:
+                break
+        self._elapsed_s = self._elapsed_s or (time.perf_counter() - self._t0)
+        try:
+            _write_profile(self)
+            counter_add("vigia_profiles_total", trigger=self.trigger, outcome="written")
+        except Exception:
+            logging.warning("Writing profile %s failed", self.profile_id, exc_info=True)
+            counter_add("vigia_profiles_total", trigger=self.trigger, outcome="error")
+        finally:
+            with _ACTIVE_LOCK:
+                _ACTIVE["n"] -= 1
+
+    def summary(self) -> dict:
+        by_function, by_leaf = {}, {}
+        for kind, table in (("wall_ms", self.wall), ("cpu_ms", self.cpu)):
+            for stack, us in table.items():
+                owner, leaf = _attribution(stack)
+                for agg, k in ((by_function, owner), (by_leaf, leaf)):
+                    row = agg.setdefault(k, {"wall_ms": 0.0, "cpu_ms": 0.0})
+                    row[kind] += us / 1000.0
+
+        def _top(agg):
+            rows = sorted(agg.items(), key=lambda kv: -kv[1]["wall_ms"])[:_TOP_N]
+            return [{"name": k, "wall_ms": round(v["wall_ms"], 1), "cpu_ms": round(v["cpu_ms"], 1)} for k, v in rows]
+
+        return {
+            "profile_id": self.profile_id,
+            "endpoint": self.endpoint,
+            "trigger": self.trigger,
+            "threads": "all" if self.all_threads else "request",
+            "interval_ms": round(self.interval_s * 1000.0, 1),
+            "samples": self.samples,
+            "elapsed_ms": round(self._elapsed_s * 1000.0, 1),
+            "wall_ms": round(sum(self.wall.values()) / 1000.0, 1),
+            "cpu_ms": round(sum(self.cpu.values()) / 1000.0, 1),
+            "by_function": _top(by_function),
+            "by_leaf_package": _top(by_leaf),
+        }
+
+
+def _folded(table: dict) -> str:
+    return "".join(f"{';'.join(stack)} {us}\n" for stack, us in sorted(table.items()) if us > 0)
+
+
+def _write_profile(session: ProfileSession):
+    files = {
+        f"{session.profile_id}.wall.folded": _folded(session.wall),
+        f"{session.profile_id}.cpu.folded": _folded(session.cpu),
+        f"{session.profile_id}.json": json.dumps(session.summary(), indent=2),
+    }
+    if (os.environ.get("PROFILE_SINK") or "disk").strip().lower() == "blob":
+        container = get_profile_container_client(PROFILE_CONTAINER)
+        for name, text in files.items():
+            container.get_blob_client(name).upload_blob(text.encode("utf-8"), overwrite=True)
+    else:
+        root = os.environ.get("PROFILE_DIR") or os.path.join(tempfile.gettempdir(), "vigia-profiles")
+        os.makedirs(root, exist_ok=True)
+        for name, text in files.items():
+            with open(os.path.join(root, name), "w", encoding="utf-8") as f:
+                f.write(text)
+    histogram_record("vigia_profile_samples", session.samples, endpoint=session.endpoint)
+
+
+def _start_session(endpoint: str, trigger: str):
+    limit = _parse_int(os.environ.get("PROFILE_MAX_CONCURRENT", "2"), 2, 1, 64)
+    with _ACTIVE_LOCK:
+        if _ACTIVE["n"] >= limit:
+            counter_add("vigia_profiles_total", trigger=trigger, outcome="skipped_busy")
+            return None
+        _ACTIVE["n"] += 1
+    session = ProfileSession(endpoint, trigger, threading.get_ident())
+    session.start()
+    return session
+
+
+def profiled(fn):
+    """Route decorator (below @bp.route): profile the call when _profile_trigger(req) says so."""
+
+    @functools.wraps(fn)
+    def wrapper(req, *args, **kwargs):
+        trigger = _profile_trigger(req)
+        session = _start_session(fn.__name__, trigger) if trigger else None
+        if session is None:
+            return fn(req, *args, **kwargs)
+        try:
+            resp = fn(req, *args, **kwargs)
+        finally:
+            session.stop()
+        try:
+            resp.headers[f"{PROFILE_HEADER}-Id"] = session.profile_id
+        except Exception:
+            pass
+        return resp
+
+    return wrapper
+
+
+# ---------- CLI ----------
+
+def _merge(paths, kind: str) -> dict:
+    merged = {}
+    for p in paths:
+        files = [os.path.join(p, n) for n in sorted(os.listdir(p))] if os.path.isdir(p) else [p]
+        for fp in files:
+            if not fp.endswith(f".{kind}.folded"):
+                continue
+            with open(fp, encoding="utf-8") as f:
+                for line in f:
+                    stack, _, n = line.rstrip("\n").rpartition(" ")
+                    if stack and n.isdigit():
+                        merged[stack] = merged.get(stack, 0) + int(n)
+    return merged
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="Request profiling helpers")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    tok = sub.add_parser("token", help=f"print a signed {PROFILE_HEADER} header value")
+    tok.add_argument("--ttl", type=int, default=600, help="seconds until the token expires")
+    mrg = sub.add_parser("merge", help="sum .folded profiles (files or directories) into one")
+    mrg.add_argument("paths", nargs="+")
+    mrg.add_argument("--kind", default="wall", choices=["wall", "cpu"])
+    args = ap.parse_args(argv)
+
+    if args.cmd == "token":
+        key = os.environ.get("PROFILE_SIGNING_KEY")
+        if not key:
+            print("PROFILE_SIGNING_KEY is not set", file=sys.stderr)
+            return 2
+        print(_profile_token(key, max(1, args.ttl)))
+        return 0
+
+    merged = _merge(args.paths, args.kind)
+    sys.stdout.write("".join(f"{stack} {n}\n" for stack, n in sorted(merged.items())))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
\ No newline at end of file
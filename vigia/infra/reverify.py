@@ -0,0 +1,330 @@
+"""
+Bulk re-verification of stored ledger receipts (LEDGER_WRITTEN rows in AuditEvents).
+
+    # resume the "nightly" job from its checkpoint, 8 verifier processes
+    python -m vigia.infra.reverify --job nightly --workers 8
+
+    # re-check everything written since a date, without appending audit rows
+    python -m vigia.infra.reverify --job adhoc --since 2025-01-01T00:00:00Z --dry-run
+"""
+import os
+import sys
+import json
+import time
+import hashlib
+import logging
+import argparse
+import tempfile
+import multiprocessing
+from datetime import datetime, timezone
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from ..core.config import _parse_int, get_audit_archive_table_name, get_audit_table_name, get_kusto_db_name, require_env
+from ..core.kql import _escape_kql_string
+from ..core.telemetry import counter_add, gauge_set
+from .audit_archive import _audit_archive_mode
+from .audit_cache import _audit_cache_record
+from .audit_store import _audit_append_rows, _audit_row
+from .clients import get_ledger_service_cert_pem, get_receipt_verifier, get_reverify_checkpoint_container_client
+from .kusto import _kusto_query, _rows_as_dicts
+
+
+# ---------- Receipt re-verification ----------
+#
+# LEDGER_WRITTEN rows are read in (UpdatedAt, EventId) order, RECEIPT_REVERIFY_PAGE_ROWS
+# at a time. Each page is verified across a pool (RECEIPT_REVERIFY_EXECUTOR=process|thread,
+# RECEIPT_REVERIFY_WORKERS). The service certificate is fetched once per ledger identity
+# and handed to the workers when they start. After each page the outcomes are appended as
+# RECEIPT_REVERIFIED / RECEIPT_REVERIFY_FAILED rows (one .append per page, one per source
+# row: an event anchored twice gets an outcome for each receipt), and the cursor is saved
+# so a stopped job resumes after the last finished page.
+#
+# RECEIPT_REVERIFY_CHECKPOINT_STORE=blob keeps checkpoints as <job>.json in the
+# vigia-reverify-checkpoints container (RECEIPT_REVERIFY_CHECKPOINT_CONNECTION, default:
+# the AzureWebJobsStorage connection string), so a route call landing on another
+# instance resumes the same job; =local keeps them under RECEIPT_REVERIFY_CHECKPOINT_DIR.
+# Default: blob when a storage connection is configured, local otherwise (CLI runs).
+
+REVERIFY_CHECKPOINT_CONTAINER = "vigia-reverify-checkpoints"
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_WORKER = {}
+
+
+def _reverify_init(verifier, certs: dict):
+    _WORKER["verify"] = verifier
+    _WORKER["certs"] = certs  # ledger identity -> service cert PEM
+
+
+def _reverify_one(task):
+    """(page index, ok, error) for one receipt; runs inside a pool worker."""
+    index, identity, receipt_result = task
+    try:
+        _WORKER["verify"](
+            receipt_result["receipt"],
+            _WORKER["certs"][identity],
+            application_claims=receipt_result.get("applicationClaims"),
+        )
+        return index, True, ""
+    except Exception as e:
+        return index, False, f"{type(e).__name__}: {e}"
+
+
+# --- checkpoints ---
+
+def _checkpoint_store() -> str:
+    store = (os.environ.get("RECEIPT_REVERIFY_CHECKPOINT_STORE") or "").strip().lower()
+    if store in ("blob", "local"):
+        return store
+    configured = os.environ.get(os.environ.get("RECEIPT_REVERIFY_CHECKPOINT_CONNECTION") or "AzureWebJobsStorage")
+    return "blob" if configured or os.environ.get("AzureWebJobsStorage__accountName") else "local"
+
+
+def _checkpoint_name(job: str) -> str:
+    safe = "".join(c if c.isalnum() or c in "-_." else "_" for c in job) or "default"
+    return f"{safe}.json"
+
+
+def _checkpoint_path(job: str) -> str:
+    directory = os.environ.get("RECEIPT_REVERIFY_CHECKPOINT_DIR") or os.path.join(tempfile.gettempdir(), "vigia-reverify")
+    return os.path.join(directory, _checkpoint_name(job))
+
+
+def _load_checkpoint(job: str) -> dict:
+    if _checkpoint_store() == "blob":
+        from azure.core.exceptions import ResourceNotFoundError
+
+        blob = get_reverify_checkpoint_container_client(REVERIFY_CHECKPOINT_CONTAINER).get_blob_client(_checkpoint_name(job))
+        try:
+            return json.loads(blob.download_blob().readall())
+        except ResourceNotFoundError:
+            return {}
+    try:
+        with open(_checkpoint_path(job), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def _save_checkpoint(job: str, state: dict):
+    if _checkpoint_store() == "blob":
+        blob = get_reverify_checkpoint_container_client(REVERIFY_CHECKPOINT_CONTAINER).get_blob_client(_checkpoint_name(job))
+        blob.upload_blob(json.dumps(state).encode("utf-8"), overwrite=True)
+        return
+    path = _checkpoint_path(job)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(state, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+# --- source rows ---
+
+def _as_dict(v):
+    if isinstance(v, str):
+        try:
+            return json.loads(v)
+        except ValueError:
+            return {}
+    return v if isinstance(v, dict) else {}
+
+
+def _ledger_written_page(after, limit: int) -> list:
+    """
+    The next `limit` LEDGER_WRITTEN rows after the (UpdatedAt, EventId) cursor. With
+    AUDIT_ARCHIVE_MODE=on, rows whose raw copy was already dropped come from the
+    archive Timeline (deduped by EventId and UpdatedAt, raw rows win).
+    """
+    t, eid = after
+    ts = t.strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+    cursor = (
+        "| extend U = bin(UpdatedAt, 1microsecond)\n"
+        f"        | where U > datetime('{ts}') or (U == datetime('{ts}') and strcmp(EventId, '{_escape_kql_string(eid)}') > 0)"
+    )
+    source = f"""{get_audit_table_name()}
+        | where Status == 'LEDGER_WRITTEN'
+        {cursor}"""
+    if _audit_archive_mode() == "on":
+        source = f"""union
+        ({source}
+         | project U, EventId, ReportId, DeviceId, Timestamp, Latitude, Longitude, HazardType, LedgerTxId, Receipt, Details, Tier = 0),
+        ({get_audit_archive_table_name()}
+         | where LastAt >= datetime('{ts}')
+         | mv-expand T = Timeline
+         | where tostring(T.Status) == 'LEDGER_WRITTEN'
+         | extend UpdatedAt = todatetime(T.UpdatedAt)
+         {cursor}
+         | project U, EventId, ReportId, DeviceId, Timestamp, Latitude, Longitude, HazardType,
+                   LedgerTxId = tostring(T.LedgerTxId), Receipt, Details = T.Details, Tier = 1)
+        | summarize arg_min(Tier, *) by EventId, U
+        | project-away Tier"""
+    q = f"""
+        {source}
+        | sort by U asc, EventId asc
+        | take {limit}
+        | project U, EventId, ReportId, DeviceId, Timestamp, Latitude, Longitude, HazardType, LedgerTxId, Receipt,
+                  CollectionId = tostring(Details.collectionId), CertSha256 = tostring(Details.service_cert_sha256)
+        """
+    rows = _rows_as_dicts(_kusto_query(q, "receipt_reverify_page", db=get_kusto_db_name()))
+    for r in rows:
+        if isinstance(r.get("U"), datetime) and r["U"].tzinfo is None:
+            r["U"] = r["U"].replace(tzinfo=timezone.utc)
+    return rows
+
+
+def _result_row(src: dict, ok: bool, error: str, job: str, cert_sha: str) -> dict:
+    details = {
+        "job": job,
+        "transactionId": src.get("LedgerTxId") or "",
+        "collectionId": src.get("CollectionId") or "",
+        "service_cert_sha256": cert_sha,
+        "cert_changed": bool(src.get("CertSha256")) and src.get("CertSha256") != cert_sha,
+    }
+    if error:
+        details["error"] = error
+    row = _audit_row(
+        src["EventId"], src.get("ReportId") or "", "RECEIPT_REVERIFIED" if ok else "RECEIPT_REVERIFY_FAILED", details
+    )
+    # keep the event's columns so feeds/filters by device or hazard type still match
+    for c in ("DeviceId", "Timestamp", "Latitude", "Longitude", "HazardType"):
+        if src.get(c) is not None:
+            row[c] = src[c].strftime("%Y-%m-%dT%H:%M:%S.%fZ") if isinstance(src[c], datetime) else src[c]
+    return row
+
+
+def _executor(kind: str, workers: int, verifier, certs: dict):
+    if kind == "thread":
+        return ThreadPoolExecutor(max_workers=workers, initializer=_reverify_init, initargs=(verifier, certs))
+    # spawn: the Functions worker is multi-threaded, forking it is not safe
+    return ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_reverify_init,
+        initargs=(verifier, certs),
+    )
+
+
+def _reverify_receipts(job: str = "default", since: str = None, reset: bool = False, max_rows: int = None,
+                       time_budget_s: float = None, executor: str = None, workers: int = None,
+                       write_results: bool = True) -> dict:
+    """
+    Re-verify LEDGER_WRITTEN receipts after the job's checkpoint (or `since`).
+    Stops at the end of the table, after `max_rows`, or once `time_budget_s` is spent
+    (checked between pages). Returns the run summary, including receipts/s.
+    """
+    page_rows = _parse_int(os.environ.get("RECEIPT_REVERIFY_PAGE_ROWS", "500"), 500, 1, 10000)
+    workers = workers or _parse_int(os.environ.get("RECEIPT_REVERIFY_WORKERS", str(os.cpu_count() or 2)), 2, 1, 64)
+    executor = (executor or os.environ.get("RECEIPT_REVERIFY_EXECUTOR") or "process").strip().lower()
+
+    state = {} if reset else _load_checkpoint(job)
+    if since:
+        after = (datetime.fromisoformat(since.replace("Z", "+00:00")).astimezone(timezone.utc), "")
+    elif state.get("cursor"):
+        after = (datetime.fromisoformat(state["cursor"][0].replace("Z", "+00:00")), state["cursor"][1])
+    else:
+        after = (_EPOCH, "")
+
+    identity = require_env("CONFIDENTIAL_LEDGER_ID")
+    cert_pem = get_ledger_service_cert_pem()
+    cert_sha = hashlib.sha256(cert_pem.encode("utf-8")).hexdigest()
+
+    summary = {"job": job, "verified": 0, "failed": 0, "missing_receipt": 0, "pages": 0, "done": False}
+    t0 = time.perf_counter()
+    with _executor(executor, workers, get_receipt_verifier(), {identity: cert_pem}) as pool:
+        while True:
+            limit = page_rows if max_rows is None else min(page_rows, max_rows - summary["verified"] - summary["failed"])
+            if limit <= 0:
+                break
+            page = _ledger_written_page(after, limit)
+            if not page:
+                summary["done"] = True
+                break
+
+            # outcomes by position in the page: an event anchored twice has two rows
+            tasks, outcomes = [], [(False, "missing_receipt")] * len(page)
+            for i, r in enumerate(page):
+                receipt = _as_dict(r.get("Receipt"))
+                if receipt.get("receipt"):
+                    tasks.append((i, identity, receipt))
+            for i, ok, err in pool.map(_reverify_one, tasks, chunksize=max(1, len(tasks) // (workers * 4))):
+                outcomes[i] = (ok, err)
+            missing = len(page) - len(tasks)
+
+            rows = [_result_row(r, *outcomes[i], job, cert_sha) for i, r in enumerate(page)]
+            if write_results:
+                _audit_append_rows(rows)
+                for row in rows:
+                    # drops the events' shared-cache blobs; api workers see the rows via Kusto
+                    _audit_cache_record(row)
+
+            ok_n = sum(1 for ok, _ in outcomes if ok)
+            summary["verified"] += ok_n
+            summary["failed"] += len(outcomes) - ok_n
+            summary["missing_receipt"] += missing
+            summary["pages"] += 1
+            counter_add("vigia_receipt_reverify_total", ok_n, outcome="verified")
+            counter_add("vigia_receipt_reverify_total", len(outcomes) - ok_n, outcome="failed")
+
+            last = page[-1]
+            after = (last["U"], last["EventId"])
+            state = {
+                "cursor": [after[0].strftime("%Y-%m-%dT%H:%M:%S.%fZ"), after[1]],
+                "verified": state.get("verified", 0) + ok_n,
+                "failed": state.get("failed", 0) + len(outcomes) - ok_n,
+                "updated_at": datetime.now(timezone.utc).isoformat(),
+            }
+            _save_checkpoint(job, state)
+
+            if len(page) < limit:
+                summary["done"] = True
+                break
+            if time_budget_s is not None and time.perf_counter() - t0 >= time_budget_s:
+                break
+
+    elapsed = time.perf_counter() - t0
+    n = summary["verified"] + summary["failed"]
+    summary.update(
+        {
+            "elapsed_s": round(elapsed, 3),
+            "receipts_per_s": round(n / elapsed, 2) if elapsed > 0 else 0.0,
+            "cursor": state.get("cursor"),
+            "executor": executor,
+            "workers": workers,
+        }
+    )
+    gauge_set("vigia_receipt_reverify_receipts_per_s", summary["receipts_per_s"])
+    logging.info("Receipt re-verification %s: %s", job, summary)
+    return summary
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="Re-verify stored ledger receipts (LEDGER_WRITTEN rows)")
+    ap.add_argument("--job", default="default", help="checkpoint name")
+    ap.add_argument("--since", default=None, help="ISO datetime; ignores the checkpoint")
+    ap.add_argument("--reset", action="store_true", help="start from the beginning")
+    ap.add_argument("--max-rows", type=int, default=None)
+    ap.add_argument("--time-budget-s", type=float, default=None)
+    ap.add_argument("--executor", choices=["process", "thread"], default=None)
+    ap.add_argument("--workers", type=int, default=None)
+    ap.add_argument("--dry-run", action="store_true", help="do not append audit rows")
+    args = ap.parse_args(argv)
+
+    out = _reverify_receipts(
+        job=args.job,
+        since=args.since,
+        reset=args.reset,
+        max_rows=args.max_rows,
+        time_budget_s=args.time_budget_s,
+        executor=args.executor,
+        workers=args.workers,
+        write_results=not args.dry_run,
+    )
+    print(json.dumps(out, indent=2, default=str))
+    return 0 if out["failed"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
\ No newline at end of file
@@ -0,0 +1,187 @@
+import os
+import math
+import time
+import logging
+import threading
+
+from ..core.config import _parse_int, get_audit_archive_table_name, get_audit_table_name
+from ..core.kql import _escape_kql_string
+from ..core.telemetry import counter_add
+from .audit_archive import _audit_archive_mode
+from .kusto import _kusto_query, _rows_as_dicts
+
+
+# ---------- Risk-tiered routing (fast lane / agent review / fast reject) ----------
+#
+# RISK_ROUTING_MODE:
+#   off     - every policy-passing report goes to the blocking agent (default)
+#   shadow  - score + route every report, still ask the agent, record agreement
+#   enforce - fast_approve / fast_reject skip the agent
+
+ROUTE_FAST_APPROVE = "fast_approve"
+ROUTE_AGENT_REVIEW = "agent_review"
+ROUTE_FAST_REJECT = "fast_reject"
+
+_DEVICE_HISTORY = {}  # device_id -> {"accepted": n, "rejected": n, "loaded_at": ts}
+_DEVICE_LOCK = threading.Lock()
+_DEVICE_HISTORY_MAX = 50000
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.environ.get(name, default))
+    except Exception:
+        return float(default)
+
+
+_DEFAULT_RISK_WEIGHTS = (0.5, 0.25, 0.25)
+_RISK_WEIGHTS = {}  # raw RISK_WEIGHTS value -> parsed (confidence, corroboration, device)
+
+
+def _risk_weights() -> tuple:
+    """RISK_WEIGHTS as three non-negative floats; a malformed value falls back to the defaults."""
+    raw = os.environ.get("RISK_WEIGHTS") or ""
+    weights = _RISK_WEIGHTS.get(raw)
+    if weights is None:
+        weights = _DEFAULT_RISK_WEIGHTS
+        if raw.strip():
+            try:
+                parsed = tuple(float(x) for x in raw.split(",")[:3])
+                if len(parsed) < 3 or not all(math.isfinite(w) and w >= 0 for w in parsed):
+                    raise ValueError("expected three non-negative numbers")
+                weights = parsed
+            except ValueError as e:
+                logging.warning("Ignoring RISK_WEIGHTS=%r (%s); using %s", raw, e, _DEFAULT_RISK_WEIGHTS)
+        _RISK_WEIGHTS[raw] = weights
+    return weights
+
+
+def _risk_mode() -> str:
+    mode = (os.environ.get("RISK_ROUTING_MODE") or "off").strip().lower()
+    return mode if mode in ("off", "shadow", "enforce") else "off"
+
+
+def _device_history(device_id: str) -> dict:
+    """
+    Accepted/rejected counts for a device, cached per worker.
+    Loaded from the audit table on miss/expiry; updated locally by _risk_record_outcome().
+    """
+    ttl_s = _parse_int(os.environ.get("RISK_DEVICE_HISTORY_TTL_SECONDS", "300"), 300, 0, 86400)
+    now = time.time()
+
+    with _DEVICE_LOCK:
+        h = _DEVICE_HISTORY.get(device_id)
+        if h and now - h["loaded_at"] < ttl_s:
+            return dict(h)
+
+    if not device_id:
+        return {"accepted": 0, "rejected": 0, "loaded_at": now}
+
+    days = _parse_int(os.environ.get("RISK_DEVICE_HISTORY_DAYS", "30"), 30, 1, 365)
+    did = _escape_kql_string(device_id)
+    source = f"""{get_audit_table_name()}
+        | where DeviceId == '{did}'
+        | where UpdatedAt > ago({days}d)
+        | where Status in ('LEDGER_WRITTEN', 'REJECTED')"""
+    if _audit_archive_mode() == "on":
+        # raw rows may already be gone; duplicates across tiers collapse in arg_max
+        source = f"""union
+        ({source} | project EventId, UpdatedAt, Status),
+        ({get_audit_archive_table_name()}
+         | where DeviceId == '{did}'
+         | where LastAt > ago({days}d)
+         | mv-expand T = Timeline
+         | project EventId, UpdatedAt = todatetime(T.UpdatedAt), Status = tostring(T.Status)
+         | where UpdatedAt > ago({days}d) and Status in ('LEDGER_WRITTEN', 'REJECTED'))"""
+    q = f"""
+        {source}
+        | summarize arg_max(UpdatedAt, Status) by EventId
+        | summarize Accepted = countif(Status == 'LEDGER_WRITTEN'), Rejected = countif(Status == 'REJECTED')
+        """
+    try:
+        rows = _rows_as_dicts(_kusto_query(q, "risk_device_history"))
+        row = rows[0] if rows else {}
+        h = {"accepted": int(row.get("Accepted") or 0), "rejected": int(row.get("Rejected") or 0), "loaded_at": now}
+    except Exception:
+        h = {"accepted": 0, "rejected": 0, "loaded_at": now}
+
+    with _DEVICE_LOCK:
+        if len(_DEVICE_HISTORY) >= _DEVICE_HISTORY_MAX:
+            _DEVICE_HISTORY.clear()
+        _DEVICE_HISTORY[device_id] = h
+    return dict(h)
+
+
+def _risk_record_outcome(device_id: str, accepted: bool):
+    if not device_id:
+        return
+    with _DEVICE_LOCK:
+        h = _DEVICE_HISTORY.get(device_id)
+        if h is None:
+            return  # next read loads the full history anyway
+        h["accepted" if accepted else "rejected"] += 1
+
+
+def _risk_assess(payload: dict, policy_score: float, dedupe: dict) -> dict:
+    """
+    Combine policy confidence, dedupe corroboration and device acceptance history
+    into a trust score in [0, 1] and pick a route.
+    """
+    w_conf, w_corr, w_dev = _risk_weights()
+    saturation = _parse_int(os.environ.get("RISK_CORROBORATION_SATURATION", "10"), 10, 1, 10000)
+    approve_at = _env_float("RISK_FAST_APPROVE_THRESHOLD", 0.9)
+    reject_at = _env_float("RISK_FAST_REJECT_THRESHOLD", 0.35)
+    min_history = _parse_int(os.environ.get("RISK_MIN_DEVICE_HISTORY", "5"), 5, 0, 100000)
+
+    device_id = str(payload.get("DeviceId") or "")
+    hist = _device_history(device_id)
+    seen = hist["accepted"] + hist["rejected"]
+    device_rate = (hist["accepted"] + 1.0) / (seen + 2.0)  # Laplace-smoothed acceptance
+
+    duplicates = int((dedupe or {}).get("duplicate_count") or 0)
+    corroboration = min(1.0, duplicates / float(saturation))
+    conf = max(0.0, min(1.0, float(policy_score or 0.0)))
+
+    total_w = (w_conf + w_corr + w_dev) or 1.0
+    trust = (w_conf * conf + w_corr * corroboration + w_dev * device_rate) / total_w
+
+    if trust >= approve_at and seen >= min_history:
+        route = ROUTE_FAST_APPROVE
+    elif trust <= reject_at:
+        route = ROUTE_FAST_REJECT
+    else:
+        route = ROUTE_AGENT_REVIEW
+
+    reasoning = (
+        f"Risk routing {route}: trust={trust:.3f} from confidence={conf:.3f}, "
+        f"corroborating_reports={duplicates}, device_acceptance={device_rate:.2f} over {seen} finished reports "
+        f"(fast_approve>={approve_at}, fast_reject<={reject_at})"
+    )
+    return {
+        "route": route,
+        "trust": round(trust, 4),
+        "confidence": conf,
+        "corroboration": round(corroboration, 4),
+        "duplicate_count": duplicates,
+        "device_acceptance": round(device_rate, 4),
+        "device_finished_reports": seen,
+        "reasoning": reasoning,
+    }
+
+
+def _risk_record_shadow(risk: dict, agent_approve: bool):
+    """Agreement between the shadow route and the agent's verdict."""
+    route = risk.get("route")
+    if route == ROUTE_FAST_APPROVE:
+        agree = bool(agent_approve)
+    elif route == ROUTE_FAST_REJECT:
+        agree = not agent_approve
+    else:
+        agree = None
+    counter_add(
+        "vigia_risk_shadow_total",
+        route=route,
+        agent_approve=str(bool(agent_approve)).lower(),
+        agree="n/a" if agree is None else str(agree).lower(),
+    )
+    return agree
\ No newline at end of file
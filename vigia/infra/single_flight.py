@@ -0,0 +1,274 @@
+import os
+import time
+import uuid
+import sqlite3
+import logging
+import tempfile
+import threading
+from contextlib import contextmanager
+
+from ..core.config import _parse_int
+from ..core.telemetry import counter_add, gauge_set, histogram_record
+from .clients import get_lease_container_client
+
+
+# ---------- Single-flight per EventId ----------
+#
+# AUDITOR_SINGLE_FLIGHT:
+#   process - concurrent copies of an EventId in this worker wait for the first one
+#             and return its response (default)
+#   local   - process + a lease row in a SQLite file under AUDITOR_LEASE_DIR, shared by
+#             the worker processes on one host (also the offline stand-in for blob)
+#   blob    - process + a blob lease per EventId in LEASE_CONTAINER, shared by all instances
+#   off     - no coordination
+#
+# Waiting is bounded by AUDITOR_SINGLE_FLIGHT_WAIT_SECONDS. A copy that waited on
+# another instance's lease cannot see that response; once it holds the lease it
+# runs the pipeline, whose idempotency read returns the winner's terminal state.
+# Leases last AUDITOR_LEASE_SECONDS and are renewed while the pipeline runs, so a
+# crashed holder blocks its EventId for at most one lease period.
+
+LEASE_CONTAINER = "vigia-leases"
+
+
+class _Flight:
+    __slots__ = ("done", "result")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+
+
+class SingleFlightGroup:
+    """In-process keyed futures: the first caller for a key runs, the rest wait for its result."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights = {}
+
+    def run(self, key: str, fn, wait_s: float):
+        """(True, fn()) for the leader; (False, leader's result or None on timeout/error) for waiters."""
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+            gauge_set("vigia_single_flight_inflight", len(self._flights))
+
+        if not leader:
+            t0 = time.perf_counter()
+            done = flight.done.wait(wait_s)
+            histogram_record("vigia_single_flight_wait_ms", (time.perf_counter() - t0) * 1000.0)
+            return False, flight.result if done else None
+
+        try:
+            flight.result = fn()
+            return True, flight.result
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+                gauge_set("vigia_single_flight_inflight", len(self._flights))
+            flight.done.set()
+
+
+class LocalLeaseStore:
+    """Leases in a SQLite table: shared by processes on one host; stand-in for BlobLeaseStore."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn().execute(
+            "CREATE TABLE IF NOT EXISTS leases (key TEXT PRIMARY KEY, owner TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+
+    def _conn(self) -> sqlite3.Connection:
+        c = getattr(self._local, "conn", None)
+        if c is None or getattr(self._local, "pid", None) != os.getpid():
+            c = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            c.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = c
+            self._local.pid = os.getpid()
+        return c
+
+    def acquire(self, key: str, owner: str, ttl_s: int) -> bool:
+        now = time.time()
+        c = self._conn()
+        c.execute("BEGIN IMMEDIATE")
+        try:
+            row = c.execute("SELECT owner, expires_at FROM leases WHERE key = ?", (key,)).fetchone()
+            if row and row[0] != owner and row[1] > now:
+                c.execute("COMMIT")
+                return False
+            c.execute("INSERT OR REPLACE INTO leases (key, owner, expires_at) VALUES (?, ?, ?)", (key, owner, now + ttl_s))
+            c.execute("COMMIT")
+            return True
+        except Exception:
+            c.execute("ROLLBACK")
+            raise
+
+    def renew(self, key: str, owner: str, ttl_s: int) -> bool:
+        cur = self._conn().execute(
+            "UPDATE leases SET expires_at = ? WHERE key = ? AND owner = ?", (time.time() + ttl_s, key, owner)
+        )
+        return cur.rowcount == 1
+
+    def release(self, key: str, owner: str):
+        self._conn().execute("DELETE FROM leases WHERE key = ? AND owner = ?", (key, owner))
+
+
+class BlobLeaseStore:
+    """
+    One empty blob per key; the blob lease is the cross-instance lock (15-60s, renewed).
+    The holder deletes the blob on release, so the container only holds keys in flight.
+    """
+
+    def __init__(self, container_client):
+        self.container = container_client
+        self._leases = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, key: str, owner: str, ttl_s: int) -> bool:
+        from azure.core.exceptions import HttpResponseError, ResourceExistsError
+
+        blob = self.container.get_blob_client(key)
+        for _ in range(2):
+            try:
+                blob.upload_blob(b"", overwrite=False)
+            except (ResourceExistsError, HttpResponseError) as e:
+                if getattr(e, "status_code", 409) not in (409, 412):  # exists, or exists and leased
+                    raise
+            try:
+                lease = blob.acquire_lease(lease_duration=min(60, max(15, ttl_s)), lease_id=owner)
+            except HttpResponseError as e:
+                if e.status_code == 409:  # LeaseAlreadyPresent
+                    return False
+                if e.status_code == 404:  # the previous holder deleted it in between
+                    continue
+                raise
+            with self._lock:
+                self._leases[(key, owner)] = lease
+            return True
+        return False
+
+    def renew(self, key: str, owner: str, ttl_s: int) -> bool:
+        with self._lock:
+            lease = self._leases.get((key, owner))
+        if lease is None:
+            return False
+        lease.renew()
+        return True
+
+    def release(self, key: str, owner: str):
+        from azure.core.exceptions import HttpResponseError
+
+        with self._lock:
+            lease = self._leases.pop((key, owner), None)
+        if lease is None:
+            return
+        try:
+            # deleting under the lease releases it too
+            self.container.get_blob_client(key).delete_blob(lease=lease)
+        except HttpResponseError as e:
+            if e.status_code not in (404, 412):  # already gone, or the lease was lost
+                raise
+
+
+@contextmanager
+def _held_lease(store, key: str, ttl_s: int, wait_s: float):
+    """Yields True once the lease is held (renewed in the background), False if it was not free in time."""
+    owner = str(uuid.uuid4())
+    deadline = time.monotonic() + wait_s
+    while not store.acquire(key, owner, ttl_s):
+        counter_add("vigia_single_flight_lease_busy_total")
+        if time.monotonic() >= deadline:
+            yield False
+            return
+        time.sleep(min(0.25, max(0.0, deadline - time.monotonic())))
+
+    stop = threading.Event()
+
+    def _renew():
+        while not stop.wait(ttl_s / 3.0):
+            try:
+                if not store.renew(key, owner, ttl_s):
+                    logging.warning("Single-flight lease for %s was lost", key)
+                    return
+            except Exception:
+                logging.warning("Single-flight lease renewal failed", exc_info=True)
+
+    t = threading.Thread(target=_renew, name="vigia-lease-renew", daemon=True)
+    t.start()
+    try:
+        yield True
+    finally:
+        stop.set()
+        try:
+            store.release(key, owner)
+        except Exception:
+            logging.warning("Single-flight lease release failed (expires in %ss)", ttl_s, exc_info=True)
+
+
+_STATE = {}
+_STATE_LOCK = threading.Lock()
+
+
+def _single_flight_mode() -> str:
+    mode = (os.environ.get("AUDITOR_SINGLE_FLIGHT") or "process").strip().lower()
+    return mode if mode in ("off", "process", "local", "blob") else "process"
+
+
+def _single_flight_group() -> SingleFlightGroup:
+    group = _STATE.get("group")
+    if group is None:
+        with _STATE_LOCK:
+            group = _STATE.setdefault("group", SingleFlightGroup())
+    return group
+
+
+def _lease_store(mode: str):
+    if mode not in ("local", "blob"):
+        return None
+    store = _STATE.get(mode)
+    if store is None:
+        with _STATE_LOCK:
+            if mode not in _STATE:
+                if mode == "blob":
+                    _STATE[mode] = BlobLeaseStore(get_lease_container_client(LEASE_CONTAINER))
+                else:
+                    directory = os.environ.get("AUDITOR_LEASE_DIR") or os.path.join(tempfile.gettempdir(), "vigia-leases")
+                    _STATE[mode] = LocalLeaseStore(os.path.join(directory, "leases.sqlite3"))
+            store = _STATE[mode]
+    return store
+
+
+def _single_flight(key: str, fn):
+    """
+    Run fn() for `key` at most once at a time. Returns (role, result):
+      leader   - this call ran fn()
+      follower - another call in this worker ran it; result is its result
+      timeout  - the wait bound passed (or the leader failed); result is None
+    """
+    mode = _single_flight_mode()
+    if mode == "off":
+        return "leader", fn()
+
+    wait_s = _parse_int(os.environ.get("AUDITOR_SINGLE_FLIGHT_WAIT_SECONDS", "30"), 30, 0, 600)
+    store = _lease_store(mode)
+
+    def _lead():
+        if store is None:
+            return "leader", fn()
+        ttl_s = _parse_int(os.environ.get("AUDITOR_LEASE_SECONDS", "60"), 60, 15, 60)
+        with _held_lease(store, key, ttl_s, wait_s) as held:
+            return ("leader", fn()) if held else ("timeout", None)
+
+    is_leader, out = _single_flight_group().run(key, _lead, wait_s)
+    if out is None:
+        role, result = "timeout", None
+    else:
+        role, result = out
+        if not is_leader and role == "leader":
+            role = "follower"
+    counter_add("vigia_single_flight_total", role=role)
+    return role, result
\ No newline at end of file
@@ -1,114 +1,231 @@
+import os
+import json
 import logging
 import azure.functions as func
 
-from vigia.core.jsonx import json_response
-from vigia.core.kql import _escape_kql_string
-from vigia.core.config import _parse_int, get_kusto_db_name, get_audit_table_name
-from vigia.infra.clients import get_kusto_client
-from vigia.infra.audit_store import _audit_get_latest
+from vigia.core.jsonx import _json_default, json_response
+from vigia.core.config import _parse_int, get_kusto_db_name
+from vigia.infra.kusto import KustoBusyError, _kusto_query, _rows_as_dicts, kusto_profile
+from vigia.infra.audit_archive import _audit_archive_mode, _audit_compact, _audit_event_source
+from vigia.infra.audit_cache import _audit_cached, _explain_doc
+from vigia.infra.audit_store import _audit_get_latest, _audit_hydrate, _audit_merge_pending, _audit_timeline
+from vigia.infra.audit_changes import (
+    _audit_changes,
+    _changes_max_wait_seconds,
+    _changes_poll_seconds,
+    _decode_cursor,
+    _encode_cursor,
+    _start_cursor,
+)
+from vigia.infra.profiler import profiled
 
 bp = func.Blueprint()
 
 
+def _want_hydrate(req: func.HttpRequest) -> bool:
+    # payloads are stored once per event; later rows only carry Details.payload_ref
+    return (req.params.get("hydrate") or "").strip().lower() in ("1", "true", "yes")
+
+
 @bp.route(route="audit-latest", methods=["GET"])
+@profiled
+@kusto_profile("dashboard")
 def audit_latest(req: func.HttpRequest) -> func.HttpResponse:
     """
-    GET /audit-latest?event_id=...
+    GET /audit-latest?event_id=...&hydrate=true
     """
     try:
         event_id = (req.params.get("event_id") or "").strip()
         if not event_id:
             return json_response({"error": "Missing event_id"}, 400)
 
-        latest = _audit_get_latest(event_id)
+        cached = _audit_cached(event_id, _audit_timeline, "latest")
+        if cached is not None:
+            latest = cached.latest
+            if latest and _want_hydrate(req):
+                row = _audit_hydrate(event_id, cached.rows)[cached.latest_index]
+                latest = {k: row.get(k) for k in latest}
+        else:
+            latest = _audit_get_latest(event_id)
+            if latest and _want_hydrate(req):
+                latest = _audit_hydrate(event_id, [latest])[0]
         return json_response({"found": bool(latest), "event_id": event_id, "latest": latest}, 200)
 
+    except KustoBusyError as b:
+        return json_response({"error": str(b), "retry_after_s": b.retry_after_s}, 503, headers={"Retry-After": str(b.retry_after_s)})
     except Exception as e:
         logging.error("audit-latest error", exc_info=True)
         return json_response({"error": str(e)}, 500)
 
 
 @bp.route(route="audit-history", methods=["GET"])
+@profiled
+@kusto_profile("dashboard")
 def audit_history(req: func.HttpRequest) -> func.HttpResponse:
     """
-    GET /audit-history?event_id=...&limit=50
+    GET /audit-history?event_id=...&limit=50&hydrate=true
     """
     try:
         db = get_kusto_db_name()
-        audit_table = get_audit_table_name()
 
         event_id = (req.params.get("event_id") or "").strip()
         if not event_id:
             return json_response({"error": "Missing event_id"}, 400)
 
         limit = _parse_int(req.params.get("limit", "50"), 50, 1, 200)
-        eid = _escape_kql_string(event_id)
+        cached = _audit_cached(event_id, _audit_timeline, "history")
+        if cached is not None:
+            rows = cached.rows
+            rows = _audit_hydrate(event_id, rows)[:limit] if _want_hydrate(req) else rows[:limit]
+            return json_response({"event_id": event_id, "count": len(rows), "rows": rows}, 200)
 
         q = f"""
-            {audit_table}
-            | where EventId == '{eid}'
+            {_audit_event_source(event_id)}
             | extend VerificationReasoning = column_ifexists('VerificationReasoning', tostring(Details.verification_reasoning))
             | sort by UpdatedAt asc
             | take {limit}
             """
-        table = get_kusto_client().execute(db, q).primary_results[0]
-        cols = [c.column_name for c in table.columns]
-        rows = [dict(zip(cols, r)) for r in table.rows]
+        table = _kusto_query(q, "audit_history", db=db)
+        rows = _audit_merge_pending(event_id, _rows_as_dicts(table))[:limit]
+        if _want_hydrate(req):
+            rows = _audit_hydrate(event_id, rows)
 
         return json_response({"event_id": event_id, "count": len(rows), "rows": rows}, 200)
 
+    except KustoBusyError as b:
+        return json_response({"error": str(b), "retry_after_s": b.retry_after_s}, 503, headers={"Retry-After": str(b.retry_after_s)})
     except Exception as e:
         logging.error("audit-history error", exc_info=True)
         return json_response({"error": str(e)}, 500)
 
 
 @bp.route(route="audit-explain", methods=["GET"])
+@profiled
+@kusto_profile("dashboard")
 def audit_explain(req: func.HttpRequest) -> func.HttpResponse:
     """
-    GET /audit-explain?event_id=...
-    Compact explanation for copilot.
+    GET /audit-explain?event_id=...&hydrate=true
+    Compact explanation for copilot (hydrate=true adds the stored payload).
     """
     try:
         db = get_kusto_db_name()
-        audit_table = get_audit_table_name()
 
         event_id = (req.params.get("event_id") or "").strip()
         if not event_id:
             return json_response({"error": "Missing event_id"}, 400)
 
-        eid = _escape_kql_string(event_id)
-
-        q = f"""
-            {audit_table}
-            | where EventId == '{eid}'
-            | extend VerificationReasoning = column_ifexists('VerificationReasoning', tostring(Details.verification_reasoning))
-            | sort by UpdatedAt asc
-            """
-        table = get_kusto_client().execute(db, q).primary_results[0]
-        cols = [c.column_name for c in table.columns]
-        rows = [dict(zip(cols, r)) for r in table.rows]
-
-        if not rows:
-            return json_response({"found": False, "event_id": event_id}, 200)
-
-        latest = rows[-1]
-        explanation = {
-            "event_id": event_id,
-            "latest_status": latest.get("Status"),
-            "updated_at": str(latest.get("UpdatedAt")),
-            "verification_reasoning": latest.get("VerificationReasoning"),
-            "timeline": [
-                {
-                    "status": r.get("Status"),
-                    "updated_at": str(r.get("UpdatedAt")),
-                    "agent": r.get("Agent"),
-                    "reasoning": r.get("VerificationReasoning"),
-                }
-                for r in rows
-            ],
-        }
+        cached = _audit_cached(event_id, _audit_timeline, "explain")
+        if cached is not None:
+            rows, explanation = cached.rows, cached.explain
+        else:
+            q = f"""
+                {_audit_event_source(event_id)}
+                | extend VerificationReasoning = column_ifexists('VerificationReasoning', tostring(Details.verification_reasoning))
+                | sort by UpdatedAt asc
+                """
+            table = _kusto_query(q, "audit_explain", db=db)
+            rows = _audit_merge_pending(event_id, _rows_as_dicts(table))
+            explanation = _explain_doc(event_id, rows)
+
+        if rows and _want_hydrate(req):
+            # copy: the cached document is shared
+            hydrated = _audit_hydrate(event_id, rows)[-1].get("Details") or {}
+            explanation = dict(explanation, payload=hydrated.get("payload"))
         return json_response(explanation, 200)
 
+    except KustoBusyError as b:
+        return json_response({"error": str(b), "retry_after_s": b.retry_after_s}, 503, headers={"Retry-After": str(b.retry_after_s)})
     except Exception as e:
         logging.error("audit-explain error", exc_info=True)
-        return json_response({"error": str(e)}, 500)
\ No newline at end of file
+        return json_response({"error": str(e)}, 500)
+
+
+def _csv_param(req: func.HttpRequest, name: str) -> set:
+    return {v.strip().casefold() for v in (req.params.get(name) or "").split(",") if v.strip()}
+
+
+def _public_change(row: dict) -> dict:
+    # copy: rows may be shared with the in-memory tail
+    return {k: v for k, v in row.items() if k != "ChangeKey"}
+
+
+def _sse_body(rows: list, cursor) -> str:
+    # The Functions HTTP worker returns whole bodies, so each response is one
+    # long-poll window in SSE framing; EventSource reconnects with Last-Event-ID.
+    out = [f"retry: {int(_changes_poll_seconds() * 1000)}\n\n"]
+    for r in rows:
+        data = json.dumps(_public_change(r), ensure_ascii=False, default=_json_default)
+        out.append(f"id: {_encode_cursor((r['IngestedAt'], r['ChangeKey']))}\nevent: audit\ndata: {data}\n\n")
+    out.append(f"id: {_encode_cursor(cursor)}\n\n")
+    return "".join(out)
+
+
+@bp.route(route="audit-changes", methods=["GET"])
+@profiled
+def audit_changes(req: func.HttpRequest) -> func.HttpResponse:
+    """
+    GET /audit-changes?since=<cursor|ISO datetime>&status=A,B&hazard_type=...&device_id=...
+                      &limit=500&wait=20&lookback_minutes=15
+    Audit transitions after the cursor, oldest first. wait=N long-polls up to N seconds
+    when nothing is new. Accept: text/event-stream (or stream=sse) returns SSE framing.
+    """
+    try:
+        since = (req.params.get("since") or req.headers.get("Last-Event-ID") or "").strip()
+        try:
+            cursor = _decode_cursor(since) if since else _start_cursor(
+                _parse_int(req.params.get("lookback_minutes", "15"), 15, 0, 1440)
+            )
+        except ValueError as e:
+            return json_response({"error": str(e)}, 400)
+
+        filters = {
+            "Status": _csv_param(req, "status"),
+            "HazardType": _csv_param(req, "hazard_type"),
+            "DeviceId": _csv_param(req, "device_id"),
+        }
+        limit = _parse_int(req.params.get("limit", "500"), 500, 1, 1000)
+        wait_s = _parse_int(req.params.get("wait", "0"), 0, 0, _changes_max_wait_seconds())
+
+        rows, next_cursor, more = _audit_changes(cursor, filters, limit, wait_s)
+        sse = (req.params.get("stream") or "").strip().lower() == "sse" or "text/event-stream" in (req.headers.get("Accept") or "")
+        if sse:
+            return func.HttpResponse(
+                _sse_body(rows, next_cursor),
+                status_code=200,
+                headers={"Cache-Control": "no-cache"},
+                mimetype="text/event-stream",
+            )
+
+        return json_response(
+            {
+                "cursor": _encode_cursor(next_cursor),
+                "count": len(rows),
+                "more": more,
+                "rows": [_public_change(r) for r in rows],
+            },
+            200,
+        )
+
+    except Exception as e:
+        logging.error("audit-changes error", exc_info=True)
+        return json_response({"error": str(e)}, 500)
+
+
+# ---------- Compaction ----------
+#
+# With AUDIT_ARCHIVE_MODE=on, every AUDIT_COMPACT_SCHEDULE (NCRONTAB, default daily at
+# 03:15) finished events are folded into the archive table, AUDIT_COMPACT_BATCH per
+# command, up to AUDIT_COMPACT_MAX_EVENTS per run (see vigia/infra/audit_archive.py).
+
+@bp.timer_trigger(
+    schedule=os.environ.get("AUDIT_COMPACT_SCHEDULE") or "0 15 3 * * *",
+    arg_name="timer",
+    run_on_startup=False,
+    use_monitor=True,
+)
+def audit_compactor(timer: func.TimerRequest) -> None:
+    """Compacts finished audit events into the archive table."""
+    if _audit_archive_mode() == "off":
+        return
+    summary = _audit_compact(time_budget_s=_parse_int(os.environ.get("AUDIT_COMPACT_TIME_BUDGET_SECONDS", "240"), 240, 10, 3600))
+    logging.info("Audit compaction: %s", summary)
\ No newline at end of file
@@ -1,184 +1,486 @@
 import os
+import json
+import math
 import hashlib
 import logging
+from concurrent.futures import ThreadPoolExecutor
 import azure.functions as func
 
+from vigia.core.config import _parse_int
 from vigia.core.jsonx import json_response
-from vigia.core.timeutil import _to_iso_datetime
+from vigia.core.telemetry import counter_add, request_timings, span
+from vigia.core.report import Report, as_report
 
-from vigia.infra.audit_store import _audit_append, _audit_get_latest
+from vigia.infra.admission import _admit_report
+from vigia.infra.audit_payload import _hydrate_details
+from vigia.infra.audit_store import _audit_append, _audit_get_latest, _audit_hydrate, _audit_ledger_anchor, _audit_stuck_events
 from vigia.infra.dedupe import _compute_event_id, _kql_dedupe_summary
+from vigia.infra.hotspots import _hotspot_record
 from vigia.infra.policy import _deterministic_verify_gate
-from vigia.infra.ledger import _ledger_write_and_verify
+from vigia.infra.ledger import _ledger_collection_for, _ledger_write_and_verify
+from vigia.infra.single_flight import _single_flight
+from vigia.infra.risk import ROUTE_AGENT_REVIEW, ROUTE_FAST_APPROVE, _risk_assess, _risk_mode, _risk_record_outcome, _risk_record_shadow
 
-from vigia.agents.notes import _agent_note
-from vigia.agents.gate import _verification_agent_gate
+from vigia.agents.dispatcher import _dispatch_agent_note
+from vigia.agents.batch import _verification_agent_gate_batched
+from vigia.infra.profiler import profiled
 
 bp = func.Blueprint()
 
+TERMINAL_STATUSES = ("REJECTED", "LEDGER_WRITTEN", "REWARDED")
+CHECKPOINT_STATUSES = (
+    "RECEIVED",
+    "AUDITING",
+    "DEDUPE_DONE",
+    "DEFERRED",
+    "VERIFICATION_AGENT_VERDICT",
+    "RISK_ROUTED",
+    "LEDGER_SUBMITTED",
+)
+
 
 @bp.route(route="autonomous-auditor", methods=["POST"])
+@profiled
 def autonomous_auditor(req: func.HttpRequest) -> func.HttpResponse:
     """
     Fabric Activator entrypoint (kept) + NEW:
     - After deterministic gate passes, require VerificationAgent approval BEFORE ledger write.
     - Store agent reasoning into AuditEvents.VerificationReasoning (and Details.verification_reasoning fallback).
     """
-    try:
-        event_data = req.get_json() or {}
+    with request_timings() as timings, span("auditor.request") as root:
+        resp = _run_auditor(req, timings)
+        root.set_attribute("status_code", resp.status_code)
+        return resp
 
-        payload = dict(event_data)
-        payload["Timestamp"] = _to_iso_datetime(payload.get("Timestamp"))
-        report_id = str(payload.get("ReportId") or payload.get("reportId") or "")
-        device_id = str(payload.get("DeviceId") or payload.get("deviceId") or "")
-        payload["ReportId"] = report_id
-        payload["DeviceId"] = device_id
+
+def _run_auditor(req: func.HttpRequest, timings) -> func.HttpResponse:
+    try:
+        try:
+            # parsed and normalized once; stages read its cached fields
+            payload = Report(req.get_json() or {})
+        except ValueError as e:
+            counter_add("vigia_auditor_outcomes_total", outcome="Invalid")
+            return json_response({"error": str(e)}, 400)
+        report_id, device_id = payload.report_id, payload.device_id
 
         event_id = _compute_event_id(payload)
 
-        _audit_append(event_id, report_id, "RECEIVED", {"payload": payload})
+        shed = _admit_report(device_id, payload.hazard_type)
+        if shed is not None:
+            reason, retry_after_s = shed
+            retry_after = str(max(1, math.ceil(retry_after_s)))
+            counter_add("vigia_auditor_outcomes_total", outcome="Shed", reason=reason)
+            return json_response(
+                {"status": "Shed", "event_id": event_id, "reason": reason, "retry_after_s": int(retry_after)},
+                429,
+                headers={"Retry-After": retry_after},
+            )
 
-        latest = _audit_get_latest(event_id)
-        if latest and latest.get("Status") in ("REJECTED", "LEDGER_WRITTEN", "REWARDED"):
+        role, resp = _single_flight(
+            event_id, lambda: _audit_event(payload, event_id, report_id, device_id, timings)
+        )
+        if role == "timeout":
+            counter_add("vigia_auditor_outcomes_total", outcome="In_Progress")
             return json_response(
-                {
-                    "status": "Idempotent_Return",
-                    "event_id": event_id,
-                    "latest_status": latest.get("Status"),
-                    "latest_details": latest.get("Details"),
-                    "verification_reasoning": latest.get("VerificationReasoning"),
-                },
-                200,
+                {"status": "In_Progress", "event_id": event_id, "retry_after_s": 5},
+                503,
+                headers={"Retry-After": "5"},
+            )
+        if role == "follower":
+            counter_add("vigia_auditor_outcomes_total", outcome="Single_Flight_Shared")
+            # each invocation gets its own response object
+            return func.HttpResponse(
+                resp.get_body(), status_code=resp.status_code, headers=dict(resp.headers), mimetype=resp.mimetype
             )
+        return resp
 
-        _audit_append(event_id, report_id, "AUDITING", {"payload": payload, "note": "audit_started"})
+    except Exception as e:
+        logging.error("Sentinel Failure", exc_info=True)
+        counter_add("vigia_auditor_outcomes_total", outcome="Error")
+        return json_response({"error": str(e)}, 500)
 
-        dedupe = _kql_dedupe_summary(payload)
-        _audit_append(event_id, report_id, "DEDUPE_DONE", {"payload": payload, **dedupe})
 
-        forensic_agent_id = os.environ.get("FORENSIC_AGENT_ID", "")
-        forensic_run = _agent_note(
-            forensic_agent_id,
-            {"event_id": event_id, "dedupe": dedupe, "payload": payload},
-            note_type="forensic_dedupe_note",
-        )
-        if forensic_run:
-            _audit_append(
-                event_id,
-                report_id,
-                "FORENSIC_AGENT_TRIGGERED",
-                {"payload": payload, **forensic_run, "agent": "ForensicAnalyst"},
-            )
+# ---------- Pipeline state machine ----------
+#
+# Every stage ends with a checkpoint row whose Details.pipeline holds the outputs
+# of the stages so far (dedupe, policy gate, verdict, route). An invocation reads the
+# event's latest checkpoint/terminal row once and continues after it, so a retry
+# after a crash does not repeat dedupe or the VerificationAgent call:
+#
+#   (no row)                                 -> receive -> RECEIVED
+#   RECEIVED                                 -> audit   -> AUDITING
+#   AUDITING                                 -> dedupe  -> DEDUPE_DONE
+#   DEDUPE_DONE, DEFERRED                    -> verify  -> VERIFICATION_AGENT_VERDICT | RISK_ROUTED
+#                                                          (or REJECTED / DEFERRED)
+#   VERIFICATION_AGENT_VERDICT, RISK_ROUTED,
+#   LEDGER_SUBMITTED                         -> anchor  -> LEDGER_WRITTEN | REJECTED
+#
+# Stages run inside _single_flight(EventId). Rows written before Details.pipeline
+# existed carry no stage outputs; such events resume at dedupe.
+
+
+class _PipelineRun:
+    """One pass over an event: its identity, request timings and the checkpointed stage outputs."""
+
+    __slots__ = ("payload", "event_id", "report_id", "device_id", "timings", "state")
 
-        ok, reason, score = _deterministic_verify_gate(payload)
+    def __init__(self, payload: Report, event_id: str, report_id: str, device_id: str, timings, state: dict = None):
+        self.payload = payload
+        self.event_id = event_id
+        self.report_id = report_id
+        self.device_id = device_id
+        self.timings = timings
+        self.state = dict(state or {})
 
-        # Keep the existing async note (doesn't gate)
-        verification_agent_id = os.environ.get("VERIFICATION_AGENT_ID", "")
-        vrun = _agent_note(
-            verification_agent_id,
-            {"event_id": event_id, "policy_ok": ok, "reason": reason, "score": score, "payload": payload},
-            note_type="verification_audit_note",
+    def checkpoint(self, status: str, details: dict = None, verification_reasoning: str = ""):
+        _audit_append(
+            self.event_id,
+            self.report_id,
+            status,
+            {"payload": self.payload, **(details or {}), "pipeline": dict(self.state)},
+            verification_reasoning=verification_reasoning,
         )
-        if vrun:
-            _audit_append(
-                event_id,
-                report_id,
-                "VERIFICATION_AGENT_TRIGGERED",
-                {"payload": payload, **vrun, "agent": "VerificationAgent"},
-            )
 
-        if not ok:
-            _audit_append(
-                event_id,
-                report_id,
-                "REJECTED",
-                {"payload": payload, "reason": reason, "score": score, "dedupe": dedupe},
-                verification_reasoning=f"Deterministic gate rejected: {reason} (confidence={score})",
-            )
-            return json_response(
-                {
-                    "status": "Rejected",
-                    "event_id": event_id,
-                    "reason": reason,
-                    "confidence": score,
-                    "dedupe": dedupe,
-                },
-                200,
-            )
+    def finish(self, status: str, details: dict, verification_reasoning: str = ""):
+        _audit_append(
+            self.event_id,
+            self.report_id,
+            status,
+            {"payload": self.payload, **details, "timings": self.timings.summary()},
+            verification_reasoning=verification_reasoning,
+        )
 
-        # ---------- NEW: VerificationAgent must approve BEFORE ledger write ----------
-        verdict, vmsg = _verification_agent_gate(
-            verification_agent_id,
+
+def _audit_event(payload, event_id: str, report_id: str, device_id: str, timings) -> func.HttpResponse:
+    """
+    Runs the event from its latest checkpoint; runs once per EventId at a time
+    (see vigia/infra/single_flight.py). payload=None (sweeper) uses the stored one.
+    """
+    with span("stage.resume_read"):
+        latest = _audit_get_latest(
+            event_id, statuses=TERMINAL_STATUSES + CHECKPOINT_STATUSES, prefer=TERMINAL_STATUSES
+        )
+    status = (latest or {}).get("Status")
+    if status in TERMINAL_STATUSES:
+        counter_add("vigia_auditor_outcomes_total", outcome="Idempotent_Return")
+        return json_response(
             {
+                "status": "Idempotent_Return",
                 "event_id": event_id,
-                "payload": payload,
-                "dedupe": dedupe,
-                "deterministic_gate": {"ok": ok, "reason": reason, "score": score},
-                "expected_action": "approve_before_ledger_write",
+                "latest_status": status,
+                "latest_details": latest.get("Details"),
+                "verification_reasoning": latest.get("VerificationReasoning"),
             },
+            200,
         )
 
-        if verdict is None:
-            _audit_append(
-                event_id,
-                report_id,
-                "REJECTED",
-                {"payload": payload, "reason": "verification_agent_no_verdict", "note": vmsg, "dedupe": dedupe},
-                verification_reasoning="VerificationAgent did not provide a verdict in time (or failed).",
-            )
-            return json_response(
-                {"status": "Rejected", "event_id": event_id, "reason": "verification_agent_no_verdict"},
-                200,
-            )
+    state = {}
+    if latest:
+        if payload is None:
+            details = _audit_hydrate(event_id, [latest])[0].get("Details") or {}
+            payload = details.get("payload")
+        else:
+            details = _hydrate_details(latest.get("Details"), {}) or {}
+        state = details.get("pipeline") if isinstance(details.get("pipeline"), dict) else {}
+        if not state and status not in ("RECEIVED", "AUDITING"):
+            status = "AUDITING"
+        counter_add("vigia_pipeline_resumes_total", stage=status)
+    if not isinstance(payload, dict):
+        raise ValueError(f"No stored payload to resume event {event_id}")
+    payload = as_report(payload)
 
-        approve = bool(verdict.get("approve"))
-        reasoning = str(verdict.get("reasoning") or "").strip()
-        quality_score = verdict.get("quality_score", None)
+    run = _PipelineRun(
+        payload,
+        event_id,
+        report_id or payload.report_id,
+        device_id or payload.device_id,
+        timings,
+        state,
+    )
+    while True:
+        out = _STAGES[status](run)
+        if not isinstance(out, str):
+            return out
+        status = out
 
-        _audit_append(
-            event_id,
-            report_id,
-            "VERIFICATION_AGENT_VERDICT",
-            {"payload": payload, "approve": approve, "quality_score": quality_score, "verdict": verdict},
-            verification_reasoning=reasoning,
+
+def _stage_receive(run: _PipelineRun) -> str:
+    with span("stage.received"):
+        run.checkpoint("RECEIVED")
+    return "RECEIVED"
+
+
+def _stage_audit(run: _PipelineRun) -> str:
+    with span("stage.auditing"):
+        run.checkpoint("AUDITING", {"note": "audit_started"})
+    _hotspot_record(run.payload)
+    return "AUDITING"
+
+
+def _stage_dedupe(run: _PipelineRun) -> str:
+    with span("stage.dedupe"):
+        dedupe = _kql_dedupe_summary(run.payload)
+        run.state["dedupe"] = dedupe
+        run.checkpoint("DEDUPE_DONE", dedupe)
+
+    forensic_agent_id = os.environ.get("FORENSIC_AGENT_ID", "")
+    with span("stage.forensic_note"):
+        _dispatch_agent_note(
+            forensic_agent_id,
+            {"event_id": run.event_id, "dedupe": dedupe, "payload": run.payload},
+            "forensic_dedupe_note",
+            run.event_id,
+            run.report_id,
+            "FORENSIC_AGENT_TRIGGERED",
+            {"payload": run.payload, "agent": "ForensicAnalyst"},
         )
+    return "DEDUPE_DONE"
+
+
+def _stage_verify(run: _PipelineRun):
+    payload, event_id, report_id = run.payload, run.event_id, run.report_id
+    dedupe = run.state.get("dedupe") or {}
+    verification_agent_id = os.environ.get("VERIFICATION_AGENT_ID", "")
 
-        if not approve:
-            _audit_append(
+    policy = run.state.get("policy")
+    if policy is None:
+        with span("stage.policy_gate") as sp:
+            ok, reason, score = _deterministic_verify_gate(payload)
+            sp.set_attribute("reason", reason)
+        policy = run.state["policy"] = {"ok": ok, "reason": reason, "score": score}
+
+        # Non-gating note; queued by default (AGENT_NOTE_DISPATCH). Sent once: a resumed
+        # (deferred) event already has the gate result in its checkpoint.
+        with span("stage.verification_note"):
+            _dispatch_agent_note(
+                verification_agent_id,
+                {"event_id": event_id, "policy_ok": ok, "reason": reason, "score": score, "payload": payload},
+                "verification_audit_note",
                 event_id,
                 report_id,
-                "REJECTED",
-                {"payload": payload, "reason": "verification_agent_rejected", "quality_score": quality_score, "verdict": verdict},
-                verification_reasoning=reasoning or "VerificationAgent rejected without reasoning.",
-            )
-            return json_response(
-                {"status": "Rejected", "event_id": event_id, "reason": "verification_agent_rejected"},
-                200,
+                "VERIFICATION_AGENT_TRIGGERED",
+                {"payload": payload, "agent": "VerificationAgent"},
             )
+    ok, reason, score = policy["ok"], policy["reason"], policy["score"]
 
-        # If approved -> write to ledger
-        proof_hash = hashlib.sha256(event_id.encode("utf-8")).hexdigest()
-        ledger_out = _ledger_write_and_verify(proof_hash)
-
-        _audit_append(
-            event_id,
-            report_id,
-            "LEDGER_WRITTEN",
-            {"payload": payload, **ledger_out},
-            verification_reasoning=reasoning,
+    if not ok:
+        counter_add("vigia_auditor_outcomes_total", outcome="Rejected", reason=reason)
+        _risk_record_outcome(run.device_id, False)
+        run.finish(
+            "REJECTED",
+            {"reason": reason, "score": score, "dedupe": dedupe},
+            verification_reasoning=f"Deterministic gate rejected: {reason} (confidence={score})",
         )
-
         return json_response(
             {
-                "status": "Verified",
+                "status": "Rejected",
                 "event_id": event_id,
+                "reason": reason,
+                "confidence": score,
                 "dedupe": dedupe,
-                "ledger": ledger_out,
-                "verification_reasoning": reasoning,
             },
             200,
         )
 
-    except Exception as e:
-        logging.error("Sentinel Failure", exc_info=True)
-        return json_response({"error": str(e)}, 500)
\ No newline at end of file
+    # ---------- Risk routing: fast lane / agent review / fast reject ----------
+    risk = None
+    risk_mode = _risk_mode()
+    if risk_mode != "off":
+        with span("stage.risk_routing") as sp:
+            risk = _risk_assess(payload, score, dedupe)
+            sp.set_attribute("route", risk["route"])
+        counter_add("vigia_risk_routes_total", route=risk["route"], mode=risk_mode)
+    fast_lane = risk_mode == "enforce" and risk["route"] != ROUTE_AGENT_REVIEW
+
+    # ---------- NEW: VerificationAgent must approve BEFORE ledger write ----------
+    if fast_lane:
+        verdict = {
+            "approve": risk["route"] == ROUTE_FAST_APPROVE,
+            "reasoning": risk["reasoning"],
+            "quality_score": risk["trust"],
+            "source": "risk_routing",
+        }
+        vmsg = risk["route"]
+    else:
+        with span("stage.verification_gate"):
+            verdict, vmsg = _verification_agent_gate_batched(
+                verification_agent_id,
+                {
+                    "event_id": event_id,
+                    "payload": payload,
+                    "dedupe": dedupe,
+                    "deterministic_gate": {"ok": ok, "reason": reason, "score": score},
+                    "expected_action": "approve_before_ledger_write",
+                },
+            )
+
+    deferred = isinstance(vmsg, dict) and vmsg.get("error") in ("agent_circuit_open", "agent_bulkhead_full")
+    if verdict is None and deferred:
+        # Agent backend is shedding load: not a verdict on the report, so keep the event
+        # non-terminal and let the caller (or the sweeper) retry after the breaker cools down.
+        reason = f"verification_{vmsg['error']}"
+        retry_after = str(vmsg.get("retry_after_s") or 1)
+        counter_add("vigia_auditor_outcomes_total", outcome="Deferred", reason=reason)
+        run.checkpoint(
+            "DEFERRED",
+            {"reason": reason, "note": vmsg, "dedupe": dedupe, "timings": run.timings.summary()},
+            verification_reasoning="VerificationAgent unavailable (load shedding); event deferred for retry.",
+        )
+        return json_response(
+            {"status": "Deferred", "event_id": event_id, "reason": reason, "retry_after_s": int(retry_after)},
+            503,
+            headers={"Retry-After": retry_after},
+        )
+
+    if verdict is None:
+        counter_add("vigia_auditor_outcomes_total", outcome="Rejected", reason="verification_agent_no_verdict")
+        _risk_record_outcome(run.device_id, False)
+        run.finish(
+            "REJECTED",
+            {"reason": "verification_agent_no_verdict", "note": vmsg, "dedupe": dedupe},
+            verification_reasoning="VerificationAgent did not provide a verdict in time (or failed).",
+        )
+        return json_response(
+            {"status": "Rejected", "event_id": event_id, "reason": "verification_agent_no_verdict"},
+            200,
+        )
+
+    approve = bool(verdict.get("approve"))
+    reasoning = str(verdict.get("reasoning") or "").strip()
+    quality_score = verdict.get("quality_score", None)
+
+    verdict_details = {"approve": approve, "quality_score": quality_score, "verdict": verdict}
+    if risk is not None:
+        verdict_details["risk"] = risk
+        if not fast_lane:
+            verdict_details["risk_shadow_agree"] = _risk_record_shadow(risk, approve)
+
+    run.state.update(
+        {
+            "verdict": verdict,
+            "reasoning": reasoning,
+            "fast_lane": fast_lane,
+            "route": risk["route"] if fast_lane else ROUTE_AGENT_REVIEW,
+        }
+    )
+    status = "RISK_ROUTED" if fast_lane else "VERIFICATION_AGENT_VERDICT"
+    run.checkpoint(status, verdict_details, verification_reasoning=reasoning)
+    return status
+
+
+def _stage_anchor(run: _PipelineRun):
+    payload, event_id = run.payload, run.event_id
+    verdict = run.state.get("verdict") or {}
+    reasoning = run.state.get("reasoning") or ""
+
+    if not verdict.get("approve"):
+        reject_reason = "risk_fast_reject" if run.state.get("fast_lane") else "verification_agent_rejected"
+        counter_add("vigia_auditor_outcomes_total", outcome="Rejected", reason=reject_reason)
+        _risk_record_outcome(run.device_id, False)
+        run.finish(
+            "REJECTED",
+            {"reason": reject_reason, "quality_score": verdict.get("quality_score"), "verdict": verdict},
+            verification_reasoning=reasoning or "VerificationAgent rejected without reasoning.",
+        )
+        return json_response(
+            {"status": "Rejected", "event_id": event_id, "reason": reject_reason},
+            200,
+        )
+
+    # If approved -> write to ledger
+    proof_hash = hashlib.sha256(event_id.encode("utf-8")).hexdigest()
+    with span("stage.ledger_lookup"):
+        anchor = _audit_ledger_anchor(event_id)
+    collection_id, tx_id = anchor or (_ledger_collection_for(payload), None)
+    with span("stage.ledger"):
+        ledger_out = _ledger_write_and_verify(
+            proof_hash,
+            collection_id=collection_id,
+            transaction_id=tx_id,
+            on_submitted=lambda tx, coll: run.checkpoint(
+                "LEDGER_SUBMITTED", {"transactionId": tx, "collectionId": coll or ""}
+            ),
+        )
+
+    counter_add("vigia_auditor_outcomes_total", outcome="Verified")
+    _risk_record_outcome(run.device_id, True)
+    run.finish("LEDGER_WRITTEN", ledger_out, verification_reasoning=reasoning)
+
+    return json_response(
+        {
+            "status": "Verified",
+            "event_id": event_id,
+            "dedupe": run.state.get("dedupe") or {},
+            "ledger": ledger_out,
+            "verification_reasoning": reasoning,
+            "route": run.state.get("route") or ROUTE_AGENT_REVIEW,
+        },
+        200,
+    )
+
+
+# latest checkpoint -> stage that runs next
+_STAGES = {
+    None: _stage_receive,
+    "RECEIVED": _stage_audit,
+    "AUDITING": _stage_dedupe,
+    "DEDUPE_DONE": _stage_verify,
+    "DEFERRED": _stage_verify,
+    "VERIFICATION_AGENT_VERDICT": _stage_anchor,
+    "RISK_ROUTED": _stage_anchor,
+    "LEDGER_SUBMITTED": _stage_anchor,
+}
+
+
+# ---------- Stuck-event sweeper ----------
+#
+# Every PIPELINE_SWEEP_SCHEDULE (NCRONTAB, default every 5 minutes) the sweeper picks up to
+# PIPELINE_SWEEP_BATCH events whose latest checkpoint is older than PIPELINE_STUCK_MINUTES
+# (looking back PIPELINE_SWEEP_MAX_AGE_HOURS) and resumes them, PIPELINE_SWEEP_CONCURRENCY
+# at a time. Deferred events are retried the same way.
+
+@bp.timer_trigger(
+    schedule=os.environ.get("PIPELINE_SWEEP_SCHEDULE") or "0 */5 * * * *",
+    arg_name="timer",
+    run_on_startup=False,
+    use_monitor=False,
+)
+def pipeline_sweeper(timer: func.TimerRequest) -> None:
+    """Resumes auditor pipelines left in a non-terminal stage by crashed or deferred invocations."""
+    summary = _sweep_stuck_events()
+    logging.info("Pipeline sweep: %s", summary)
+
+
+def _resume_stuck(row: dict) -> str:
+    event_id = str(row.get("EventId") or "")
+    with request_timings() as timings, span("auditor.sweep") as sp:
+        sp.set_attribute("from_stage", row.get("Status"))
+        try:
+            role, resp = _single_flight(
+                event_id,
+                lambda: _audit_event(None, event_id, str(row.get("ReportId") or ""), str(row.get("DeviceId") or ""), timings),
+            )
+        except Exception:
+            logging.warning("Pipeline sweep failed for %s", event_id, exc_info=True)
+            return "Error"
+    if role != "leader":
+        return "In_Progress"
+    return str(json.loads(resp.get_body()).get("status") or "Error")
+
+
+def _sweep_stuck_events(limit: int = None) -> dict:
+    """Resume one batch of stuck events; returns counts by outcome."""
+    stuck_minutes = _parse_int(os.environ.get("PIPELINE_STUCK_MINUTES", "10"), 10, 1, 10080)
+    max_age_hours = _parse_int(os.environ.get("PIPELINE_SWEEP_MAX_AGE_HOURS", "24"), 24, 1, 720)
+    limit = limit or _parse_int(os.environ.get("PIPELINE_SWEEP_BATCH", "50"), 50, 1, 1000)
+    workers = _parse_int(os.environ.get("PIPELINE_SWEEP_CONCURRENCY", "4"), 4, 1, 32)
+
+    with span("auditor.sweep_query"):
+        rows = _audit_stuck_events(CHECKPOINT_STATUSES, TERMINAL_STATUSES, stuck_minutes, max_age_hours, limit)
+    outcomes = {}
+    if rows:
+        with ThreadPoolExecutor(max_workers=min(workers, len(rows))) as pool:
+            for outcome in pool.map(_resume_stuck, rows):
+                outcomes[outcome] = outcomes.get(outcome, 0) + 1
+                counter_add("vigia_pipeline_sweep_total", outcome=outcome)
+    return {"stuck": len(rows), "outcomes": outcomes}
\ No newline at end of file
@@ -1,21 +1,57 @@
+import time
 import logging
 import azure.functions as func
 
 from vigia.core.jsonx import json_response
 from vigia.core.kql import _escape_kql_string
 from vigia.core.config import _parse_int, _parse_float, get_kusto_db_name
-from vigia.infra.clients import get_kusto_client
+from vigia.infra.kusto import KustoBusyError, _kusto_query, _rows_as_dicts, kusto_profile
+from vigia.infra.hazard_sync import _conditional_json, _regional_delta, _scope_validators
+from vigia.infra.hotspots import _hotspot_aggregator, _kql_hotspot_topk
+from vigia.infra.profiler import profiled
 
 bp = func.Blueprint()
 
 
 @bp.route(route="query-hazards", methods=["GET"])
+@profiled
+@kusto_profile("dashboard")
 def query_road_hazards(req: func.HttpRequest) -> func.HttpResponse:
+    """
+    GET /query-hazards?hazard_type=Pothole&time_range_hours=24
+    GET /query-hazards?...&mode=topk&k=10&source=view|local
+        top-k geohash cells from the hotspot aggregates (see vigia/infra/hotspots.py);
+        with source=local, windows over 48h count their partial first day in whole
+    Conditional: ETag / Last-Modified, 304 on If-None-Match / If-Modified-Since
+    (see vigia/infra/hazard_sync.py).
+    """
     try:
         db = get_kusto_db_name()
-        hazard_type = _escape_kql_string(req.params.get("hazard_type", "Pothole"))
         hours = _parse_int(req.params.get("time_range_hours", "24"), default=24, min_v=1, max_v=168)
+        raw_type = req.params.get("hazard_type", "Pothole")
 
+        if (req.params.get("mode") or "").strip().lower() == "topk":
+            k = _parse_int(req.params.get("k", "5"), default=5, min_v=1, max_v=100)
+            source = (req.params.get("source") or "view").strip().lower()
+            if source == "local":
+                # per-worker aggregate, not Kusto data: validated by the body hash
+                return _conditional_json(req, "query_topk", lambda: _hotspot_aggregator().top(raw_type, hours, k, time.time()))
+            if source != "view":
+                return json_response({"error": "source must be 'view' or 'local'"}, 400)
+            etag, last_s = _scope_validators(
+                {"route": "query-hazards", "mode": "topk", "type": raw_type, "hours": hours, "k": k},
+                windowed=True,
+                hazard_type=raw_type,
+            )
+            return _conditional_json(
+                req,
+                "query_topk",
+                lambda: _rows_as_dicts(_kusto_query(_kql_hotspot_topk(raw_type, hours, k), "query_hazards_topk", db=db)),
+                etag,
+                last_s,
+            )
+
+        hazard_type = _escape_kql_string(raw_type)
         query = (
             "RoadTelemetry "
             f"| where HazardType == '{hazard_type}' "
@@ -23,24 +59,37 @@ def query_road_hazards(req: func.HttpRequest) -> func.HttpResponse:
             "| summarize Count = count() by Latitude, Longitude "
             "| top 5 by Count"
         )
-
-        table = get_kusto_client().execute(db, query).primary_results[0]
-        cols = [c.column_name for c in table.columns]
-        data = [dict(zip(cols, row)) for row in table.rows]
-        return json_response(data, 200)
+        etag, last_s = _scope_validators(
+            {"route": "query-hazards", "type": raw_type, "hours": hours}, windowed=True, hazard_type=raw_type
+        )
+        return _conditional_json(
+            req, "query", lambda: _rows_as_dicts(_kusto_query(query, "query_hazards", db=db)), etag, last_s
+        )
 
     except ValueError as ve:
         return json_response({"error": str(ve)}, 400)
+    except KustoBusyError as b:
+        return json_response({"error": str(b), "retry_after_s": b.retry_after_s}, 503, headers={"Retry-After": str(b.retry_after_s)})
     except Exception as e:
         logging.error("KQL Error", exc_info=True)
         return json_response({"error": str(e)}, 500)
 
 
-@bp.route(route="get-regional-hazards", methods=["POST"])
+@bp.route(route="get-regional-hazards", methods=["GET", "POST"])
+@profiled
+@kusto_profile("dashboard")
 def get_regional_hazards(req: func.HttpRequest) -> func.HttpResponse:
+    """
+    POST /get-regional-hazards {"n", "s", "e", "w"[, "since"]}
+    GET  /get-regional-hazards?n=&s=&e=&w=[&since=]
+    Full responses carry ETag / Last-Modified / X-Hazard-Watermark; with since=<watermark>
+    only rows ingested after it are returned, with the next watermark. Rows carry
+    ReportId and IngestedAt in both shapes; delta rows may repeat ones the client has,
+    so clients upsert them by ReportId.
+    """
     try:
         db = get_kusto_db_name()
-        body = req.get_json()
+        body = req.get_json() if req.method == "POST" else dict(req.params)
 
         n = _parse_float(body.get("n"), "n")
         s = _parse_float(body.get("s"), "s")
@@ -50,21 +99,32 @@ def get_regional_hazards(req: func.HttpRequest) -> func.HttpResponse:
         if s > n or w > e:
             return json_response({"error": "Invalid bounds: require s<=n and w<=e"}, 400)
 
+        since = body.get("since")
+        if since:
+            return json_response(_regional_delta(s, n, w, e, since), 200)
+
         query = (
             "RoadTelemetry "
             f"| where Latitude between({s} .. {n}) "
             f"| where Longitude between({w} .. {e}) "
             "| where ConfidenceScore > 0.7 "
-            "| project Latitude, Longitude, HazardType, ConfidenceScore, GForceZ, GaussianSplatURL"
+            "| extend IngestedAt = ingestion_time() "
+            "| project ReportId, Latitude, Longitude, HazardType, ConfidenceScore, GForceZ, GaussianSplatURL, IngestedAt"
+        )
+        etag, last_s = _scope_validators({"route": "get-regional-hazards", "bounds": [s, n, w, e]}, False, s, n, w, e)
+        return _conditional_json(
+            req,
+            "regional",
+            lambda: _rows_as_dicts(_kusto_query(query, "regional_hazards", db=db)),
+            etag,
+            last_s,
+            watermark=True,
         )
-
-        table = get_kusto_client().execute(db, query).primary_results[0]
-        cols = [c.column_name for c in table.columns]
-        results = [dict(zip(cols, row)) for row in table.rows]
-        return json_response(results, 200)
 
     except ValueError as ve:
         return json_response({"error": str(ve)}, 400)
+    except KustoBusyError as b:
+        return json_response({"error": str(b), "retry_after_s": b.retry_after_s}, 503, headers={"Retry-After": str(b.retry_after_s)})
     except Exception as e:
         logging.error("Regional KQL Error", exc_info=True)
         return json_response({"error": str(e)}, 500)
\ No newline at end of file
@@ -6,14 +6,17 @@ import azure.functions as func
 from vigia.core.jsonx import json_response
 from vigia.infra.ledger import _ledger_write_and_verify
 from vigia.infra.clients import get_project_client
+from vigia.infra.profiler import profiled
 
 bp = func.Blueprint()
 
 
 @bp.route(route="verify-work", methods=["POST"])
+@profiled
 def verify_work(req: func.HttpRequest) -> func.HttpResponse:
     """
     Manual ledger write endpoint (kept).
+    Body: {"proof_hash": "...", "collection_id": "..." (optional, default collection)}
     """
     try:
         body = req.get_json()
@@ -21,7 +24,7 @@ def verify_work(req: func.HttpRequest) -> func.HttpResponse:
         if not proof_hash:
             return json_response({"error": "Missing 'proof_hash' in body"}, 400)
 
-        ledger_out = _ledger_write_and_verify(proof_hash)
+        ledger_out = _ledger_write_and_verify(proof_hash, collection_id=(body.get("collection_id") or None))
 
         # Optional: send proof bundle to your agent for audit/reasoning (kept)
         agent_run_id = None
@@ -49,6 +52,7 @@ def verify_work(req: func.HttpRequest) -> func.HttpResponse:
             {
                 "status": "Verified",
                 "transactionId": ledger_out["transactionId"],
+                "collectionId": ledger_out["collectionId"],
                 "receipt_verified": True,
                 "agent_run_id": agent_run_id,
             },
@@ -0,0 +1,36 @@
+import logging
+import azure.functions as func
+
+from vigia.core.jsonx import json_response
+from vigia.core.config import _parse_int
+from vigia.core.telemetry import metrics_snapshot, recent_spans, render_prometheus
+from vigia.infra.profiler import profiled
+
+bp = func.Blueprint()
+
+
+@bp.route(route="metrics", methods=["GET"])
+@profiled
+def metrics(req: func.HttpRequest) -> func.HttpResponse:
+    """
+    GET /metrics                      -> Prometheus text exposition
+    GET /metrics?format=json&spans=50 -> counters/gauges/histograms + recent spans
+    Per-worker view: each Function App instance aggregates its own process.
+    """
+    try:
+        fmt = (req.params.get("format") or "prometheus").strip().lower()
+        if fmt == "json":
+            limit = _parse_int(req.params.get("spans", "50"), 50, 0, 1000)
+            out = metrics_snapshot()
+            out["spans"] = recent_spans(limit) if limit else []
+            return json_response(out, 200)
+
+        return func.HttpResponse(
+            render_prometheus(),
+            status_code=200,
+            mimetype="text/plain",
+        )
+
+    except Exception as e:
+        logging.error("metrics error", exc_info=True)
+        return json_response({"error": str(e)}, 500)
\ No newline at end of file
@@ -0,0 +1,25 @@
+import os
+import json
+import logging
+import azure.functions as func
+
+from vigia.agents.dispatcher import NOTE_SPILL_QUEUE, _run_note_job
+
+bp = func.Blueprint()
+
+
+@bp.queue_trigger(
+    arg_name="msg",
+    queue_name=NOTE_SPILL_QUEUE,
+    connection=os.environ.get("AGENT_NOTE_SPILL_CONNECTION") or "AzureWebJobsStorage",
+)
+def agent_note_spill(msg: func.QueueMessage) -> None:
+    """
+    Drains agent note jobs spilled by the in-process dispatcher (AGENT_NOTE_OVERFLOW=spill).
+    Raises when no run was created so the host retries and, after maxDequeueCount,
+    moves the message to the poison queue.
+    """
+    job = json.loads(msg.get_body().decode("utf-8"))
+    if not _run_note_job(job):
+        logging.warning("Spilled agent note produced no run: %s", job.get("note_type"))
+        raise RuntimeError("Agent note run was not created")
\ No newline at end of file
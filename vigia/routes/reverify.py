@@ -0,0 +1,44 @@
+import logging
+import azure.functions as func
+
+from vigia.core.jsonx import json_response
+from vigia.core.config import _parse_int
+from vigia.infra.reverify import _reverify_receipts
+from vigia.infra.profiler import profiled
+
+bp = func.Blueprint()
+
+
+@bp.route(route="reverify-receipts", methods=["POST"])
+@profiled
+def reverify_receipts(req: func.HttpRequest) -> func.HttpResponse:
+    """
+    POST /reverify-receipts?job=nightly&max_rows=5000&time_budget_seconds=180&reset=false&dry_run=false[&executor=thread|process]
+    Re-verifies stored receipts from the job's checkpoint on. Call again with the same
+    job until "done" is true; each call stops at max_rows or the time budget. The
+    checkpoint lives in blob storage, so the next call may land on any instance.
+    """
+    try:
+        job = (req.params.get("job") or "default").strip()
+        flag = lambda name: (req.params.get(name) or "").strip().lower() in ("1", "true", "yes")
+        # threads by default: spawning a process pool per call inside the Functions worker is costly
+        executor = (req.params.get("executor") or "thread").strip().lower()
+        if executor not in ("thread", "process"):
+            return json_response({"error": "executor must be 'thread' or 'process'"}, 400)
+
+        summary = _reverify_receipts(
+            job=job,
+            since=(req.params.get("since") or "").strip() or None,
+            reset=flag("reset"),
+            max_rows=_parse_int(req.params.get("max_rows", "5000"), 5000, 1, 1000000),
+            time_budget_s=_parse_int(req.params.get("time_budget_seconds", "180"), 180, 1, 220),
+            executor=executor,
+            write_results=not flag("dry_run"),
+        )
+        return json_response(summary, 200)
+
+    except ValueError as ve:
+        return json_response({"error": str(ve)}, 400)
+    except Exception as e:
+        logging.error("reverify-receipts error", exc_info=True)
+        return json_response({"error": str(e)}, 500)
\ No newline at end of file
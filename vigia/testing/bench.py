@@ -0,0 +1,274 @@
+"""
+Offline benchmark for the HTTP routes, driven against the in-process stand-ins.
+
+    python -m vigia.testing.bench --scenario auditor --requests 500 --concurrency 16 \\
+        --kusto-latency lognormal:15:0.4 --agent-run-latency lognormal:900:0.3 --max-p95-ms 2500
+
+    # profile 10% of the requests, then merge them into one flamegraph input
+    python -m vigia.testing.bench --scenario audit --profile 0.1
+    python -m vigia.infra.profiler merge /tmp/vigia-profiles > audit.folded
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import azure.functions as func
+
+from ..agents.dispatcher import _drain_agent_notes
+from ..core.telemetry import metrics_snapshot, reset_telemetry
+from .fakes import (
+    FakeAgentsClient,
+    FakeKustoClient,
+    FakeLedgerClient,
+    install_fakes,
+    synthetic_report,
+    synthetic_telemetry,
+)
+
+
+# ---------- Route invocation ----------
+
+def route_function(fb):
+    """Plain callable behind a blueprint-decorated route (FunctionBuilder or function)."""
+    inner = getattr(fb, "_function", None)
+    if inner is not None and hasattr(inner, "get_user_function"):
+        return inner.get_user_function()
+    return fb
+
+
+def make_request(method: str, route: str, body=None, params=None, headers=None) -> func.HttpRequest:
+    hdrs = {"Content-Type": "application/json"}
+    hdrs.update(headers or {})
+    return func.HttpRequest(
+        method=method,
+        url=f"http://localhost/api/{route}",
+        headers=hdrs,
+        params=params or {},
+        body=json.dumps(body).encode("utf-8") if body is not None else b"",
+    )
+
+
+def _percentile(sorted_vals, p: float) -> float:
+    if not sorted_vals:
+        return 0.0
+    k = max(0, min(len(sorted_vals) - 1, int(round(p / 100.0 * len(sorted_vals) + 0.5)) - 1))
+    return sorted_vals[k]
+
+
+def latency_summary(values_ms) -> dict:
+    v = sorted(values_ms)
+    return {
+        "count": len(v),
+        "mean": round(sum(v) / len(v), 2) if v else 0.0,
+        "p50": round(_percentile(v, 50), 2),
+        "p95": round(_percentile(v, 95), 2),
+        "p99": round(_percentile(v, 99), 2),
+        "max": round(v[-1], 2) if v else 0.0,
+    }
+
+
+def span_breakdown() -> dict:
+    """Mean duration per span name from the telemetry histograms."""
+    out = {}
+    for h in metrics_snapshot()["histograms"]:
+        if h["name"] != "vigia_span_duration_ms" or "error" in h["labels"]:
+            continue
+        out[h["labels"]["span"]] = {"count": h["count"], "mean_ms": round(h["sum"] / max(1, h["count"]), 2)}
+    return dict(sorted(out.items()))
+
+
+# ---------- Scenarios ----------
+
+def _auditor_jobs(n, rng, duplicate_ratio):
+    from ..routes.auditor import autonomous_auditor
+
+    fn = route_function(autonomous_auditor)
+    sent = []
+    jobs = []
+    for i in range(n):
+        if sent and rng.random() < duplicate_ratio:
+            payload = rng.choice(sent)
+        else:
+            payload = synthetic_report(i, rng)
+            sent.append(payload)
+        jobs.append(("autonomous-auditor", fn, make_request("POST", "autonomous-auditor", body=payload)))
+    return jobs
+
+
+def _hazard_jobs(n, rng):
+    from ..routes.hazards import get_regional_hazards, query_road_hazards
+
+    q = route_function(query_road_hazards)
+    r = route_function(get_regional_hazards)
+    jobs = []
+    for _ in range(n):
+        if rng.random() < 0.5:
+            hz = rng.choice(["pothole", "debris", "flooding"])
+            jobs.append(("query-hazards", q, make_request(
+                "GET", "query-hazards", params={"hazard_type": hz, "time_range_hours": str(rng.choice([1, 24, 168]))})))
+        else:
+            lat, lon = 25.2048 + rng.uniform(-0.03, 0.03), 55.2708 + rng.uniform(-0.03, 0.03)
+            box = {"n": lat + 0.01, "s": lat - 0.01, "e": lon + 0.01, "w": lon - 0.01}
+            jobs.append(("get-regional-hazards", r, make_request("POST", "get-regional-hazards", body=box)))
+    return jobs
+
+
+def _audit_api_jobs(n, rng, event_ids):
+    from ..routes.audit_api import audit_explain, audit_history, audit_latest
+
+    routes = [
+        ("audit-latest", route_function(audit_latest)),
+        ("audit-history", route_function(audit_history)),
+        ("audit-explain", route_function(audit_explain)),
+    ]
+    jobs = []
+    for _ in range(n):
+        name, fn = rng.choice(routes)
+        jobs.append((name, fn, make_request("GET", name, params={"event_id": rng.choice(event_ids)})))
+    return jobs
+
+
+def _seed_events(count, rng) -> list:
+    """Run the auditor once per synthetic report (before timing) and return the event ids."""
+    from ..routes.auditor import autonomous_auditor
+
+    fn = route_function(autonomous_auditor)
+    ids = []
+    for i in range(count):
+        resp = fn(make_request("POST", "autonomous-auditor", body=synthetic_report(100000 + i, rng)))
+        try:
+            eid = json.loads(resp.get_body()).get("event_id")
+        except Exception:
+            eid = None
+        if eid:
+            ids.append(eid)
+    return ids or ["missing-event"]
+
+
+# ---------- Runner ----------
+
+def run_jobs(jobs, concurrency: int) -> dict:
+    latencies = []
+    by_route = {}
+    codes = {}
+    lock = threading.Lock()
+
+    def _one(job):
+        name, fn, req = job
+        t0 = time.perf_counter()
+        try:
+            code = fn(req).status_code
+        except Exception:
+            code = "exception"
+        ms = (time.perf_counter() - t0) * 1000.0
+        with lock:
+            latencies.append(ms)
+            by_route.setdefault(name, []).append(ms)
+            codes[str(code)] = codes.get(str(code), 0) + 1
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        list(pool.map(_one, jobs))
+    elapsed = time.perf_counter() - t0
+
+    return {
+        "requests": len(jobs),
+        "concurrency": concurrency,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(len(jobs) / elapsed, 2) if elapsed > 0 else 0.0,
+        "latency_ms": latency_summary(latencies),
+        "status_codes": codes,
+        "by_route": {k: latency_summary(v) for k, v in sorted(by_route.items())},
+    }
+
+
+def run_benchmark(scenario: str = "auditor", requests: int = 200, concurrency: int = 8, seed: int = 7,
+                  duplicate_ratio: float = 0.1, telemetry_rows: int = 5000,
+                  kusto_latency=None, ledger_latency=None, agent_latency=None, agent_run_latency=None,
+                  kusto_error_rate: float = 0.0, ledger_error_rate: float = 0.0, agent_error_rate: float = 0.0,
+                  agent_no_reply_rate: float = 0.0, verdicts=None) -> dict:
+    rng = random.Random(seed)
+    env = install_fakes(
+        kusto=FakeKustoClient(synthetic_telemetry(telemetry_rows, seed=seed), kusto_latency, kusto_error_rate, seed),
+        ledger=FakeLedgerClient(ledger_latency, ledger_error_rate, seed),
+        agents=FakeAgentsClient(verdicts, agent_latency, agent_run_latency, agent_error_rate, agent_no_reply_rate, seed),
+    )
+
+    jobs = []
+    if scenario in ("auditor", "mixed"):
+        jobs += _auditor_jobs(requests, rng, duplicate_ratio)
+    if scenario in ("hazards", "mixed"):
+        jobs += _hazard_jobs(requests, rng)
+    if scenario in ("audit", "mixed"):
+        jobs += _audit_api_jobs(requests, rng, _seed_events(min(50, requests), rng))
+    if not jobs:
+        raise ValueError(f"Unknown scenario: {scenario}")
+    rng.shuffle(jobs)
+
+    reset_telemetry()
+    out = run_jobs(jobs, concurrency)
+    out["agent_notes_drained"] = _drain_agent_notes()  # background notes still count as backend calls
+    out["scenario"] = scenario
+    out["backend_calls"] = {"kusto": env.kusto.calls, "ledger": env.ledger.calls, "agents": env.agents.calls}
+    out["spans"] = span_breakdown()
+    return out
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="Offline VIGIA benchmark against in-process stand-ins")
+    ap.add_argument("--scenario", default="auditor", choices=["auditor", "hazards", "audit", "mixed"])
+    ap.add_argument("--requests", type=int, default=200)
+    ap.add_argument("--concurrency", type=int, default=8)
+    ap.add_argument("--seed", type=int, default=7)
+    ap.add_argument("--duplicate-ratio", type=float, default=0.1)
+    ap.add_argument("--telemetry-rows", type=int, default=5000)
+    ap.add_argument("--kusto-latency", default="fixed:0", help="e.g. lognormal:15:0.4")
+    ap.add_argument("--ledger-latency", default="fixed:0")
+    ap.add_argument("--agent-latency", default="fixed:0", help="per agents SDK round trip")
+    ap.add_argument("--agent-run-latency", default="fixed:0", help="time until an agent run completes")
+    ap.add_argument("--kusto-error-rate", type=float, default=0.0)
+    ap.add_argument("--ledger-error-rate", type=float, default=0.0)
+    ap.add_argument("--agent-error-rate", type=float, default=0.0)
+    ap.add_argument("--agent-no-reply-rate", type=float, default=0.0)
+    ap.add_argument("--max-p95-ms", type=float, default=None, help="exit 1 if overall p95 exceeds this")
+    ap.add_argument("--min-rps", type=float, default=None, help="exit 1 if throughput falls below this")
+    ap.add_argument("--profile", type=float, default=0.0, help="fraction of requests to profile (PROFILE_DIR)")
+    args = ap.parse_args(argv)
+    if args.profile > 0:
+        os.environ["PROFILE_SAMPLE_RATE"] = str(args.profile)
+
+    out = run_benchmark(
+        scenario=args.scenario,
+        requests=args.requests,
+        concurrency=args.concurrency,
+        seed=args.seed,
+        duplicate_ratio=args.duplicate_ratio,
+        telemetry_rows=args.telemetry_rows,
+        kusto_latency=args.kusto_latency,
+        ledger_latency=args.ledger_latency,
+        agent_latency=args.agent_latency,
+        agent_run_latency=args.agent_run_latency,
+        kusto_error_rate=args.kusto_error_rate,
+        ledger_error_rate=args.ledger_error_rate,
+        agent_error_rate=args.agent_error_rate,
+        agent_no_reply_rate=args.agent_no_reply_rate,
+    )
+    print(json.dumps(out, indent=2, default=str))
+
+    failed = []
+    if args.max_p95_ms is not None and out["latency_ms"]["p95"] > args.max_p95_ms:
+        failed.append(f"p95 {out['latency_ms']['p95']}ms > {args.max_p95_ms}ms")
+    if args.min_rps is not None and out["throughput_rps"] < args.min_rps:
+        failed.append(f"throughput {out['throughput_rps']} rps < {args.min_rps} rps")
+    for f in failed:
+        print(f"REGRESSION: {f}", file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
\ No newline at end of file
@@ -0,0 +1,943 @@
+import os
+import re
+import json
+import time
+import random
+import hashlib
+import itertools
+import threading
+from datetime import datetime, timedelta, timezone
+
+from ..infra.clients import _REGISTRY
+from ..infra import audit_cache
+from ..infra.audit_changes import _change_key
+from ..infra.hotspots import HotspotAggregator, _geohash, _hotspot_precision
+from ..infra.kusto import _STATE as _KUSTO_PROFILES
+
+
+# ---------- Latency / error injection ----------
+
+class FakeServiceError(RuntimeError):
+    """Raised by the stand-ins when an injected error fires."""
+
+
+class Latency:
+    """
+    Latency distribution for a fake backend, in milliseconds.
+
+    Spec strings (CLI friendly):
+      fixed:MS
+      uniform:LO:HI
+      normal:MEAN:STDDEV
+      lognormal:MEDIAN:SIGMA
+    """
+
+    def __init__(self, dist: str = "fixed", a: float = 0.0, b: float = 0.0, seed=None):
+        self.dist = dist
+        self.a = float(a)
+        self.b = float(b)
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def parse(cls, spec, seed=None):
+        if isinstance(spec, Latency):
+            return spec
+        if spec is None or spec == "":
+            return cls("fixed", 0.0, seed=seed)
+        if isinstance(spec, (int, float)):
+            return cls("fixed", float(spec), seed=seed)
+        parts = str(spec).split(":")
+        dist = parts[0].strip().lower()
+        nums = [float(x) for x in parts[1:]]
+        if dist not in ("fixed", "uniform", "normal", "lognormal"):
+            raise ValueError(f"Unknown latency distribution: {spec}")
+        return cls(dist, nums[0] if nums else 0.0, nums[1] if len(nums) > 1 else 0.0, seed=seed)
+
+    def sample_ms(self) -> float:
+        with self._lock:
+            if self.dist == "uniform":
+                v = self._rng.uniform(self.a, self.b)
+            elif self.dist == "normal":
+                v = self._rng.gauss(self.a, self.b)
+            elif self.dist == "lognormal":
+                v = self.a * self._rng.lognormvariate(0.0, self.b) if self.a > 0 else 0.0
+            else:
+                v = self.a
+        return max(0.0, v)
+
+    def sleep(self):
+        ms = self.sample_ms()
+        if ms > 0:
+            time.sleep(ms / 1000.0)
+        return ms
+
+
+class _Backend:
+    def __init__(self, latency=None, error_rate: float = 0.0, seed=None):
+        self.latency = Latency.parse(latency, seed=seed)
+        self.error_rate = float(error_rate or 0.0)
+        self._rng = random.Random(seed)
+        self._rng_lock = threading.Lock()
+        self.calls = 0
+
+    def _round_trip(self, what: str):
+        with self._rng_lock:
+            self.calls += 1
+            fail = self.error_rate > 0 and self._rng.random() < self.error_rate
+        self.latency.sleep()
+        if fail:
+            raise FakeServiceError(f"injected failure: {what}")
+
+
+# ---------- Kusto ----------
+
+class FakeColumn:
+    __slots__ = ("column_name",)
+
+    def __init__(self, name):
+        self.column_name = name
+
+
+class FakeTable:
+    def __init__(self, columns, rows):
+        self.columns = [FakeColumn(c) for c in columns]
+        self.rows = [list(r) for r in rows]
+
+
+class FakeResponse:
+    def __init__(self, table):
+        self.primary_results = [table] if table is not None else []
+
+
+class FakeClientRequestProperties:
+    """Stand-in for azure.kusto.data.ClientRequestProperties (options are recorded, not applied)."""
+
+    def __init__(self):
+        self.options = {}
+
+    def set_option(self, name, value):
+        self.options[name] = value
+
+    def get_option(self, name, default_value=None):
+        return self.options.get(name, default_value)
+
+
+AUDIT_COLUMNS = [
+    "EventId", "ReportId", "DeviceId", "Timestamp", "Latitude", "Longitude", "HazardType", "Status",
+    "UpdatedAt", "Agent", "RunId", "LedgerTxId", "Receipt", "Details", "CreatedAt", "VerificationReasoning",
+]
+
+_STR = r"'((?:[^']|'')*)'"
+_ASSIGN_RE = re.compile(
+    r"(\w+)=(?:datetime\(" + _STR + r"\)|real\(([^)]*)\)|parse_json\(" + _STR + r"\)|(now\(\))|" + _STR + r")"
+)
+
+
+def _unq(s: str) -> str:
+    return (s or "").replace("''", "'")
+
+
+def _parse_dt(s):
+    if isinstance(s, datetime):
+        return s
+    dt = datetime.fromisoformat(str(s).replace("Z", "+00:00"))
+    return dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
+
+
+def _parse_print_rows(text: str, now: datetime) -> list:
+    """Parse `print A='..', B=real(..), ...` blocks; a repeated column name starts a new row."""
+    rows, row = [], {}
+    for m in _ASSIGN_RE.finditer(text):
+        name, dt, real, pj, nw, st = m.groups()
+        if name in row:
+            rows.append(row)
+            row = {}
+        if dt is not None:
+            row[name] = _parse_dt(_unq(dt))
+        elif real is not None:
+            row[name] = float(real)
+        elif pj is not None:
+            try:
+                row[name] = json.loads(_unq(pj))
+            except Exception:
+                row[name] = _unq(pj)
+        elif nw is not None:
+            row[name] = now
+        else:
+            row[name] = _unq(st)
+    if row:
+        rows.append(row)
+    return rows
+
+
+def _archive_rows(a: dict) -> list:
+    """AuditEvents-shaped rows of one AuditEventsArchive row (the read-side mv-expand)."""
+    out = []
+    for t in a.get("Timeline") or []:
+        details = {"payload": a.get("Payload")} if t.get("StoredPayload") else {}
+        details.update(t.get("Details") or {})
+        details["compacted"] = True
+        out.append({
+            **{c: a.get(c) for c in ("EventId", "ReportId", "DeviceId", "Timestamp", "Latitude", "Longitude", "HazardType")},
+            "Status": t.get("Status"),
+            "UpdatedAt": t.get("UpdatedAt"),
+            "Agent": t.get("Agent"),
+            "RunId": t.get("RunId"),
+            "LedgerTxId": t.get("LedgerTxId"),
+            "Receipt": (a.get("Receipt") or {}) if t.get("Status") == "LEDGER_WRITTEN" else {},
+            "Details": details,
+            "CreatedAt": t.get("UpdatedAt"),
+            "VerificationReasoning": t.get("VerificationReasoning"),
+        })
+    return out
+
+
+def _bin(dt: datetime, minutes: int) -> datetime:
+    epoch = datetime(1970, 1, 1, tzinfo=timezone.utc)
+    step = minutes * 60
+    secs = int((dt - epoch).total_seconds())
+    return epoch + timedelta(seconds=secs - secs % step)
+
+
+class FakeKustoClient(_Backend):
+    """
+    In-process stand-in for azure.kusto.data.KustoClient.
+
+    Understands the KQL shapes this repo emits (audit .append, top-1 latest, change feed,
+    history/explain scans, dedupe summarize, hazard queries) and keeps the
+    AuditEvents / RoadTelemetry tables in memory. Unknown queries return an
+    empty table.
+    """
+
+    def __init__(self, telemetry_rows=None, latency=None, error_rate: float = 0.0, seed=None):
+        super().__init__(latency, error_rate, seed)
+        self._data_lock = threading.Lock()
+        ingested = datetime.now(timezone.utc)
+        self.tables = {"RoadTelemetry": [{"$IngestedAt": ingested, **r} for r in (telemetry_rows or [])]}
+        self.schemas = {}  # table -> extra columns from .alter-merge
+        self.docstrings = {}
+        self.mgmt_commands = []
+        self.consistency = {}  # queryconsistency option -> queries
+        self._last_now = None
+
+    # --- data helpers ---
+
+    def _now(self) -> datetime:
+        # strictly increasing so "top 1 by UpdatedAt" is deterministic
+        with self._data_lock:
+            now = datetime.now(timezone.utc)
+            if self._last_now is not None and now <= self._last_now:
+                now = self._last_now + timedelta(microseconds=1)
+            self._last_now = now
+            return now
+
+    def add_telemetry(self, rows):
+        ingested = self._now()
+        with self._data_lock:
+            self.tables["RoadTelemetry"].extend({"$IngestedAt": ingested, **r} for r in rows)
+
+    def rows(self, table: str) -> list:
+        with self._data_lock:
+            return list(self.tables.get(table, []))
+
+    # --- SDK surface ---
+
+    def execute_mgmt(self, database, command, properties=None):
+        self._round_trip("execute_mgmt")
+        cmd = command.strip()
+
+        m = re.match(r"\.append\s+(\w+)\s*<\|", cmd)
+        if m:
+            table = m.group(1)
+            now = self._now()
+            rows = _parse_print_rows(cmd[m.end():], now)
+            for r in rows:
+                r["$IngestedAt"] = now  # ingestion_time()
+            with self._data_lock:
+                self.tables.setdefault(table, []).extend(rows)
+            return FakeResponse(FakeTable(["ExtentId"], [["fake-extent"]]))
+
+        m = re.match(r"\.set-or-append\s+(\w+)", cmd)
+        if m and "let due = " in cmd:
+            return FakeResponse(self._compact(m.group(1), cmd))
+
+        m = re.match(r"\.show\s+table\s+(\w+)\s+schema", cmd)
+        if m:
+            schema = ", ".join(f"{c}:string" for c in AUDIT_COLUMNS)
+            return FakeResponse(FakeTable(["TableName", "Schema"], [[m.group(1), schema]]))
+
+        m = re.match(r"\.show\s+table\s+(\w+)\s+cslschema", cmd)
+        if m:
+            with self._data_lock:
+                schema = ",".join(self.schemas.get(m.group(1), []))
+                doc = self.docstrings.get(m.group(1), "")
+            return FakeResponse(FakeTable(["TableName", "Schema", "DocString"], [[m.group(1), schema, doc]]))
+
+        with self._data_lock:
+            self.mgmt_commands.append(cmd)
+            m = re.match(r"\.alter-merge\s+table\s+(\w+)\s+\(([^)]*)\)", cmd)
+            if m:
+                cols = self.schemas.setdefault(m.group(1), [])
+                cols.extend(c.strip() for c in m.group(2).split(",") if c.strip() not in cols)
+            m = re.match(r"\.alter\s+table\s+(\w+)\s+docstring\s+" + _STR, cmd)
+            if m:
+                self.docstrings[m.group(1)] = _unq(m.group(2))
+
+        return FakeResponse(FakeTable(["Result"], []))
+
+    def execute(self, database, query, properties=None):
+        self._round_trip("execute")
+        level = properties.get_option("queryconsistency", "strongconsistency") if properties else "strongconsistency"
+        with self._data_lock:
+            self.consistency[level] = self.consistency.get(level, 0) + 1
+        q = " ".join(query.split())
+        m = re.match(r"(\w+) \|", q)
+        table = m.group(1) if m else ""
+
+        if table == "HazardWatermarks" or "summarize LastIngest = max(ingestion_time())" in q:
+            return FakeResponse(self._watermarks(q))
+
+        if table == "RoadTelemetry" and "where ingestion_time() >" in q:
+            return FakeResponse(self._regional_delta(q))
+
+        if "ingestion_time()" in q and not (table == "RoadTelemetry" and "between(" in q):
+            return FakeResponse(self._changes(table or q.split()[0], q))
+
+        if "HazardHotspots1h" in q:
+            return FakeResponse(self._hotspots(q))
+
+        if table == "RoadTelemetry":
+            if "summarize DuplicateCount" in q:
+                return FakeResponse(self._dedupe(q))
+            if "summarize Count = count() by Latitude, Longitude" in q:
+                return FakeResponse(self._top_hazards(q))
+            if "between(" in q:
+                return FakeResponse(self._regional(q))
+            return FakeResponse(FakeTable([], []))
+
+        if "where Status == 'LEDGER_WRITTEN'" in q and "strcmp(EventId" in q:
+            if q.startswith("union "):
+                table, archive = re.findall(r"\((\w+) \|", q)[:2]
+                return FakeResponse(self._ledger_written_page(table, q, archive))
+            return FakeResponse(self._ledger_written_page(table, q))
+
+        if "let due = " in q and "due | count" in q:
+            archive = re.search(r"let archived = (\w+)", q).group(1)
+            due, _, _ = self._due_events(re.search(r"let due = (\w+)", q).group(1), archive, q)
+            return FakeResponse(FakeTable(["Count"], [[len(due)]]))
+
+        archive = None
+        if q.startswith("union "):
+            # raw table leg first, archive leg second (audit_archive.py)
+            table, archive = re.findall(r"\((\w+) \|", q)[:2]
+
+        m = re.search(r"where DeviceId == " + _STR, q)
+        if m and "summarize Accepted" in q:
+            return FakeResponse(self._device_history(table, _unq(m.group(1)), archive))
+
+        if "summarize Finished = countif(" in q:
+            return FakeResponse(self._stuck_events(table, q))
+
+        m = re.search(r"where EventId == " + _STR, q)
+        if m:
+            if archive:
+                # filters after the merged source apply to both tiers
+                q = q.split("project-away Tier", 1)[-1]
+            return FakeResponse(self._audit_for_event(table, _unq(m.group(1)), q, archive))
+
+        return FakeResponse(FakeTable([], []))
+
+    # --- query shapes ---
+
+    def _audit_for_event(self, table, event_id, q, archive=None):
+        with self._data_lock:
+            rows = [r for r in self.tables.get(table, []) if r.get("EventId") == event_id]
+            archived = [a for a in self.tables.get(archive, []) if a.get("EventId") == event_id] if archive else []
+        for r in rows:
+            r.setdefault("VerificationReasoning", str((r.get("Details") or {}).get("verification_reasoning") or ""))
+        seen = {(r.get("Status"), r.get("UpdatedAt")) for r in rows}
+        for a in archived:
+            rows.extend(r for r in _archive_rows(a) if (r["Status"], r["UpdatedAt"]) not in seen)
+        rows.sort(key=lambda r: r.get("UpdatedAt") or datetime.min.replace(tzinfo=timezone.utc))
+
+        if "isnotempty(tostring(Details.payload_hash))" in q:
+            rows = [r for r in rows if (r.get("Details") or {}).get("payload_hash")]
+        if "!endswith '_AGENT_TRIGGERED'" in q:
+            rows = [r for r in rows if not str(r.get("Status") or "").endswith("_AGENT_TRIGGERED")]
+        if "isnotempty(LedgerTxId)" in q:
+            rows = [r for r in rows if r.get("LedgerTxId")]
+        m = re.search(r"where Status in \(([^)]*)\)", q)
+        if m:
+            wanted = {_unq(v) for v in re.findall(_STR, m.group(1))}
+            rows = [r for r in rows if r.get("Status") in wanted]
+        if "top 1 by UpdatedAt desc" in q:
+            rows = rows[-1:]
+        m = re.search(r"Preferred = Status in \(([^)]*)\)", q)
+        if m and "top 1 by Preferred desc" in q:
+            preferred = {_unq(v) for v in re.findall(_STR, m.group(1))}
+            rows = ([r for r in rows if r.get("Status") in preferred] or rows)[-1:]
+        m = re.search(r"take (\d+)", q)
+        if m:
+            rows = rows[: int(m.group(1))]
+
+        m = re.search(r"\| project ([\w, ]+)$", q)
+        cols = [c.strip() for c in m.group(1).split(",")] if m else AUDIT_COLUMNS
+        return FakeTable(cols, [[r.get(c) for c in cols] for r in rows])
+
+    def _stuck_events(self, table, q):
+        now = self._now()
+        since = now - timedelta(hours=int(re.search(r"ago\((\d+)h\)", q).group(1)))
+        stuck = now - timedelta(minutes=int(re.search(r"ago\((\d+)m\)", q).group(1)))
+        wanted = {_unq(v) for v in re.findall(_STR, re.search(r"where Status in \(([^)]*)\)", q).group(1))}
+        terminal = {_unq(v) for v in re.findall(_STR, re.search(r"countif\(Status in \(([^)]*)\)", q).group(1))}
+        with self._data_lock:
+            rows = [r for r in self.tables.get(table, []) if r.get("Status") in wanted and (r.get("UpdatedAt") or now) > since]
+        latest, finished = {}, set()
+        for r in sorted(rows, key=lambda r: r.get("UpdatedAt") or now):
+            latest[r["EventId"]] = r
+            if r.get("Status") in terminal:
+                finished.add(r["EventId"])
+        out = sorted(
+            (r for eid, r in latest.items() if eid not in finished and (r.get("UpdatedAt") or now) < stuck),
+            key=lambda r: r.get("UpdatedAt"),
+        )[: int(re.search(r"top (\d+) by UpdatedAt asc", q).group(1))]
+        cols = ["EventId", "ReportId", "DeviceId", "Status", "UpdatedAt"]
+        return FakeTable(cols, [[r.get(c) for c in cols] for r in out])
+
+    def _changes(self, table, q):
+        t = _parse_dt(re.search(r"IngestedAt >= datetime\(([^)]+)\)", q).group(1).strip("'"))
+        k = _unq(re.search(r"strcmp\(ChangeKey, " + _STR + r"\)", q).group(1))
+        settle = datetime.now(timezone.utc) - timedelta(seconds=int(re.search(r"ago\((\d+)s\)", q).group(1)))
+        filters = {
+            c: {_unq(v).casefold() for v in re.findall(_STR, m.group(1))}
+            for c, m in ((c, re.search(c + r" in~ \(([^)]*)\)", q)) for c in ("Status", "HazardType", "DeviceId")) if m
+        }
+        out = []
+        with self._data_lock:
+            rows = list(self.tables.get(table, []))
+        for r in rows:
+            ing = r.get("$IngestedAt")
+            if ing is None or ing >= settle:
+                continue
+            key = _change_key(r.get("EventId"), r.get("Status"), r.get("UpdatedAt"))
+            if not (ing > t or (ing == t and key > k)):
+                continue
+            if any(str(r.get(c) or "").casefold() not in vals for c, vals in filters.items()):
+                continue
+            reasoning = r.get("VerificationReasoning") or str((r.get("Details") or {}).get("verification_reasoning") or "")
+            out.append(dict(r, IngestedAt=ing, ChangeKey=key, VerificationReasoning=reasoning))
+        out.sort(key=lambda r: (r["IngestedAt"], r["ChangeKey"]))
+        out = out[: int(re.search(r"take (\d+)", q).group(1))]
+
+        cols = [c.strip() for c in re.search(r"\| project ([\w, ]+)$", q).group(1).split(",")]
+        return FakeTable(cols, [[r.get(c) for c in cols] for r in out])
+
+    def _ledger_written_page(self, table, q, archive=None):
+        t = _parse_dt(re.search(r"U > datetime\(" + _STR + r"\)", q).group(1))
+        eid = _unq(re.search(r"strcmp\(EventId, " + _STR + r"\)", q).group(1))
+        rows = self.rows(table)
+        if archive:
+            seen = {(r.get("EventId"), r.get("UpdatedAt")) for r in rows if r.get("Status") == "LEDGER_WRITTEN"}
+            for a in self.rows(archive):
+                rows.extend(r for r in _archive_rows(a) if (r["EventId"], r["UpdatedAt"]) not in seen)
+        out = []
+        for r in rows:
+            if r.get("Status") != "LEDGER_WRITTEN":
+                continue
+            u = r["UpdatedAt"]
+            if u > t or (u == t and r.get("EventId") > eid):
+                d = r.get("Details") or {}
+                out.append(dict(r, U=u, CollectionId=str(d.get("collectionId") or ""), CertSha256=str(d.get("service_cert_sha256") or "")))
+        out.sort(key=lambda r: (r["U"], r["EventId"]))
+        out = out[: int(re.search(r"take (\d+)", q).group(1))]
+        cols = ["U", "EventId", "ReportId", "DeviceId", "Timestamp", "Latitude", "Longitude", "HazardType", "LedgerTxId",
+                "Receipt", "CollectionId", "CertSha256"]
+        return FakeTable(cols, [[r.get(c) for c in cols] for r in out])
+
+    def _due_events(self, audit, archive, cmd):
+        """
+        (EventIds to compact, their raw rows newer than the archived LastAt by EventId,
+        terminal statuses) for a compaction command.
+        """
+        terminal = {_unq(v) for v in re.findall(_STR, re.search(r"let terminal = dynamic\(\[([^\]]*)\]\)", cmd).group(1))}
+        now = datetime.now(timezone.utc)
+        finished_before = now - timedelta(days=int(re.search(r"let finished_after = (\d+)d", cmd).group(1)))
+        stale_before = now - timedelta(days=int(re.search(r"let stale_after = (\d+)d", cmd).group(1)))
+        limit = int(re.search(r"\| top (\d+) by LastAt asc", cmd).group(1))
+        by_event = {}
+        with self._data_lock:
+            archived = {}
+            for a in self.tables.get(archive, []):
+                archived[a["EventId"]] = max(archived.get(a["EventId"], a["LastAt"]), a["LastAt"])
+            for r in self.tables.get(audit, []):
+                archived_to = archived.get(r.get("EventId"))
+                if archived_to is None or r["UpdatedAt"] > archived_to:
+                    by_event.setdefault(r.get("EventId"), []).append(r)
+        due = []
+        for event_id, rows in by_event.items():
+            last = max(r["UpdatedAt"] for r in rows)
+            finished = event_id in archived or any(r.get("Status") in terminal for r in rows)
+            if last < finished_before and (finished or last < stale_before):
+                due.append((last, event_id))
+        due.sort()
+        return [e for _, e in due[:limit]], by_event, terminal
+
+    def _compact(self, archive, cmd):
+        due, by_event, terminal = self._due_events(re.search(r"let due = (\w+)", cmd).group(1), archive, cmd)
+        now = self._now()
+
+        def details(r):
+            return r.get("Details") if isinstance(r.get("Details"), dict) else {}
+
+        def reasoning(r):
+            return r.get("VerificationReasoning") or str(details(r).get("verification_reasoning") or "")
+
+        def rank(r):
+            status = str(r.get("Status") or "")
+            return 2 if status in terminal else (0 if status.endswith("_AGENT_TRIGGERED") else 1)
+
+        with self._data_lock:
+            prior = [
+                {**a, "Status": a["FinalStatus"], "UpdatedAt": a["LastAt"], "VerificationReasoning": a["FinalReasoning"]}
+                for a in self.tables.get(archive, [])
+                if a.get("EventId") in due
+            ]
+        out = []
+        for event_id in due:
+            rows = sorted(by_event[event_id], key=lambda r: r["UpdatedAt"])
+            candidates = rows + [p for p in prior if p["EventId"] == event_id]
+            final = max(candidates, key=lambda r: (rank(r), r["UpdatedAt"]))
+            payload_hash = next((str(details(r)["payload_hash"]) for r in rows if details(r).get("payload_hash")), "")
+            out.append({
+                **{c: rows[0].get(c) for c in ("EventId", "ReportId", "DeviceId", "Timestamp", "Latitude", "Longitude", "HazardType")},
+                "FinalStatus": final.get("Status"),
+                "FinalReasoning": reasoning(final),
+                "FirstAt": rows[0]["UpdatedAt"],
+                "LastAt": rows[-1]["UpdatedAt"],
+                "LedgerTxId": next((r["LedgerTxId"] for r in rows if r.get("LedgerTxId")), ""),
+                "Receipt": next((r.get("Receipt") for r in rows if r.get("Status") == "LEDGER_WRITTEN"), None),
+                "Payload": next((details(r)["payload"] for r in rows if details(r).get("payload") is not None), None),
+                "PayloadHash": payload_hash,
+                "Timeline": [
+                    {
+                        "Status": r.get("Status"),
+                        "UpdatedAt": r["UpdatedAt"],
+                        "Agent": r.get("Agent") or "",
+                        "RunId": r.get("RunId") or "",
+                        "LedgerTxId": r.get("LedgerTxId") or "",
+                        "VerificationReasoning": reasoning(r),
+                        "StoredPayload": details(r).get("payload") is not None,
+                        "Details": {k: v for k, v in details(r).items() if k != "payload"},
+                    }
+                    for r in rows
+                ],
+                "RawRows": len(rows),
+                "CompactedAt": now,
+            })
+        with self._data_lock:
+            self.tables.setdefault(archive, []).extend(out)
+        return FakeTable(["ExtentId", "RowCount"], [["fake-extent", len(out)]])
+
+    def _device_history(self, table, device_id, archive=None):
+        latest = {}
+        with self._data_lock:
+            rows = list(self.tables.get(table, []))
+            for a in self.tables.get(archive, []) if archive else []:
+                rows.extend(_archive_rows(a))
+        for r in rows:
+            if r.get("DeviceId") == device_id and r.get("Status") in ("LEDGER_WRITTEN", "REJECTED"):
+                prev = latest.get(r.get("EventId"))
+                if prev is None or r.get("UpdatedAt") >= prev.get("UpdatedAt"):
+                    latest[r.get("EventId")] = r
+        acc = sum(1 for r in latest.values() if r.get("Status") == "LEDGER_WRITTEN")
+        return FakeTable(["Accepted", "Rejected"], [[acc, len(latest) - acc]])
+
+    def _dedupe(self, q):
+        hours = int(re.search(r"ago\((\d+)h\)", q).group(1))
+        m = re.search(r"round\(Latitude, (\d+)\)", q)
+        if m:
+            dec = int(m.group(1))
+        else:  # precomputed LatB/LonB: decimals come from the layout marker
+            with self._data_lock:
+                dec = int(re.search(r"dec=(\d+)", self.docstrings.get("RoadTelemetry", "")).group(1))
+        bucket = int(re.search(r"bin\(datetime\([^)]*\), (\d+)m\)", q).group(1))
+        hz = _unq(re.search(r"HazardType == " + _STR, q).group(1))
+        lat = float(re.search(r"LatB == (-?[\d.]+)", q).group(1))
+        lon = float(re.search(r"LonB == (-?[\d.]+)", q).group(1))
+        tb = _bin(_parse_dt(re.search(r"bin\(datetime\(([^)]+)\)", q).group(1)), bucket)
+        since = datetime.now(timezone.utc) - timedelta(hours=hours)
+
+        ids = []
+        for r in self.rows("RoadTelemetry"):
+            ts = _parse_dt(r.get("Timestamp"))
+            if ts <= since or r.get("HazardType") != hz:
+                continue
+            if round(float(r.get("Latitude")), dec) != lat or round(float(r.get("Longitude")), dec) != lon:
+                continue
+            if _bin(ts, bucket) != tb:
+                continue
+            ids.append(r.get("ReportId"))
+
+        cols = ["HazardType", "LatB", "LonB", "TimeB", "DuplicateCount", "SampleReportIds"]
+        if not ids:
+            return FakeTable(cols, [])
+        return FakeTable(cols, [[hz, lat, lon, tb, len(ids), list(dict.fromkeys(ids))[:20]]])
+
+    def _top_hazards(self, q):
+        hz = _unq(re.search(r"HazardType == " + _STR, q).group(1))
+        hours = int(re.search(r"ago\((\d+)h\)", q).group(1))
+        since = datetime.now(timezone.utc) - timedelta(hours=hours)
+        counts = {}
+        for r in self.rows("RoadTelemetry"):
+            if r.get("HazardType") == hz and _parse_dt(r.get("Timestamp")) > since:
+                k = (r.get("Latitude"), r.get("Longitude"))
+                counts[k] = counts.get(k, 0) + 1
+        top = sorted(counts.items(), key=lambda kv: -kv[1])[:5]
+        return FakeTable(["Latitude", "Longitude", "Count"], [[k[0], k[1], c] for k, c in top])
+
+    def _hotspots(self, q):
+        hz = _unq(re.search(r"HazardType == " + _STR, q).group(1))
+        hours = int(re.search(r"ago\((\d+)h\)", q).group(1))
+        k = int(re.search(r"top (\d+) by Count", q).group(1))
+        now = datetime.now(timezone.utc).timestamp()
+        agg = HotspotAggregator(_hotspot_precision())
+        for r in self.rows("RoadTelemetry"):
+            if r.get("HazardType") == hz:
+                agg.record(hz, float(r["Latitude"]), float(r["Longitude"]), _parse_dt(r["Timestamp"]).timestamp(),
+                           float(r.get("ConfidenceScore") or 0.0), now)
+        rows = agg.top(hz, hours, k, now)
+        cols = ["Cell", "Latitude", "Longitude", "Count", "AvgConfidence", "LastSeen"]
+        return FakeTable(cols, [[r[c] for c in cols] for r in rows])
+
+    def _regional(self, q):
+        s, n = [float(x) for x in re.search(r"Latitude between\((-?[\d.]+) \.\. (-?[\d.]+)\)", q).groups()]
+        w, e = [float(x) for x in re.search(r"Longitude between\((-?[\d.]+) \.\. (-?[\d.]+)\)", q).groups()]
+        cols = ["ReportId", "Latitude", "Longitude", "HazardType", "ConfidenceScore", "GForceZ", "GaussianSplatURL", "IngestedAt"]
+        out = []
+        for r in self.rows("RoadTelemetry"):
+            if s <= float(r.get("Latitude")) <= n and w <= float(r.get("Longitude")) <= e and float(r.get("ConfidenceScore") or 0) > 0.7:
+                out.append([r.get(c) for c in cols[:-1]] + [r["$IngestedAt"]])
+        return FakeTable(cols, out)
+
+    def _watermarks(self, q):
+        m = re.search(r"geo_point_to_geohash\(Longitude, Latitude, (\d+)\)", q)
+        precision = int(m.group(1)) if m else int(os.environ.get("HAZARD_WATERMARK_GEOHASH_PRECISION", "4"))
+        groups = {}
+        for r in self.rows("RoadTelemetry"):
+            key = (r.get("HazardType"), _geohash(float(r["Latitude"]), float(r["Longitude"]), precision))
+            last, n = groups.get(key, (None, 0))
+            ing = r.get("$IngestedAt")
+            groups[key] = (ing if last is None or ing > last else last, n + 1)
+        return FakeTable(["HazardType", "Cell", "LastIngest", "Rows"], [[k[0], k[1], v[0], v[1]] for k, v in groups.items()])
+
+    def _regional_delta(self, q):
+        after = _parse_dt(re.search(r"ingestion_time\(\) > datetime\(([^)]+)\)", q).group(1).strip("'"))
+        s, n = [float(x) for x in re.search(r"Latitude between\((-?[\d.]+) \.\. (-?[\d.]+)\)", q).groups()]
+        w, e = [float(x) for x in re.search(r"Longitude between\((-?[\d.]+) \.\. (-?[\d.]+)\)", q).groups()]
+        cols = ["ReportId", "Latitude", "Longitude", "HazardType", "ConfidenceScore", "GForceZ", "GaussianSplatURL", "IngestedAt"]
+        out = []
+        for r in self.rows("RoadTelemetry"):
+            if r["$IngestedAt"] > after and s <= float(r.get("Latitude")) <= n and w <= float(r.get("Longitude")) <= e \
+                    and float(r.get("ConfidenceScore") or 0) > 0.7:
+                out.append([r.get(c) for c in cols[:-1]] + [r["$IngestedAt"]])
+        return FakeTable(cols, out)
+
+
+# ---------- Confidential Ledger ----------
+
+FAKE_LEDGER_CERT_PEM = "-----BEGIN CERTIFICATE-----\nVklHSUEtRkFLRS1MRURHRVI=\n-----END CERTIFICATE-----\n"
+
+
+class _Poller:
+    def __init__(self, fn):
+        self._fn = fn
+
+    def result(self):
+        return self._fn()
+
+
+def _fake_signature(tx_id: str, contents: str, cert_pem: str) -> str:
+    return hashlib.sha256(f"{cert_pem}|{tx_id}|{contents}".encode("utf-8")).hexdigest()
+
+
+def fake_verify_receipt(receipt, service_cert, application_claims=None):
+    """Counterpart of azure.confidentialledger.receipt.verify_receipt for fake receipts."""
+    sig = _fake_signature(receipt.get("txId"), receipt.get("leaf"), service_cert)
+    if receipt.get("signature") != sig:
+        raise ValueError("Receipt verification failed: signature mismatch")
+
+
+class FakeLedgerClient(_Backend):
+    """
+    In-process stand-in for ConfidentialLedgerClient.
+    Entries and receipts are kept in memory; receipts are signed with FAKE_LEDGER_CERT_PEM.
+    """
+
+    def __init__(self, latency=None, error_rate: float = 0.0, seed=None):
+        super().__init__(latency, error_rate, seed)
+        self._data_lock = threading.Lock()
+        self._seq = itertools.count(1)
+        self.entries = {}  # tx_id -> {"contents":..., "collectionId":...}
+
+    def begin_create_ledger_entry(self, entry, collection_id=None, **kwargs):
+        def _run():
+            self._round_trip("create_ledger_entry")
+            tx_id = f"2.{next(self._seq)}"
+            with self._data_lock:
+                self.entries[tx_id] = {"contents": entry.get("contents"), "collectionId": collection_id or "subledger:0"}
+            return {"transactionId": tx_id, "collectionId": collection_id or "subledger:0"}
+        return _Poller(_run)
+
+    def begin_get_receipt(self, transaction_id, **kwargs):
+        def _run():
+            self._round_trip("get_receipt")
+            with self._data_lock:
+                entry = self.entries.get(transaction_id)
+            if entry is None:
+                raise FakeServiceError(f"unknown transaction {transaction_id}")
+            contents = entry["contents"]
+            return {
+                "transactionId": transaction_id,
+                "state": "Ready",
+                "receipt": {
+                    "txId": transaction_id,
+                    "leaf": contents,
+                    "signature": _fake_signature(transaction_id, contents, FAKE_LEDGER_CERT_PEM),
+                },
+                "applicationClaims": [{"kind": "LedgerEntry", "ledgerEntry": {"collectionId": entry["collectionId"]}}],
+            }
+        return _Poller(_run)
+
+    def get_ledger_entry(self, transaction_id, collection_id=None, **kwargs):
+        self._round_trip("get_ledger_entry")
+        with self._data_lock:
+            entry = self.entries.get(transaction_id)
+        if entry is None:
+            raise FakeServiceError(f"unknown transaction {transaction_id}")
+        return {"entry": {"contents": entry["contents"], "collectionId": entry["collectionId"], "transactionId": transaction_id}, "state": "Ready"}
+
+
+# ---------- Agents ----------
+
+class FakeMessage:
+    def __init__(self, role, content):
+        self.role = role
+        self.content = content
+        self.id = "msg_" + hashlib.sha1(f"{role}{content}{time.time()}".encode("utf-8")).hexdigest()[:12]
+
+
+class FakeRun:
+    def __init__(self, run_id, thread_id, status="queued"):
+        self.id = run_id
+        self.thread_id = thread_id
+        self.status = status
+        self.last_error = None
+
+
+def default_verdict(request: dict):
+    """
+    Approve when the deterministic gate passed with a confident score.
+    Batched requests ("events": [...]) get an array of verdicts keyed by event_id.
+    """
+    if isinstance((request or {}).get("events"), list):
+        return [dict(_verdict_for(e), event_id=e.get("event_id")) for e in request["events"]]
+    return _verdict_for((request or {}).get("payload") or {})
+
+
+def _verdict_for(payload: dict) -> dict:
+    gate = payload.get("deterministic_gate") or {}
+    score = float(gate.get("score") or 0.0)
+    return {
+        "approve": bool(gate.get("ok", True)) and score >= 0.75,
+        "reasoning": f"scripted verdict (score={score})",
+        "quality_score": round(score, 3),
+    }
+
+
+class FakeAgentsClient(_Backend):
+    """
+    In-process stand-in for azure.ai.agents.AgentsClient.
+
+    `verdicts` is a callable(request_dict) -> verdict dict / raw reply string,
+    or an iterable cycled per run. Runs complete after `run_latency`; runs.get
+    blocks until then, so the gate's poll interval does not quantize results.
+    `no_reply_rate` makes completed runs produce no assistant message.
+    """
+
+    def __init__(self, verdicts=None, latency=None, run_latency=None, error_rate: float = 0.0,
+                 no_reply_rate: float = 0.0, seed=None):
+        super().__init__(latency, error_rate, seed)
+        self.run_latency = Latency.parse(run_latency, seed=seed)
+        self.no_reply_rate = float(no_reply_rate or 0.0)
+        if verdicts is None or callable(verdicts):
+            self._verdict_fn = verdicts or default_verdict
+        else:
+            cyc = itertools.cycle(list(verdicts))
+            cyc_lock = threading.Lock()
+
+            def _next(_req):
+                with cyc_lock:
+                    return next(cyc)
+            self._verdict_fn = _next
+
+        self._data_lock = threading.Lock()
+        self._seq = itertools.count(1)
+        self._threads = {}  # thread_id -> [FakeMessage]
+        self._runs = {}     # run_id -> (FakeRun, done_at)
+        self.threads = _Namespace(create=self._thread_create)
+        self.messages = _Namespace(create=self._message_create, list=self._message_list)
+        self.runs = _Namespace(create=self._run_create, get=self._run_get)
+        self.run_steps = _Namespace(list=lambda thread_id=None, run_id=None, **kw: [])
+
+    def _thread_create(self, **kwargs):
+        self._round_trip("threads.create")
+        tid = f"thread_{next(self._seq)}"
+        with self._data_lock:
+            self._threads[tid] = []
+        return _Namespace(id=tid)
+
+    def _message_create(self, thread_id, role, content, **kwargs):
+        self._round_trip("messages.create")
+        msg = FakeMessage(role, content)
+        with self._data_lock:
+            self._threads.setdefault(thread_id, []).append(msg)
+        return msg
+
+    def _run_create(self, thread_id, agent_id, **kwargs):
+        self._round_trip("runs.create")
+        run = FakeRun(f"run_{next(self._seq)}", thread_id, "in_progress")
+        done_at = time.time() + self.run_latency.sample_ms() / 1000.0
+        with self._data_lock:
+            self._runs[run.id] = (run, done_at)
+        return run
+
+    def _run_get(self, thread_id, run_id, **kwargs):
+        self._round_trip("runs.get")
+        with self._data_lock:
+            run, done_at = self._runs[run_id]
+        wait = done_at - time.time()
+        if wait > 0:
+            time.sleep(wait)
+        if run.status == "in_progress":
+            self._complete(run)
+        return run
+
+    def _complete(self, run):
+        with self._data_lock:
+            msgs = list(self._threads.get(run.thread_id, []))
+        user = next((m for m in reversed(msgs) if m.role == "user"), None)
+        try:
+            request = json.loads(user.content) if user else {}
+        except Exception:
+            request = {}
+
+        with self._rng_lock:
+            silent = self.no_reply_rate > 0 and self._rng.random() < self.no_reply_rate
+        run.status = "completed"
+        if silent:
+            return
+        reply = self._verdict_fn(request)
+        text = reply if isinstance(reply, str) else json.dumps(reply)
+        with self._data_lock:
+            self._threads[run.thread_id].append(FakeMessage("assistant", text))
+
+    def _message_list(self, thread_id, limit=50, order=None, **kwargs):
+        self._round_trip("messages.list")
+        with self._data_lock:
+            msgs = list(self._threads.get(thread_id, []))
+        return list(reversed(msgs))[:limit]
+
+
+class FakeProjectClient:
+    """Stand-in for AIProjectClient: only `.agents` is used by the notes path."""
+
+    def __init__(self, agents: FakeAgentsClient):
+        self.agents = agents
+
+
+class _Namespace:
+    def __init__(self, **kw):
+        self.__dict__.update(kw)
+
+
+# ---------- Install / uninstall ----------
+
+_FAKE_KEYS = (
+    "kusto", "agents_client", "project_client", "ledger_client", "receipt_verifier", "ledger_tls_pem",
+    "kusto_request_properties",
+)
+
+FAKE_ENV = {
+    "FABRIC_KUSTO_CLUSTER": "https://fake.kusto.local",
+    "VERIFICATION_AGENT_ID": "fake-verification-agent",
+    "FORENSIC_AGENT_ID": "fake-forensic-agent",
+    "CONFIDENTIAL_LEDGER_URL": "https://fake-ledger.local",
+    "CONFIDENTIAL_LEDGER_ID": "fake-ledger",
+}
+
+
+class FakeEnvironment:
+    def __init__(self, kusto, ledger, agents):
+        self.kusto = kusto
+        self.ledger = ledger
+        self.agents = agents
+
+
+def install_fakes(kusto=None, ledger=None, agents=None, env=None) -> FakeEnvironment:
+    """
+    Put the stand-ins into the client cache so every get_*_client() returns them.
+    Missing env vars required by the pipeline are filled with fake values.
+    """
+    kusto = kusto or FakeKustoClient()
+    ledger = ledger or FakeLedgerClient()
+    agents = agents or FakeAgentsClient()
+
+    for k, v in {**FAKE_ENV, **(env or {})}.items():
+        os.environ.setdefault(k, v)
+
+    # pinned: never recycled, and kept across fork
+    _REGISTRY.put("kusto", kusto)
+    _REGISTRY.put("agents_client", agents)
+    _REGISTRY.put("project_client", FakeProjectClient(agents))
+    _REGISTRY.put("ledger_client", ledger)
+    _REGISTRY.put("receipt_verifier", fake_verify_receipt)
+    _REGISTRY.put("ledger_tls_pem", FAKE_LEDGER_CERT_PEM)
+    _REGISTRY.put("kusto_request_properties", FakeClientRequestProperties)
+    _REGISTRY.put("audit_has_verification_reasoning", True)
+    audit_cache._STATE.clear()  # cached timelines belong to the previous Kusto
+    _KUSTO_PROFILES.clear()  # profiles are read from the environment once
+    return FakeEnvironment(kusto, ledger, agents)
+
+
+def uninstall_fakes():
+    for k in _FAKE_KEYS + ("audit_has_verification_reasoning",):
+        _REGISTRY.pop(k)
+    audit_cache._STATE.clear()
+    _KUSTO_PROFILES.clear()
+
+
+# ---------- Synthetic telemetry ----------
+
+HAZARD_TYPES = ("pothole", "debris", "flooding", "speed_bump", "red_light_violation")
+
+
+def synthetic_report(i: int, rng: random.Random, center=(25.2048, 55.2708), spread=0.05,
+                     hazard_types=HAZARD_TYPES, devices: int = 200) -> dict:
+    ts = datetime.now(timezone.utc) - timedelta(minutes=rng.randint(0, 600))
+    return {
+        "ReportId": f"R-{i}",
+        "DeviceId": f"D-{rng.randrange(devices)}",
+        "Timestamp": ts.isoformat(),
+        "Latitude": round(center[0] + rng.uniform(-spread, spread), 6),
+        "Longitude": round(center[1] + rng.uniform(-spread, spread), 6),
+        "HazardType": rng.choice(hazard_types),
+        "ConfidenceScore": round(rng.uniform(0.5, 1.0), 3),
+        "GaussianSplatURL": f"https://evidence.local/{i}" if rng.random() > 0.05 else "",
+        "GForceZ": round(rng.uniform(0.8, 3.0), 3),
+    }
+
+
+def synthetic_telemetry(n: int, seed=None, **kw) -> list:
+    rng = random.Random(seed)
+    return [synthetic_report(i, rng, **kw) for i in range(n)]
\ No newline at end of file
@@ -0,0 +1,276 @@
+"""
+Replay exported RoadTelemetry rows against /autonomous-auditor.
+
+    # in-process app on the offline stand-ins, 60x faster than real time, max 32 in flight
+    python -m vigia.testing.replay telemetry.ndjson --target inproc --time-compression 60 --concurrency 32
+
+    # a running Function host at a fixed 50 req/s, re-sending 20% of finished events 3 times
+    python -m vigia.testing.replay telemetry.csv --target http://localhost:7071 --rps 50 \\
+        --retry-storm-ratio 0.2 --retry-storm-copies 3
+"""
+import os
+import sys
+import csv
+import json
+import time
+import random
+import argparse
+import threading
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from ..core.timeutil import _to_iso_datetime
+from .bench import latency_summary, make_request, route_function
+
+
+_NUMERIC = ("Latitude", "Longitude", "ConfidenceScore", "GForceZ", "GForceX", "GForceY", "Speed")
+
+
+# ---------- Input ----------
+
+def _coerce(row: dict) -> dict:
+    out = {}
+    for k, v in row.items():
+        if v is None or v == "":
+            continue
+        if k in _NUMERIC:
+            try:
+                v = float(v)
+            except Exception:
+                pass
+        out[k] = v
+    return out
+
+
+def read_rows(path: str, fmt: str = None) -> list:
+    fmt = (fmt or os.path.splitext(path)[1].lstrip(".")).lower()
+    if fmt in ("ndjson", "jsonl", "json"):
+        with open(path, encoding="utf-8") as f:
+            return [_coerce(json.loads(line)) for line in f if line.strip()]
+    if fmt == "csv":
+        with open(path, newline="", encoding="utf-8") as f:
+            return [_coerce(r) for r in csv.DictReader(f)]
+    if fmt == "parquet":
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise RuntimeError("Parquet input needs pyarrow (pip install pyarrow)")
+        return [_coerce(r) for r in pq.read_table(path).to_pylist()]
+    raise ValueError(f"Unsupported input format: {fmt}")
+
+
+def _event_time(row: dict) -> float:
+    from datetime import datetime
+    return datetime.fromisoformat(_to_iso_datetime(row.get("Timestamp"))).timestamp()
+
+
+# ---------- Targets ----------
+
+class InProcessTarget:
+    """Calls the auditor function directly. Uses the offline stand-ins unless live=True."""
+
+    def __init__(self, live: bool = False, **fake_kw):
+        if not live:
+            from .fakes import FakeAgentsClient, FakeKustoClient, FakeLedgerClient, install_fakes
+            install_fakes(
+                kusto=FakeKustoClient(fake_kw.get("telemetry"), fake_kw.get("kusto_latency")),
+                ledger=FakeLedgerClient(fake_kw.get("ledger_latency")),
+                agents=FakeAgentsClient(run_latency=fake_kw.get("agent_run_latency")),
+            )
+        from ..routes.auditor import autonomous_auditor
+        self._fn = route_function(autonomous_auditor)
+
+    def send(self, payload: dict):
+        resp = self._fn(make_request("POST", "autonomous-auditor", body=payload))
+        return resp.status_code, resp.get_body()
+
+
+class HttpTarget:
+    def __init__(self, base_url: str, timeout_s: float = 60.0):
+        self.url = base_url.rstrip("/") + "/api/autonomous-auditor"
+        self.timeout_s = timeout_s
+
+    def send(self, payload: dict):
+        req = urllib.request.Request(
+            self.url,
+            data=json.dumps(payload).encode("utf-8"),
+            headers={"Content-Type": "application/json"},
+            method="POST",
+        )
+        try:
+            with urllib.request.urlopen(req, timeout=self.timeout_s) as r:
+                return r.status, r.read()
+        except urllib.error.HTTPError as e:
+            return e.code, e.read()
+
+
+# ---------- Replay ----------
+
+class _Results:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.by_status = {}
+        self.codes = {}
+        self.event_ids = set()
+        self.duplicates = 0
+        self.idempotent = 0
+        self.storm_sent = 0
+        self.schedule_lag_ms = []
+        self.total = 0
+
+    def record(self, code, body, ms, lag_ms):
+        try:
+            out = json.loads(body or b"{}")
+        except Exception:
+            out = {}
+        status = out.get("status") or ("error" if code >= 400 else "unknown")
+        dedupe = out.get("dedupe") or {}
+        with self.lock:
+            self.total += 1
+            self.by_status.setdefault(status, []).append(ms)
+            self.codes[str(code)] = self.codes.get(str(code), 0) + 1
+            self.schedule_lag_ms.append(lag_ms)
+            if out.get("event_id"):
+                self.event_ids.add(out["event_id"])
+            if status == "Idempotent_Return":
+                self.idempotent += 1
+            if int(dedupe.get("duplicate_count") or 0) > 0:
+                self.duplicates += 1
+        return out
+
+
+def replay(rows, target, time_compression: float = None, rps: float = None, concurrency: int = 16,
+           retry_storm_ratio: float = 0.0, retry_storm_copies: int = 3, seed: int = 7) -> dict:
+    rows = sorted(rows, key=_event_time)
+    rng = random.Random(seed)
+    res = _Results()
+    slots = threading.BoundedSemaphore(max(1, concurrency))
+    pool = ThreadPoolExecutor(max_workers=max(1, concurrency))
+    outstanding = [0]
+    outstanding_lock = threading.Lock()
+
+    def _submit(payload, due, storm=False):
+        # caller has already counted this send in `outstanding`
+        slots.acquire()
+        lag = max(0.0, (time.perf_counter() - due) * 1000.0)
+        pool.submit(_run, payload, lag, storm)
+
+    def _run(payload, lag, storm):
+        out = {}
+        try:
+            t0 = time.perf_counter()
+            try:
+                code, body = target.send(payload)
+            except Exception as e:
+                code, body = 599, json.dumps({"error": str(e)}).encode("utf-8")
+            out = res.record(code, body, (time.perf_counter() - t0) * 1000.0, lag)
+        finally:
+            slots.release()
+
+        try:
+            # retry storm: re-deliver finished events, as Activator retries would
+            if not storm and retry_storm_ratio > 0 and out.get("status") in ("Verified", "Rejected"):
+                if rng.random() < retry_storm_ratio:
+                    copies = max(1, retry_storm_copies)
+                    with outstanding_lock:
+                        outstanding[0] += copies
+                    with res.lock:
+                        res.storm_sent += copies
+                    for _ in range(copies):
+                        threading.Thread(target=_submit, args=(payload, time.perf_counter(), True), daemon=True).start()
+        finally:
+            with outstanding_lock:
+                outstanding[0] -= 1
+
+    t_start = time.perf_counter()
+    first_ts = _event_time(rows[0]) if rows else 0.0
+    for i, row in enumerate(rows):
+        if rps:
+            due = t_start + i / float(rps)
+        elif time_compression:
+            due = t_start + (_event_time(row) - first_ts) / float(time_compression)
+        else:
+            due = time.perf_counter()
+        wait = due - time.perf_counter()
+        if wait > 0:
+            time.sleep(wait)
+        with outstanding_lock:
+            outstanding[0] += 1
+        _submit(dict(row), due)
+
+    # drain, including storm copies scheduled while draining
+    while True:
+        with outstanding_lock:
+            if outstanding[0] <= 0:
+                break
+        time.sleep(0.02)
+    pool.shutdown(wait=True)
+    elapsed = time.perf_counter() - t_start
+
+    total = max(1, res.total)
+    return {
+        "rows": len(rows),
+        "sent": res.total,
+        "retry_storm_sent": res.storm_sent,
+        "elapsed_s": round(elapsed, 3),
+        "achieved_rps": round(res.total / elapsed, 2) if elapsed > 0 else 0.0,
+        "status_codes": res.codes,
+        "latency_ms_by_status": {k: latency_summary(v) for k, v in sorted(res.by_status.items())},
+        "unique_event_ids": len(res.event_ids),
+        "repeated_event_ratio": round(1.0 - len(res.event_ids) / total, 4) if res.total else 0.0,
+        "duplicate_ratio": round(res.duplicates / total, 4),
+        "idempotent_return_ratio": round(res.idempotent / total, 4),
+        "schedule_lag_ms": latency_summary(res.schedule_lag_ms),
+    }
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description="Replay RoadTelemetry exports against /autonomous-auditor")
+    ap.add_argument("input", help="CSV, NDJSON or Parquet export of RoadTelemetry rows")
+    ap.add_argument("--format", default=None, choices=["csv", "ndjson", "jsonl", "json", "parquet"])
+    ap.add_argument("--target", default="inproc", help="'inproc' or a base URL such as http://localhost:7071")
+    ap.add_argument("--inproc-live", action="store_true", help="in-process app against real Azure services")
+    ap.add_argument("--time-compression", type=float, default=None, help="replay N times faster than recorded")
+    ap.add_argument("--rps", type=float, default=None, help="fixed send rate; overrides recorded timing")
+    ap.add_argument("--concurrency", type=int, default=16, help="max requests in flight")
+    ap.add_argument("--retry-storm-ratio", type=float, default=0.0, help="share of finished events to re-send")
+    ap.add_argument("--retry-storm-copies", type=int, default=3)
+    ap.add_argument("--limit", type=int, default=None)
+    ap.add_argument("--seed", type=int, default=7)
+    ap.add_argument("--kusto-latency", default="fixed:0", help="in-process stand-in latency")
+    ap.add_argument("--ledger-latency", default="fixed:0")
+    ap.add_argument("--agent-run-latency", default="fixed:0")
+    args = ap.parse_args(argv)
+
+    rows = read_rows(args.input, args.format)
+    if args.limit:
+        rows = rows[: args.limit]
+
+    if args.target == "inproc":
+        target = InProcessTarget(
+            live=args.inproc_live,
+            telemetry=rows,
+            kusto_latency=args.kusto_latency,
+            ledger_latency=args.ledger_latency,
+            agent_run_latency=args.agent_run_latency,
+        )
+    else:
+        target = HttpTarget(args.target)
+
+    out = replay(
+        rows,
+        target,
+        time_compression=args.time_compression,
+        rps=args.rps,
+        concurrency=args.concurrency,
+        retry_storm_ratio=args.retry_storm_ratio,
+        retry_storm_copies=args.retry_storm_copies,
+        seed=args.seed,
+    )
+    print(json.dumps(out, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
\ No newline at end of file